@@ -4,6 +4,8 @@
 import hmac
 import hashlib
 
+from napixd.utils.cache import LRUCache
+
 __all__ = [
     'AutonomousAuthProvider',
 ]
@@ -15,6 +17,18 @@ def decode(value):
     return value
 
 
+def _compare_digest(a, b):
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+compare_digest = getattr(hmac, 'compare_digest', _compare_digest)
+
+
 class AutonomousAuthProvider(object):
     """
     This class implements the central protocol in local.
@@ -29,6 +43,9 @@ class AutonomousAuthProvider(object):
 
     Users authenticated by the :class:`AutonomousAuthProvider` are granted all
     the requests.
+
+    The valid signatures are kept *signature_ttl* seconds in the *cache*,
+    so that the retries of a signed request are not hashed again.
     """
     @classmethod
     def from_settings(cls, settings):
@@ -36,21 +53,54 @@ class AutonomousAuthProvider(object):
         password = settings.get('password', None)
         if not password:
             raise ValueError(u'password cannot be empty. Set Napix.auth.password')
-        return cls(login, password)
 
-    def __init__(self, login, password):
+        size = settings.get('signature_cache', 1000, type=int)
+        ttl = settings.get('signature_ttl', 60, type=(int, float))
+        cache = LRUCache(size, name='signatures') if size > 0 and ttl > 0 else None
+        return cls(login, password, cache, ttl)
+
+    def __init__(self, login, password, cache=None, signature_ttl=60):
         self.login = login
         self.password = decode(password)
+        self._hmac = hmac.new(self.password, digestmod=hashlib.sha256)
+        self.cache = cache
+        self.signature_ttl = signature_ttl
+
+    @property
+    def logins(self):
+        """
+        The logins for which this provider answers.
+        """
+        return frozenset([self.login])
 
     def __call__(self, request, content):
         if content.get('login') != self.login:
             # Not our login, carry on
             return None
-        if content.get('signature', None) == self.sign(content.get('msg', '')):
-            # Authorize unconditionally
-            return True
-        return False
+
+        msg = decode(content.get('msg', ''))
+        signature = decode(content.get('signature', None) or '')
+        if self.cache is None:
+            valid = self.verify(msg, signature)
+        else:
+            valid = self.cache.get((msg, signature),
+                                   lambda: self.verify(msg, signature),
+                                   self._get_ttl)
+        # Authorize unconditionally when valid
+        return valid
+
+    def _get_ttl(self, valid):
+        return self.signature_ttl if valid else 0
+
+    def verify(self, msg, signature):
+        """
+        Returns ``True`` if *signature* is the signature of *msg*.
+
+        The signatures are compared in constant time.
+        """
+        return compare_digest(self.sign(msg), signature)
 
     def sign(self, msg):
-        msg = decode(msg)
-        return hmac.new(self.password, msg, hashlib.sha256).hexdigest()
+        signer = self._hmac.copy()
+        signer.update(decode(msg))
+        return signer.hexdigest()
@@ -4,29 +4,50 @@
 import logging
 import httplib
 import socket
+import select
 import json
 import urlparse
+import Queue
+import threading
+import collections
 
 from permissions.models import Perm
 from permissions.managers import PermSet
 
 from napixd.http.response import HTTPError
+from napixd.utils.cache import LRUCache, SingleFlight
 
 
 logger = logging.getLogger('Napix.auth.central')
 
 TIMEOUT = 5
+# The number of decisions by path kept by a Filter
+MAX_DECISIONS = 1000
 
 
 class FilterFactory(object):
     """
     A creator of :class:`Filter` that only have :class:`permissions.models.Perm`
     matching the *service*.
+
+    When a *cache* is given, the filters are kept by rules, so that the
+    permissions of a user are built once for all the collections it lists.
     """
-    def __init__(self, service):
+    def __init__(self, service, cache=None):
         self.service = service
+        self.cache = cache
 
     def __call__(self, rules):
+        if self.cache is None:
+            return self.create(rules)
+
+        try:
+            key = tuple((p['host'], tuple(p['methods']), p['path']) for p in rules)
+        except (TypeError, KeyError):
+            return self.create(rules)
+        return self.cache.get(key, lambda: self.create(rules))
+
+    def create(self, rules):
         return Filter(PermSet(Perm(p['host'], p['methods'], p['path'])
                               for p in rules).on_host(self.service))
 
@@ -42,21 +63,58 @@ class Filter(object):
     :class:`permissions.managers.PermSet`.
 
     The values of the :class:`dict` are kept.
+
+    The decisions of :meth:`permissions.managers.PermSet.filter_paths` are
+    kept for the *size* paths used the most recently, so that only the paths
+    not seen recently by this filter are matched against the permissions.
     """
-    def __init__(self, rules):
+    def __init__(self, rules, size=MAX_DECISIONS):
         self.rules = rules
+        self.size = size
+        self._decisions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def decide(self, paths):
+        """
+        Returns a mapping of each of the *paths* to ``True``
+        if it is allowed by the permissions.
+        """
+        decided = {}
+        unknown = []
+        with self._lock:
+            decisions = self._decisions
+            for path in paths:
+                try:
+                    decided[path] = decisions.pop(path)
+                except KeyError:
+                    unknown.append(path)
+                else:
+                    decisions[path] = decided[path]
+
+        if unknown:
+            allowed = frozenset(self.rules.filter_paths(unknown))
+            fresh = [(path, path in allowed) for path in unknown]
+            decided.update(fresh)
+            with self._lock:
+                decisions.update(fresh)
+                while len(decisions) > self.size:
+                    decisions.popitem(last=False)
+        return decided
 
     def __call__(self, resp):
-        allowed_paths = self.rules.filter_paths(resp)
+        if not isinstance(resp, (list, dict)):
+            raise ValueError()
+
+        decisions = self.decide(resp)
+        allowed = [path for path in resp if decisions[path]]
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug('Filtered %s/%s urls', len(allowed_paths), len(resp))
+            logger.debug('Filtered %s/%s urls', len(allowed), len(resp))
 
+        if len(allowed) == len(resp):
+            return resp
         if isinstance(resp, list):
-            return list(allowed_paths)
-        elif isinstance(resp, dict):
-            return dict((k, resp[k]) for k in resp if k in allowed_paths)
-        else:
-            raise ValueError()
+            return allowed
+        return dict((path, resp[path]) for path in allowed)
 
 
 class ConnectionFactory(object):
@@ -74,11 +132,123 @@ class ConnectionFactory(object):
         return type(self) == type(other) and self.host == other.host
 
 
+class ConnectionPool(object):
+    """
+    A pool of at most *size* keep-alive connections created by the
+    *connection_factory*.
+
+    The connections are checked out in a :class:`Queue.LifoQueue`, which
+    cooperates with gevent when it is monkey-patched, and wait at most
+    *timeout* seconds for a free connection.
+
+    Before being reused, the idle connections are checked: a connection that
+    can be read from has been closed by the server or is out of sync and is
+    reopened. A request failing on a reused connection is sent again once on
+    a new connection.
+    """
+    def __init__(self, connection_factory, size=4, timeout=TIMEOUT):
+        self.connection_factory = connection_factory
+        self.size = size
+        self.timeout = timeout
+        self._connections = Queue.LifoQueue(size)
+        for x in xrange(size):
+            self._connections.put(None)
+
+    @property
+    def host(self):
+        return self.connection_factory.host
+
+    def checkout(self):
+        """
+        Returns an idle connection or a new one.
+        """
+        try:
+            connection = self._connections.get(timeout=self.timeout)
+        except Queue.Empty:
+            raise socket.timeout('No connection available to {0}'.format(self.host))
+
+        if connection is None:
+            return self.connection_factory()
+        if not self.is_healthy(connection):
+            connection.close()
+        return connection
+
+    def checkin(self, connection):
+        """
+        Gives back the *connection* to the pool.
+        """
+        self._connections.put(connection)
+
+    def is_healthy(self, connection):
+        """
+        Returns ``False`` if the socket of the idle *connection* has
+        something to read.
+        """
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return True
+        try:
+            readable, w, x = select.select([sock], [], [], 0)
+        except (select.error, socket.error, ValueError, TypeError):
+            return False
+        return not readable
+
+    def request(self, method, url, body, headers):
+        """
+        Sends the request and returns the response and its content.
+        """
+        connection = self.checkout()
+        try:
+            reused = getattr(connection, 'sock', None) is not None
+            try:
+                resp, content = self._send(connection, method, url, body, headers)
+            except socket.timeout:
+                raise
+            except (socket.error, httplib.BadStatusLine, httplib.CannotSendRequest) as e:
+                if not reused:
+                    raise
+                logger.debug('Reconnecting to the auth server after %r', e)
+                connection.close()
+                resp, content = self._send(connection, method, url, body, headers)
+        except:
+            connection.close()
+            self.checkin(connection)
+            raise
+
+        if resp.will_close:
+            connection.close()
+        self.checkin(connection)
+        return resp, content
+
+    def _send(self, connection, method, url, body, headers):
+        connection.request(method, url, body=body, headers=headers)
+        resp = connection.getresponse()
+        return resp, resp.read()
+
+
 class CentralAuthProvider(object):
     """
     A provider of authentication using a Central Napix server.
+
+    The requests to the central server use a :class:`ConnectionPool` of
+    *pool_size* keep-alive connections.
+
+    When a *cache* is given, the decisions of the central server are
+    kept for *ttl* seconds when the request is allowed and *negative_ttl*
+    seconds when it is denied. The decisions are cached by the content
+    extracted by the :ref:`auth.sources` and by the method and the path
+    of the request. The requests carrying a nonce are never cached,
+    as the central server has to refuse them when they are replayed.
+
+    The concurrent requests with the same key share a single request to
+    the central server. The time the shared request had already spent when
+    a request joined it is stored in the ``napixd.auth.saved`` key of the
+    environ of the request.
     """
 
+    #: The central server answers for all the logins.
+    final = True
+
     headers = {
         'Accept': 'application/json',
         'Content-type': 'application/json',
@@ -96,13 +266,38 @@ class CentralAuthProvider(object):
         host = auth_url_parts.netloc
         url = urlparse.urlunsplit(
             ('', '', auth_url_parts[2], auth_url_parts[3], auth_url_parts[4]))
-        return cls(ConnectionFactory(host), url, FilterFactory(service), service)
 
-    def __init__(self, connection_factory, url, filter_factory, service_name):
+        pool_size = settings.get('pool_size', 4, type=int)
+        cache_settings = settings.get('cache')
+        size = cache_settings.get('size', 0, type=int)
+        if size > 0:
+            logger.info('Caching %s authorization decisions', size)
+            return cls(ConnectionFactory(host), url,
+                       FilterFactory(service, LRUCache(
+                           cache_settings.get('filters', 100, type=int),
+                           name='auth-filters')),
+                       service,
+                       cache=LRUCache(size,
+                                      cache_settings.get('stale', 0, type=(int, float)),
+                                      name='auth'),
+                       ttl=cache_settings.get('ttl', 10, type=(int, float)),
+                       negative_ttl=cache_settings.get('negative_ttl', 2, type=(int, float)),
+                       pool_size=pool_size)
+
+        return cls(ConnectionFactory(host), url, FilterFactory(service), service,
+                   pool_size=pool_size)
+
+    def __init__(self, connection_factory, url, filter_factory, service_name,
+                 cache=None, ttl=10, negative_ttl=2, pool_size=4):
         self.url = url
         self.http_client_factory = connection_factory
+        self.pool = ConnectionPool(connection_factory, pool_size)
+        self.flights = SingleFlight()
         self.filter_factory = filter_factory
         self.service_name = service_name
+        self.cache = cache
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
 
     @property
     def host(self):
@@ -113,6 +308,58 @@ class CentralAuthProvider(object):
 
     def __call__(self, request, content):
         content['host'] = self.service_name
+
+        key = self.get_cache_key(request, content)
+        if key is None:
+            decision = self.decide(request, content)
+        elif self.cache is None:
+            decision = self.coalesce(key, request, content)
+        else:
+            decision = self.cache.get(key, lambda: self.coalesce(key, request, content),
+                                      self.get_ttl)
+
+        if isinstance(decision, HTTPError):
+            # The cached error is copied as the responses alter their headers
+            raise HTTPError(decision.status, decision.body)
+        return decision
+
+    def get_cache_key(self, request, content):
+        """
+        Returns the key of the decision for *request* and *content* in the
+        cache or ``None`` if it must not be cached.
+        """
+        if 'nonce' in content:
+            return None
+        try:
+            key = (request.method, request.path, tuple(sorted(content.items())))
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def coalesce(self, key, request, content):
+        """
+        Calls :meth:`decide` or waits for the concurrent call for the same *key*.
+        """
+        decision, saved = self.flights.do(key, lambda: self.decide(request, content))
+        if saved is not None:
+            request.environ['napixd.auth.saved'] = saved
+        return decision
+
+    def get_ttl(self, decision):
+        """
+        Returns the time to live of the *decision* in the cache.
+        """
+        if decision is False or isinstance(decision, HTTPError):
+            return self.negative_ttl
+        return self.ttl
+
+    def decide(self, request, content):
+        """
+        Asks the central server and returns the decision: ``True``,
+        ``False``, a :class:`Filter` or the :class:`napixd.http.response.HTTPError`
+        of a non-authoritative response.
+        """
         resp, content = self._do_request(content)
 
         have_filter = request.path.endswith('/') and request.method in ('GET', 'HEAD')
@@ -128,7 +375,7 @@ class CentralAuthProvider(object):
 
             if not any('*' in path for path in paths):
                 # Return a non-authoritative response
-                raise HTTPError(203, paths)
+                return HTTPError(203, paths)
             else:
                 # Return a response that filters the content of the response
                 return self.filter_factory(content)
@@ -140,12 +387,9 @@ class CentralAuthProvider(object):
 
     def _do_request(self, body):
         body = json.dumps(body)
-        http_client = self.http_client_factory()
         try:
             logger.debug('Sending request to the auth server')
-            http_client.request('POST', self.url, body=body, headers=self.headers)
-            resp = http_client.getresponse()
-            content = resp.read()
+            resp, content = self.pool.request('POST', self.url, body, self.headers)
         except socket.gaierror as e:
             logger.error('Auth server %s%s not found %s',
                          self.http_client_factory.host, self.url, e)
@@ -156,8 +400,10 @@ class CentralAuthProvider(object):
         except socket.error as e:
             logger.error('Auth server did not respond, %r', e)
             raise HTTPError(500, 'Auth server did not respond')
+        except httplib.HTTPException as e:
+            logger.error('Auth server sent an invalid response, %r', e)
+            raise HTTPError(500, 'Auth server did not respond')
         finally:
-            http_client.close()
             logger.debug('Finished the request to the auth server')
 
         if resp.status != 200 and resp.status != 403:
@@ -1,21 +1,50 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import time
 import base64
 import json
 
 from napixd.http.response import HTTPError
+from napixd.utils.cache import LRUCache
+
+EXPECTED_HEADERS = frozenset([
+    'alg',
+    'typ',
+])
+
+
+def b64decode(segment):
+    """
+    Decodes a base64url *segment* with or without its padding.
+
+    Returns ``None`` if it is not valid.
+    """
+    try:
+        if isinstance(segment, unicode):
+            segment = segment.encode('ascii')
+        return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+    except (ValueError, TypeError):
+        return None
 
 
 class JSONWebToken(object):
     """
     Implentation of the JSON Web Token RFC
+
+    When a *cache* is given, the claims of the tokens are kept
+    until their expiration.
     """
-    def __init__(self):
-        self._expected_headers = frozenset([
-            'alg',
-            'typ',
-        ])
+    authorization = 'jwt'
+
+    @classmethod
+    def from_settings(cls, settings):
+        size = settings.get('jwt_cache', 1000, type=int)
+        return cls(LRUCache(size, name='jwt') if size > 0 else None)
+
+    def __init__(self, cache=None):
+        self._expected_headers = EXPECTED_HEADERS
+        self.cache = cache
 
     def decode_jwt(self, http_header):
         """
@@ -53,18 +82,33 @@ class JSONWebToken(object):
 
         # JWS are validated by the authentication servers
 
-        signed_payload, signature = http_header.rsplit('.', 1)
-        encoded_jwt_header, encoded_jws_payload = signed_payload.split('.')
+        if self.cache is None:
+            return self._decode(http_header)
+
+        claims = self.cache.get(http_header, lambda: self._decode(http_header),
+                                self._get_ttl)
+        return dict(claims) if claims is not None else None
+
+    def _get_ttl(self, claims):
+        if claims is None:
+            return 0
+        try:
+            return float(claims['timestamp']) - time.time()
+        except (TypeError, ValueError):
+            return 0
+
+    def _decode(self, http_header):
+        signed_payload, l, signature = http_header.rpartition('.')
+        encoded_jwt_header, l, encoded_jws_payload = signed_payload.partition('.')
 
         # 3.   The Encoded JWT Header MUST be successfully base64url decoded
         #       following the restriction given in this specification that no
         #       padding characters have been used.
 
         # 9.   Otherwise, let the JWT Claims Set be the Message.
-        try:
-            raw_jwt_header = base64.urlsafe_b64decode(encoded_jwt_header)
-            raw_body = base64.urlsafe_b64decode(encoded_jws_payload)
-        except (ValueError, TypeError):
+        raw_jwt_header = b64decode(encoded_jwt_header)
+        raw_body = b64decode(encoded_jws_payload)
+        if raw_jwt_header is None or raw_body is None:
             return None
 
         # 4.   The resulting JWT Header MUST be completely valid JSON syntax
@@ -78,9 +122,12 @@ class JSONWebToken(object):
         #       parameters and values whose syntax and semantics are both
         #       understood and supported or that are specified as being ignored
         #       when not understood.
-        if not set(jwt_headers.keys()).issubset(self._expected_headers):
-            raise HTTPError(400, 'Unsupported JWT headers: {0}'.format(
-                ','.join(set(jwt_headers.keys()).difference(self._expected_headers))))
+        if not isinstance(jwt_headers, dict):
+            return None
+        for key in jwt_headers:
+            if key not in self._expected_headers:
+                raise HTTPError(400, 'Unsupported JWT headers: {0}'.format(
+                    ','.join(k for k in jwt_headers if k not in self._expected_headers)))
 
         # 8.   If the JWT Header contains a "cty" (content type) value of
         #       "JWT", then the Message is a JWT that was the subject of nested
@@ -134,4 +181,8 @@ class JSONWebToken(object):
         if authorization.count('.') != 2:
             return None
 
-        return self.decode_jwt(authorization)
+        claims = self.decode_jwt(authorization)
+        if claims is not None:
+            # The timestamp is the expiration time of the token
+            request.environ['napixd.auth.expires'] = True
+        return claims
@@ -4,17 +4,72 @@
 import logging
 
 from napixd.http.response import HTTPError, HTTPResponse
-from napixd.chrono import Chrono
+from napixd.chrono import Chrono, get_timings
+from napixd.utils import metrics
 
 
 logger = logging.getLogger('Napix.auth')
 
 
+def _hint(obj, name):
+    """
+    Returns the attribute *name* of *obj* if it is declared by its class,
+    else ``None``.
+    """
+    for klass in type(obj).__mro__:
+        if name in vars(klass):
+            return getattr(obj, name)
+    return None
+
+
+def authorization_kinds(request):
+    """
+    Returns the :class:`frozenset` of the kinds of *Authorization* header
+    of *request*: ``signed`` for the secure-auth protocol and ``jwt``
+    for the JSON Web Tokens.
+    """
+    authorization = request.headers.get('Authorization')
+    if authorization is None:
+        return NO_KINDS
+    kinds = []
+    if ':' in authorization:
+        kinds.append('signed')
+    if authorization.count('.') == 2:
+        kinds.append('jwt')
+    return frozenset(kinds)
+
+
+NO_KINDS = frozenset()
+ALL_KINDS = [NO_KINDS,
+             frozenset(['signed']),
+             frozenset(['jwt']),
+             frozenset(['signed', 'jwt'])]
+
+
 class AAAPlugin(object):
     """
     Authentication, Authorization and Accounting plugins
 
     It takes a list of :ref:`auth.sources` and a list of :ref:`auth.providers`.
+
+    The duration of the authentications and the rejected requests are recorded
+    in :data:`napixd.utils.metrics.registry`.
+
+    The sources and the providers are dispatched by tables built once, with the
+    hints declared by their classes:
+
+    * the sources with an ``authorization`` attribute are only called for the
+      requests with this kind of *Authorization* header,
+      see :func:`authorization_kinds`.
+    * the providers with a ``logins`` attribute are only called for those logins.
+    * the providers with a ``final`` attribute always answer,
+      so no provider may follow them.
+
+    The providers with an ``authenticated`` method are called with the request
+    and the extracted content once the request is authenticated, and may
+    still reject it.
+
+    The order of the sources and the providers is kept.
     """
 
     def __init__(self, sources, providers, timed=True):
@@ -22,6 +77,29 @@ class AAAPlugin(object):
         self._sources = sources
         self._providers = providers
 
+        self._dispatch_sources = any(_hint(source, 'authorization') is not None
+                                     for source in sources)
+        self._sources_by_kinds = dict(
+            (kinds, [source for source in sources
+                     if _hint(source, 'authorization') in kinds or
+                     _hint(source, 'authorization') is None])
+            for kinds in ALL_KINDS)
+
+        for index, provider in enumerate(providers[:-1]):
+            if _hint(provider, 'final') and _hint(provider, 'logins') is None:
+                raise ValueError('{0} always answers, {1} would never be called'.format(
+                    provider.__class__.__name__, providers[index + 1].__class__.__name__))
+
+        logins = set()
+        for provider in providers:
+            logins.update(_hint(provider, 'logins') or ())
+        self._default_providers = [provider for provider in providers
+                                   if _hint(provider, 'logins') is None]
+        self._providers_by_login = dict(
+            (login, [provider for provider in providers
+                     if login in (_hint(provider, 'logins') or (login, ))])
+            for login in logins)
+
     def __call__(self, callback, request):
         try:
             return self.authorize(callback, request)
@@ -29,6 +107,9 @@ class AAAPlugin(object):
             logger.info('Rejecting request of %s: %s %s',
                         request.environ.get('REMOTE_ADDR', 'unknow'),
                         e.status, e.body)
+            metrics.registry.counter(
+                'napixd_auth_rejected_total', 'Requests rejected by the authentication',
+                status=e.status).inc()
             raise
 
     def extract(self, request):
@@ -38,7 +119,11 @@ class AAAPlugin(object):
         It returns the first non-``None`` result of a :ref:`source<auth.sources>`.
         When all sources returns ``None``, it raises a 401.
         """
-        for source in self._sources:
+        sources = self._sources
+        if self._dispatch_sources:
+            sources = self._sources_by_kinds[authorization_kinds(request)]
+
+        for source in sources:
             extract = source(request)
             if extract is not None:
                 logger.debug('Extracting from %s', source.__class__.__name__)
@@ -46,6 +131,16 @@ class AAAPlugin(object):
         else:
             raise HTTPError(401, 'You need to sign your request')
 
+    def get_providers(self, content):
+        """
+        Returns the providers asked for the *content*.
+        """
+        try:
+            return self._providers_by_login.get(content.get('login'),
+                                                self._default_providers)
+        except TypeError:
+            return self._default_providers
+
     def authenticate(self, request, content):
         """
         Authenticates the *request* with the **providers**.
@@ -53,7 +148,7 @@ class AAAPlugin(object):
         It returns the first non-``None`` result of a provider.
         When all providers returns None, it raises a 403.
         """
-        for provider in self._providers:
+        for provider in self.get_providers(content):
             result = provider(request, content)
             if result is not None:
                 logger.debug('Authorisation provided by %s', provider.__class__.__name__)
@@ -69,24 +164,40 @@ class AAAPlugin(object):
         with the result of the callback.
 
         When the *timed* option is enabled, the time spend in :meth:`authenticate`
-        will be calculated and returned in the **x-auth-time** header.
+        will be calculated and returned in the **x-auth-time** header. When the
+        check was shared with a concurrent request, the time saved is returned
+        in the **x-auth-saved-time** header.
         """
-        content = self.extract(request)
+        timings = get_timings(request.environ)
+        with timings('auth-extract'):
+            content = self.extract(request)
         if 'login' in content:
             request.environ['napixd.auth.username'] = content['login']
 
-        with Chrono() as chrono:
-            check = self.authenticate(request, content)
+        with timings('auth'):
+            with Chrono() as chrono:
+                check = self.authenticate(request, content)
 
         logger.debug('Authenticate took %s', chrono.total)
+        metrics.registry.histogram(
+            'napixd_auth_duration_seconds', 'Time spent authenticating the requests',
+        ).observe(chrono.total)
 
         if not check:
             raise HTTPError(403, 'Access Denied')
 
+        for provider in self.get_providers(content):
+            authenticated = _hint(provider, 'authenticated')
+            if authenticated is not None:
+                authenticated(request, content)
+
         resp = callback(request)
         if callable(check):
             resp = check(resp)
 
         if self._timed:
-            return HTTPResponse({'x-auth-time': chrono.total}, resp)
+            headers = {'x-auth-time': chrono.total}
+            if 'napixd.auth.saved' in request.environ:
+                headers['x-auth-saved-time'] = request.environ['napixd.auth.saved']
+            return HTTPResponse(headers, resp)
         return resp
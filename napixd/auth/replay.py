@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Replay protection.
+
+The :class:`ReplayChecker` provider rejects the requests whose *timestamp* is
+out of the accepted window before the other providers are asked, and the
+requests whose *nonce* was already seen once they are authenticated.
+
+The nonces are remembered by a store until the request can no longer be
+accepted: the :class:`LocalNonceStore` keeps them in the process and the
+:class:`RedisNonceStore` shares them between the napix instances. Only the
+nonces of the authenticated requests are stored, so that the forged requests
+do not fill the store.
+"""
+
+import time
+import heapq
+import logging
+import threading
+
+from napixd.conf.lazy import LazyConf
+from napixd.http.response import HTTPError
+from napixd.utils.connection import ConnectionFactory
+
+__all__ = (
+    'ReplayChecker',
+    'LocalNonceStore',
+    'RedisNonceStore',
+)
+
+logger = logging.getLogger('Napix.auth.replay')
+
+connection_factory = ConnectionFactory(LazyConf('redis'))
+
+
+class LocalNonceStore(object):
+    """
+    Remembers at most *size* nonces in the process.
+
+    The nonces are kept by expiration time in a heap, so that the expired
+    nonces are dropped without scanning the whole store. When the store is
+    full, the nonces expiring first are dropped.
+    """
+    def __init__(self, size=100000):
+        self.size = size
+        self._heap = []
+        self._nonces = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._nonces)
+
+    def add(self, nonce, expire):
+        """
+        Remembers *nonce* until *expire*.
+
+        Returns ``False`` if the nonce is already known.
+        """
+        now = time.time()
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] < now:
+                old_expire, old = heapq.heappop(heap)
+                if self._nonces.get(old) == old_expire:
+                    del self._nonces[old]
+
+            known = self._nonces.get(nonce)
+            if known is not None and known >= now:
+                return False
+
+            if len(self._nonces) >= self.size:
+                logger.warning('The nonce store is full, forgetting the oldest nonces')
+            while len(self._nonces) >= self.size:
+                old_expire, old = heapq.heappop(heap)
+                if self._nonces.get(old) == old_expire:
+                    del self._nonces[old]
+
+            self._nonces[nonce] = expire
+            heapq.heappush(heap, (expire, nonce))
+        return True
+
+
+class RedisNonceStore(object):
+    """
+    Remembers the nonces in the Redis server *con*.
+    """
+    def __init__(self, con, prefix='napixd:nonce:'):
+        self._con = con
+        self._prefix = prefix
+
+    def add(self, nonce, expire):
+        ttl = max(int(expire - time.time()) + 1, 1)
+        return bool(self._con.set(self._prefix + nonce, 1, ex=ttl, nx=True))
+
+
+class ReplayChecker(object):
+    """
+    Rejects the requests replayed or out of the time window.
+
+    The *timestamp* of the authentication data is either the time the request
+    was signed, which must be within *window* seconds of the current time, or
+    the expiration time of a token, when the source set the
+    ``napixd.auth.expires`` key of the environ, like
+    :class:`napixd.auth.jwt.JSONWebToken`. The expired tokens and the tokens
+    expiring more than *max_lifetime* seconds after the current time are
+    rejected.
+
+    The *nonce* of a login is accepted once by the *store* when the request is
+    :meth:`authenticated` by the other providers, and remembered as long as
+    its timestamp is accepted.
+
+    The requests without a nonce or a timestamp are left to the other
+    providers.
+    """
+    @classmethod
+    def from_settings(cls, settings):
+        window = settings.get('window', 300, type=(int, float))
+        max_lifetime = settings.get('max_lifetime', 86400, type=(int, float))
+        backend = settings.get('backend', u'local', type=unicode)
+        if backend == 'local':
+            store = LocalNonceStore(settings.get('size', 100000, type=int))
+        elif backend == 'redis':
+            store = RedisNonceStore(connection_factory(settings.get('connection')))
+        else:
+            raise ValueError('Replay backend must be "local" or "redis"')
+
+        logger.info('Rejecting the replays in a window of %ss', window)
+        return cls(store, window, max_lifetime)
+
+    def __init__(self, store, window=300, max_lifetime=86400):
+        self.store = store
+        self.window = window
+        self.max_lifetime = max_lifetime
+
+    def __call__(self, request, content):
+        nonce = content.get('nonce')
+        timestamp = content.get('timestamp')
+        if nonce is None or timestamp is None:
+            return None
+
+        try:
+            timestamp = float(timestamp)
+        except (TypeError, ValueError):
+            raise HTTPError(403, 'Bad authentication data timestamp')
+
+        now = time.time()
+        if request.environ.get('napixd.auth.expires'):
+            if timestamp < now:
+                raise HTTPError(403, 'Expired authentication data')
+            if timestamp > now + self.max_lifetime:
+                raise HTTPError(403, 'Authentication data valid for too long')
+            expire = timestamp
+        else:
+            if abs(now - timestamp) > self.window:
+                raise HTTPError(403, 'Expired authentication data')
+            expire = timestamp + self.window
+
+        key = u'{0}:{1}'.format(content.get('login', u''), nonce).encode('utf-8')
+        request.environ['napixd.auth.nonce'] = (key, expire)
+        return None
+
+    def authenticated(self, request, content):
+        """
+        Remembers the nonce of the *request* authenticated by the other
+        providers, or rejects it if it was already seen.
+        """
+        nonce = request.environ.get('napixd.auth.nonce')
+        if nonce is None:
+            return
+        key, expire = nonce
+        if not self.store.add(key, expire):
+            raise HTTPError(403, 'Replayed authentication data')
@@ -29,6 +29,8 @@ class SecureAuthProtocol(object):
 
     The *Authorization* header of the requests is checked.
     """
+    authorization = 'signed'
+
     def __init__(self):
         self._mandatory = frozenset(['path', 'host', 'method'])
 
@@ -4,6 +4,47 @@
 import time
 
 
+def _get_monotonic():
+    try:
+        return time.monotonic
+    except AttributeError:
+        pass
+
+    try:
+        import ctypes
+        import ctypes.util
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'),
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+    except (ImportError, OSError, AttributeError):
+        return time.time
+
+    class timespec(ctypes.Structure):
+        _fields_ = [
+            ('tv_sec', ctypes.c_long),
+            ('tv_nsec', ctypes.c_long),
+        ]
+
+    CLOCK_MONOTONIC = 1
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    byref = ctypes.byref
+
+    def monotonic():
+        value = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, byref(value)) != 0:
+            return time.time()
+        return value.tv_sec + value.tv_nsec * 1e-9
+
+    return monotonic
+
+
+#: A clock that cannot go backward, in seconds.
+#:
+#: It is :func:`time.monotonic` when it exists, ``clock_gettime(CLOCK_MONOTONIC)``
+#: on the systems providing it or :func:`time.time`.
+monotonic = _get_monotonic()
+
+
 class Chrono(object):
     """
     A class used as a context manager to get the timing of a code section.
@@ -39,3 +80,88 @@ class Chrono(object):
 
     def __exit__(self, exception_type, exception_value, traceback):
         self.end = time.time()
+
+
+class Timings(object):
+    """
+    The durations of the phases of a request.
+
+    The durations of the phases with the same name are summed.
+
+    >>> timings = Timings()
+    >>> with timings('auth'):
+    ...     authenticate()
+    >>> timings.server_timing()
+    'auth;dur=12.30'
+    """
+    def __init__(self):
+        self.names = []
+        self.durations = {}
+
+    def __repr__(self):
+        return '<Timings {0}>'.format(self)
+
+    def __str__(self):
+        return ' '.join('{0}={1:.2f}ms'.format(name, self.durations[name] * 1000)
+                        for name in self.names)
+
+    def __nonzero__(self):
+        return bool(self.names)
+
+    def __call__(self, name):
+        """
+        Returns a context manager adding the duration of its block
+        to the phase *name*.
+        """
+        return _Phase(self, name)
+
+    def add(self, name, duration):
+        """
+        Adds *duration* seconds to the phase *name*.
+        """
+        if name in self.durations:
+            self.durations[name] += duration
+        else:
+            self.names.append(name)
+            self.durations[name] = duration
+
+    def server_timing(self):
+        """
+        Returns the value of the ``Server-Timing`` header.
+        """
+        return ', '.join('{0};dur={1:.2f}'.format(name, self.durations[name] * 1000)
+                         for name in self.names)
+
+
+class NullTimings(Timings):
+    """
+    A :class:`Timings` that does not record anything.
+    """
+    def add(self, name, duration):
+        pass
+
+
+class _Phase(object):
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.timings.add(self.name, time.time() - self.start)
+
+
+null_timings = NullTimings()
+
+
+def get_timings(environ):
+    """
+    Returns the :class:`Timings` of the request of *environ*
+    or a :class:`NullTimings`.
+    """
+    return environ.get('napixd.timings', null_timings)
@@ -11,15 +11,16 @@ The other feature is :class:`GeventServer` witch acts as a WSGI server and
 overrides the value of the environ key ``PATH_INFO`` to undo all unescaping.
 """
 
-import time
 import logging
 
 import gevent
 import gevent.greenlet
-import gevent.wsgi
+import gevent.pywsgi
 import gevent.hub
 
-from napixd.chrono import Chrono
+from napixd.chrono import Chrono, monotonic, get_timings
+from napixd.utils import metrics
+from napixd.plugins.metrics import NO_LABELS
 
 from napixd.http import Adapter
 from napixd.http.response import HTTPResponse
@@ -30,32 +31,42 @@ logger = logging.getLogger('Napix.gevent')
 class Greenlet(gevent.greenlet.Greenlet):
     """
     A greenlet subclass that tracks the time it is running
+
+    The running time is accumulated at each switch by the :class:`Tracer`,
+    in constant memory.
+
+    .. attribute:: switches
+
+        The number of times this greenlet has been switched in.
     """
     def __init__(self, *args, **kw):
         super(Greenlet, self).__init__(*args, **kw)
-        self._times = []
+        self._running_time = 0
+        self._switched_in = None
+        self.switches = 0
 
-    def add_time(self):
+    def switch_in(self):
         """
-        Add a timestamp.
+        Marks the start of an interval of running time.
         """
-        self._times.append(time.time())
+        self._switched_in = monotonic()
+        self.switches += 1
 
-    def get_running_intervals(self):
+    def switch_out(self):
         """
-        Return the pair (begin, end) of the times
-        this instance has been running.
+        Marks the end of an interval of running time.
         """
-        i = iter(self._times)
-        now = time.time()
-        for t in i:
-            yield t, next(i, now)
+        if self._switched_in is not None:
+            self._running_time += monotonic() - self._switched_in
+            self._switched_in = None
 
     def get_running_time(self):
         """
         Return the time in seconds during witch this greenlet has been running.
         """
-        return sum(end - start for start, end in self.get_running_intervals())
+        if self._switched_in is None:
+            return self._running_time
+        return self._running_time + monotonic() - self._switched_in
 
 
 class Tracer(object):
@@ -77,11 +88,11 @@ class Tracer(object):
             return
         from_, to = who
         if self.last is not None:
-            self.last.add_time()
+            self.last.switch_out()
             self.last = None
 
         if isinstance(to, Greenlet):
-            to.add_time()
+            to.switch_in()
             self.last = to
 
     def set_trace(self):
@@ -106,6 +117,10 @@ class AddGeventTimeHeader(object):
     """
     A :mod:`napixd.http` plugin used to transfert the results of the time spent
     by the :class:`gevent.greenlet` to the users by the HTTP headers.
+
+    The running time is also added as the ``cpu`` phase of the
+    :class:`napixd.chrono.Timings` of the request and observed in the
+    ``napixd_request_cpu_seconds`` metric.
     """
 
     def __init__(self):
@@ -117,9 +132,16 @@ class AddGeventTimeHeader(object):
             proc = Greenlet.spawn(callback, request)
             resp = proc.get()
 
+        running_time = proc.get_running_time()
+        get_timings(request.environ).add('cpu', running_time)
+        metrics.registry.histogram(
+            'napixd_request_cpu_seconds', 'Time spent running the greenlets of the requests',
+            **request.environ.get('napixd.metrics.labels', NO_LABELS)
+        ).observe(running_time)
+
         return HTTPResponse({
             'x-total-time': timing.total,
-            'x-running-time': proc.get_running_time()
+            'x-running-time': running_time,
         }, resp)
 
 
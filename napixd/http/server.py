@@ -9,6 +9,7 @@ import time
 import logging
 import json
 
+from napixd.chrono import Timings, get_timings
 from napixd.http.router.router import Router
 from napixd.http.request import Request, HeadersDict
 from napixd.http.response import HTTPError, Response, HTTPResponse, HTTP404
@@ -30,13 +31,19 @@ def file_wrapper(environ, filelike):
 class WSGIServer(object):
     """
     A WSGI compliant server used for napixd.
+
+    The durations of the phases of each request are recorded in a
+    :class:`napixd.chrono.Timings` in the ``napixd.timings`` key of the environ.
+    When *server_timing* is True, they are sent in the ``Server-Timing`` header.
     """
-    def __init__(self, json=json):
+    def __init__(self, json=json, server_timing=False):
         self._router = r = Router()
         self._routers = [r]
         self._json_provider = json
+        self._server_timing = server_timing
 
     def __call__(self, environ, start_response):
+        environ['napixd.timings'] = timings = Timings()
         environ['napixd.request'] = request = Request(environ, self._json_provider)
         try:
             resp = self.handle(request)
@@ -47,6 +54,8 @@ class WSGIServer(object):
         headers = resp.headers
         headers['Date'] = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
         headers['Server'] = 'napixd'
+        if self._server_timing and timings:
+            headers['Server-Timing'] = timings.server_timing()
 
         start_response(resp.status_line, headers.items())
         return resp.body
@@ -62,7 +71,8 @@ class WSGIServer(object):
         Handles the request: :meth:`resolve` it and executes it
         or raises a :class:`napixd.http.response.HTTP404`.
         """
-        callback = self.resolve(request.path)
+        with get_timings(request.environ)('route'):
+            callback = self.resolve(request.path)
         if callback is None:
             return HTTP404()
         return callback(request)
@@ -150,7 +160,8 @@ class WSGIServer(object):
             body = file_wrapper(request.environ, body)
         elif body is not None:
             content_type = 'application/json'
-            body = self._json_provider.dumps(body)
+            with get_timings(request.environ)('encode'):
+                body = self._json_provider.dumps(body)
         else:
             content_type = ''
             body = []
@@ -112,13 +112,19 @@ Non-default:
     autonomous-auth:    Use a local source of authentication
     hosts:      Check the HTTP Host header
     jwt:        Enables authentication by JSON Web Tokens
+    replay:     Reject the replayed and expired authentication data locally
     loggers:    Set up extra loggers
     logfile:    Write the log of Napix in a log file
     wait:       Do not respond in less than a given time
     ratelimit-auth: Enable the rate-limiting plugin by authenticated username
     ratelimit-ip:   Enable the rate-limiting plugin by source IP
+    ratelimit-concurrent:   Limit the concurrent requests by authenticated username
     cwd:        Auto loader on the current working directory
     decimal:    Use decimal.Decimal to encode/decode float values from/to JSON
+    metrics:    Record the requests and serve the metrics of the server on /_napix_metrics
+    server-timing:  Add the Server-Timing header with the duration of the phases of the request
+    locktime:   Add custom headers to show the time spent waiting for and holding the locks
+    profile:    Profile the slow requests and list the profiles on /_napix_profile
 
 Meta-options:
     only:       Disable default options
@@ -297,6 +303,10 @@ Meta-options:
         if 'hosts' in self.options:
             providers.append(HostChecker(self.hosts))
 
+        if 'replay' in self.options:
+            from napixd.auth.replay import ReplayChecker
+            providers.append(ReplayChecker.from_settings(conf.get('replay')))
+
         if 'autonomous-auth' in self.options:
             from napixd.auth.autonomous import AutonomousAuthProvider
             providers.append(AutonomousAuthProvider.from_settings(conf))
@@ -325,7 +335,7 @@ Meta-options:
             logger.info('Enable authentication by tokens')
         if 'jwt' in self.options:
             from napixd.auth.jwt import JSONWebToken
-            sources.append(JSONWebToken())
+            sources.append(JSONWebToken.from_settings(conf))
         return sources
 
     def get_napixd(self, router):
@@ -378,6 +388,16 @@ Meta-options:
             from napixd.plugins.times import TimePlugin
             router.add_filter(TimePlugin('x-total-time'))
 
+        if 'locktime' in self.options:
+            from napixd.plugins.times import LockTimePlugin
+            router.add_filter(LockTimePlugin())
+
+        if 'profile' in self.options:
+            from napixd.plugins.profiler import ProfilerPlugin
+            self.profiler = ProfilerPlugin.from_settings(
+                self.conf.get('profile'), greenlets='gevent' in self.options)
+            router.add_filter(self.profiler)
+
         if 'times' in self.options:
             if 'gevent' not in self.options:
                 raise CannotLaunch('`times` option requires `gevent`')
@@ -398,6 +418,16 @@ Meta-options:
                 RequestEnvironCriteria('napixd.auth.username'),
             ))
 
+        if 'ratelimit-concurrent' in self.options:
+            from napixd.plugins.ratelimit import (
+                ConcurrentLimiterPlugin,
+                RequestEnvironCriteria,
+            )
+            router.add_filter(ConcurrentLimiterPlugin.from_settings(
+                self.conf.get('rate_limit.concurrent'),
+                RequestEnvironCriteria('napixd.auth.username'),
+            ))
+
         if 'auth' in self.options:
             auth_handler = self.get_auth_handler()
             router.add_filter(auth_handler)
@@ -457,7 +487,8 @@ Meta-options:
 
     def get_wsgi_server(self):
         from napixd.http.server import WSGIServer
-        return WSGIServer(json=self.get_json_provider())
+        return WSGIServer(json=self.get_json_provider(),
+                          server_timing='server-timing' in self.options)
 
     def get_app(self):
         """
@@ -500,6 +531,14 @@ Meta-options:
         else:
             self.web_client = None
 
+        if 'metrics' in self.options:
+            from napixd.plugins.metrics import MetricsEndpoint
+            MetricsEndpoint().setup_bottle(router)
+
+        if 'profile' in self.options:
+            from napixd.plugins.profiler import ProfileEndpoint
+            ProfileEndpoint(self.profiler.store).setup_bottle(router)
+
         return server
 
     def apply_middleware(self, application):
@@ -531,6 +570,10 @@ Meta-options:
             json=self.get_json_provider(),
         )
 
+        if 'metrics' in self.options:
+            from napixd.plugins.metrics import MetricsMiddleware
+            application = MetricsMiddleware(application)
+
         return application
 
     def get_application(self):
@@ -326,11 +326,19 @@ class Manager(object):
         A class level boolean to tell if the class is used by the Napixd,
         when the :class:`auto-loader<napixd.loader.AutoImporter>`
         browse a module.
+
+    .. attribute:: saves_collection
+
+        True when the modification of a resource persists all the resources
+        of the collection, like a :class:`~napixd.managers.default.DictManager`.
+        The writes on such a manager acquire all the stripes of the lock of
+        the service, see :class:`napixd.services.lock.StripedServiceLock`.
     """
 
     __metaclass__ = ManagerType
 
     auto_load = True
+    saves_collection = False
 
     # list of the fields publicly available with their properties
     resource_fields = {}
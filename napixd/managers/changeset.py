@@ -15,32 +15,55 @@ class DiffDict(collections.MutableMapping):
     >>> c = DiffDict({'a': 1, 'c': 3}, {'a': 2, 'b': 2})
     >>> c['a'], c['b'], c.get('c')
     (2, 2, None)
+
+    The :class:`DiffDict` is a view on *patches*, neither *orig* nor
+    *patches* are copied. The sets of :attr:`added`, :attr:`deleted` and
+    :attr:`changed` fields are computed at their first access and then
+    kept up to date by the modifications made through the :class:`DiffDict`.
     """
 
     def __init__(self, orig, patches):
         self.orig = orig
         self.patches = patches
-        self.merge = dict(orig)
-        self.merge.update(patches)
-        for key in self.deleted:
-            del self.merge[key]
+        self._added = None
+        self._deleted = None
+        self._changed = None
 
     def __iter__(self):
-        return iter(self.merge)
+        return iter(self.patches)
 
     def __getitem__(self, key):
-        return self.merge[key]
+        return self.patches[key]
+
+    def __contains__(self, key):
+        return key in self.patches
 
     def __len__(self):
-        return len(self.merge)
+        return len(self.patches)
 
     def __setitem__(self, key, value):
         self.patches[key] = value
-        self.merge[key] = value
+
+        in_orig = key in self.orig
+        if self._added is not None and not in_orig:
+            self._added.add(key)
+        if self._deleted is not None:
+            self._deleted.discard(key)
+        if self._changed is not None:
+            if in_orig and self.orig[key] != value:
+                self._changed.add(key)
+            else:
+                self._changed.discard(key)
 
     def __delitem__(self, key):
         del self.patches[key]
-        del self.merge[key]
+
+        if self._added is not None:
+            self._added.discard(key)
+        if self._deleted is not None and key in self.orig:
+            self._deleted.add(key)
+        if self._changed is not None:
+            self._changed.discard(key)
 
     @property
     def added(self):
@@ -52,7 +75,10 @@ class DiffDict(collections.MutableMapping):
         >>> c.added
         set(['b'])
         """
-        return set(self.patches).difference(self.orig)
+        if self._added is None:
+            orig = self.orig
+            self._added = set(key for key in self.patches if key not in orig)
+        return set(self._added)
 
     @property
     def deleted(self):
@@ -64,7 +90,10 @@ class DiffDict(collections.MutableMapping):
         >>> c.deleted
         set(['a'])
         """
-        return set(self.orig).difference(self.patches)
+        if self._deleted is None:
+            patches = self.patches
+            self._deleted = set(key for key in self.orig if key not in patches)
+        return set(self._deleted)
 
     @property
     def changed(self):
@@ -76,5 +105,8 @@ class DiffDict(collections.MutableMapping):
         >>> c.changed
         set(['a'])
         """
-        keys = set(self.orig).intersection(self.merge)
-        return set(key for key in keys if self.orig[key] != self.merge[key])
+        if self._changed is None:
+            orig = self.orig
+            self._changed = set(key for key, value in self.patches.items()
+                                if key in orig and orig[key] != value)
+        return set(self._changed)
@@ -9,9 +9,38 @@ They will load all the resources of the manager, allow the user to make
 requests and persist all the objects after.
 """
 
+import os
+import copy
+import time
+import atexit
+import logging
+import tempfile
+import itertools
+import threading
+import collections
+
 from napixd.exceptions import NotFound, Duplicate, ValidationError
 from napixd.managers import Manager
 from napixd.managers.base import ManagerType
+from napixd.utils.cache import LoadCache
+from napixd.thread_manager import run_background
+
+logger = logging.getLogger('Napix.managers')
+
+# The writes delayed by FileManager.write_delay by file name: a snapshot of
+# the resources, its generation and the manager writing it.
+_pending_writes = {}
+_pending_lock = threading.Lock()
+# Serializes the delayed writes, so that a snapshot is never written over a
+# newer one.
+_writing_lock = threading.Lock()
+_generations = itertools.count()
+
+
+def _index_key(value):
+    if isinstance(value, basestring):
+        return value
+    return unicode(value)
 
 
 class ReadOnlyDictManager(Manager):
@@ -34,8 +63,30 @@ class ReadOnlyDictManager(Manager):
 
         A mapping of the loaded resources.
         This is lazily evaluated.
+
+    .. attribute:: cache
+
+        When set to True, the resources returned by :meth:`load` are kept
+        in a cache shared by all the instances of the class, and thus by
+        all the requests. The resources are loaded again when the entry is
+        older than :attr:`cache_ttl` or when :meth:`get_cache_version`
+        returns another value.
+
+        The concurrent requests finding an empty cache wait for a single
+        call to :meth:`load`.
+
+        The cached resources are shared and must not be altered
+        outside of the methods of the manager.
+
+    .. attribute:: cache_ttl
+
+        The number of seconds the resources are kept in the cache.
+        ``None`` keeps them until they are invalidated.
     """
 
+    cache = False
+    cache_ttl = None
+
     # Methods to override
     def load(self, context):
         """
@@ -44,16 +95,60 @@ class ReadOnlyDictManager(Manager):
         """
         raise NotImplementedError('load')
 
-    def _get_resources(self):
-        if hasattr(self, '_resources'):
-            return self._resources
+    def get_cache_key(self, context):
+        """
+        Returns the key of the resources of *context* in the cache.
+
+        By default, it is the list of the ids of the parent resources.
+        """
+        key = []
+        while context is not None:
+            key.append(context.id)
+            context = context.manager.context
+        return tuple(key)
 
+    def get_cache_version(self, context):
+        """
+        Returns a value identifying the version of the resources of *context*.
+
+        The cached resources are discarded when this value changes.
+        It must be hashable. By default, it returns ``None``.
+        """
+        return None
+
+    @classmethod
+    def _get_cache(cls):
+        if '_resources_cache' not in cls.__dict__:
+            cls._resources_cache = LoadCache(cls.cache_ttl)
+        return cls._resources_cache
+
+    @classmethod
+    def invalidate_cache(cls):
+        """
+        Discards all the cached resources of this class.
+        """
+        cls._get_cache().clear()
+
+    def _load(self):
         resources = self.load(self.context)
         try:
-            self._resources = dict(resources)
+            return dict(resources)
         except TypeError:
             raise ValueError('load did not return a dict, but {0}',
                              type(resources).__name__)
+
+    def _get_resources(self):
+        if hasattr(self, '_resources'):
+            return self._resources
+
+        if self.cache:
+            self._resources = self._get_cache().get(
+                self.get_cache_key(self.context),
+                self._load,
+                self.get_cache_version(self.context),
+            )
+        else:
+            self._resources = self._load()
         return self._resources
 
     def _set_resources(self, value):
@@ -81,10 +176,196 @@ class DictManager(ReadOnlyDictManager):
     is called to persist the resources
 
     The id of a new resource is generated by the method :meth:`generate_new_id`.
+
+    When the :attr:`~ReadOnlyDictManager.cache` is enabled, the cache is
+    updated with the saved resources, or invalidated if :meth:`save` fails.
+
+    As :meth:`save` persists all the resources, the manager sets
+    :attr:`~napixd.managers.base.Manager.saves_collection`.
+
+    .. attribute:: transactional
+
+        When True, the modifications made during a request are persisted
+        by a single call to :meth:`save` at the end of the request, in the
+        :class:`~napixd.services.transaction.Transaction` of the request.
+        If the request fails, the changes made on the resources are undone.
+
+        It is useful when an action or a sub-manager modifies several
+        resources during the same request.
+
+    .. attribute:: indexes
+
+        A list of fields of the resources on which a hash index is kept.
+
+        When it is set, the manager implements :meth:`list_resource_filter`
+        and :meth:`get_all_resources_filter`. The filters are equality
+        filters. The filters on indexed fields are resolved by the indexes
+        and the filters on the other fields by a scan of the resources
+        selected by the indexes. The parameters in :attr:`ignored_filters`
+        are not filters.
+
+        The values are compared as strings, as they are extracted from the
+        query string of the request.
+
+        When the :attr:`~ReadOnlyDictManager.cache` is enabled, the indexes
+        are kept with the cached resources and shared by the requests.
+        They are built again after a modification of the resources.
+
+        .. code-block:: python
+
+            class UserManager(DictManager):
+                indexes = ['group', 'shell']
+
+        ``GET /users/?group=wheel&shell=/bin/sh``
+
+    .. attribute:: ignored_filters
+
+        The parameters of the request that are not filters on the resources,
+        by default ``getall`` and ``token``, the parameter of the
+        non-secure authentication.
     """
 
+    indexes = ()
+    ignored_filters = ('getall', 'token')
+    transactional = False
+    saves_collection = True
+
+    @classmethod
+    def _get_indexes_cache(cls):
+        if '_indexes_cache' not in cls.__dict__:
+            cls._indexes_cache = {}
+        return cls._indexes_cache
+
+    @classmethod
+    def invalidate_cache(cls):
+        super(DictManager, cls).invalidate_cache()
+        cls._get_indexes_cache().clear()
+
+    def _get_index(self):
+        if not self.cache:
+            if not hasattr(self, '_index'):
+                self._index = self._build_index()
+            return self._index
+
+        # The index is valid as long as the cache returns the same resources
+        # and is dropped when they are modified.
+        key = self.get_cache_key(self.context)
+        indexes = self._get_indexes_cache()
+        resources = self.resources
+        entry = indexes.get(key)
+        if entry is not None and entry[0] is resources:
+            return entry[1]
+
+        index = self._build_index()
+        indexes[key] = (resources, index)
+        return index
+
+    def _build_index(self):
+        index = dict((field, {}) for field in self.indexes)
+        for resource_id in self.list_resource():
+            resource = self._get_fields(self.resources[resource_id])
+            for field in self.indexes:
+                if field in resource:
+                    index[field].setdefault(_index_key(resource[field]), set()).add(resource_id)
+        return index
+
+    def _invalidate_index(self):
+        self.__dict__.pop('_index', None)
+        if self.cache:
+            self._get_indexes_cache().pop(self.get_cache_key(self.context), None)
+
+    def _get_fields(self, resource):
+        if not isinstance(resource, collections.Mapping):
+            return self.serialize(resource)
+        return resource
+
+    def _filter_ids(self, filters):
+        if not self.indexes:
+            return list(self.list_resource())
+
+        ids = None
+        scanned = []
+        for field in filters:
+            if field in self.ignored_filters:
+                continue
+
+            if hasattr(filters, 'getall'):
+                values = filters.getall(field)
+            else:
+                values = [filters[field]]
+            values = set(_index_key(value) for value in values)
+
+            if field not in self.indexes:
+                scanned.append((field, values))
+                continue
+
+            index = self._get_index()[field]
+            matching = set()
+            for value in values:
+                matching.update(index.get(value, ()))
+
+            ids = matching if ids is None else ids.intersection(matching)
+            if not ids:
+                return []
+
+        if ids is None:
+            ids = self.list_resource()
+        if not scanned:
+            return list(ids)
+
+        resources = self.resources
+        matching = []
+        for resource_id in ids:
+            resource = self._get_fields(resources[resource_id])
+            if all(field in resource and _index_key(resource[field]) in values
+                   for field, values in scanned):
+                matching.append(resource_id)
+        return matching
+
+    def list_resource_filter(self, filters):
+        """
+        Returns the ids of the resources matching the *filters*.
+        """
+        return self._filter_ids(filters)
+
+    def get_all_resources_filter(self, filters):
+        """
+        Returns the pairs of id and resource matching the *filters*.
+        """
+        resources = self.resources
+        return [(resource_id, resources[resource_id])
+                for resource_id in self._filter_ids(filters)]
+
+    def _get_transaction(self):
+        if not self.transactional:
+            return None
+        return getattr(self.napix_context, 'transaction', None)
+
+    def _register_undo(self, callback):
+        transaction = self._get_transaction()
+        if transaction is not None:
+            transaction.register(callback)
+
     def _save(self):
-        return self.save(self.context, self.resources)
+        transaction = self._get_transaction()
+        if transaction is not None:
+            transaction.defer(self, self._persist)
+            return
+        return self._persist()
+
+    def _persist(self):
+        if not self.cache:
+            return self.save(self.context, self.resources)
+
+        cache = self._get_cache()
+        key = self.get_cache_key(self.context)
+        try:
+            result = self.save(self.context, self.resources)
+        except Exception:
+            cache.invalidate(key)
+            raise
+        cache.set(key, self.resources, self.get_cache_version(self.context))
+        return result
 
     def save(self, context, resources):
         """
@@ -124,12 +405,33 @@ class DictManager(ReadOnlyDictManager):
         Set a resource inside the resources list
         """
         self.resources[resource_id] = resource_dict
+        self._invalidate_index()
+
+    def _del_resource(self, resource_id):
+        """
+        Remove a resource from the resources list
+        """
+        del self.resources[resource_id]
+        self._invalidate_index()
 
     def modify_resource(self, resource, resource_dict):
         new_id = self.generate_id(resource_dict, resource)
+
+        transaction = self._get_transaction()
+        if transaction is not None:
+            original = dict(resource.resource)
+
+            @transaction.register
+            def undo_modify():
+                if new_id != resource.id:
+                    self._del_resource(new_id)
+                resource.resource.clear()
+                resource.resource.update(original)
+                self._set_resource(resource.id, resource.resource)
+
         resource.resource.update(resource_dict)
         if new_id != resource.id:
-            del self.resources[resource.id]
+            self._del_resource(resource.id)
         self._set_resource(new_id, resource.resource)
         self._save()
         return new_id
@@ -139,15 +441,18 @@ class DictManager(ReadOnlyDictManager):
         if resource_id in self.resources:
             raise Duplicate(resource_id)
         self._set_resource(resource_id, resource_dict)
+        self._register_undo(lambda: self._del_resource(resource_id))
         self._save()
         return resource_id
 
     def delete_resource(self, resource):
         try:
-            del self.resources[resource.id]
+            removed = self.resources[resource.id]
+            self._del_resource(resource.id)
         except KeyError:
             raise NotFound(resource.id)
         else:
+            self._register_undo(lambda: self._set_resource(resource.id, removed))
             self._save()
 
     @classmethod
@@ -161,6 +466,12 @@ class DictManager(ReadOnlyDictManager):
             implemented.discard('delete_resource')
             implemented.discard('modify_resource')
 
+        if not cls.indexes:
+            if cls.list_resource_filter == DictManager.list_resource_filter:
+                implemented.discard('list_resource_filter')
+            if cls.get_all_resources_filter == DictManager.get_all_resources_filter:
+                implemented.discard('get_all_resources_filter')
+
         if cls.generate_id == DictManager.generate_id and cls.generate_new_id == DictManager.generate_new_id:
             implemented.discard('create_resource')
         return implemented
@@ -173,8 +484,11 @@ class ListManager(DictManager):
 
     def create_resource(self, resource_dict):
         self.resources.append(resource_dict)
+        resource_id = len(self.resources) - 1
+        self._invalidate_index()
+        self._register_undo(lambda: self._del_resource(resource_id))
         self._save()
-        return len(self.resources) - 1
+        return resource_id
 
     def list_resource(self):
         return range(0, len(self.resources))
@@ -192,14 +506,68 @@ class ListManager(DictManager):
 class FileManager(DictManager):
     """
     Manager that is attached to a file
+
+    When the :attr:`~ReadOnlyDictManager.cache` is enabled, the resources
+    are cached by file name and loaded again when the modification time
+    of the file changes.
+
+    .. attribute:: atomic
+
+        When True, :meth:`save` writes the resources in a temporary file
+        in the same directory and renames it over the original file.
+        A concurrent reader sees either the old or the new file but never
+        a partially written file.
+
+    .. attribute:: fsync
+
+        When the writes are :attr:`atomic`, the temporary file and the
+        directory are synced on the disk before and after the rename.
+        Setting it to False trades the durability of the write against
+        its speed.
+
+    .. attribute:: write_delay
+
+        When set, the writes are delayed by *write_delay* seconds and
+        done in background. All the calls to :meth:`save` on the same file
+        during this delay are coalesced in a single call to :meth:`write`
+        with the last resources saved. Meanwhile, :meth:`load` returns the
+        resources waiting to be written.
+
+        A failed write is logged and tried again after *write_delay*
+        seconds. The modifications not yet written are written when the
+        process exits, see :func:`flush_pending_writes`.
     """
 
+    atomic = False
+    fsync = True
+    write_delay = None
+
+    def get_cache_key(self, context):
+        """
+        The key in the cache is the file name.
+        """
+        return self.get_filename(context)
+
+    def get_cache_version(self, context):
+        """
+        The version of the resources is the modification time of the file.
+        """
+        try:
+            return os.path.getmtime(self.get_filename(context))
+        except OSError:
+            return None
+
     def load(self, context):
         """
         Opens the file for reading, gives it to :meth:`parser`
         so that it extracs the data
         """
         filename = self.get_filename(context)
+        with _pending_lock:
+            pending = _pending_writes.get(filename)
+        if pending is not None:
+            return copy.deepcopy(pending[0])
+
         try:
             handle = open(filename, 'r')
         except IOError:
@@ -213,8 +581,83 @@ class FileManager(DictManager):
         Opens the file and then gives it to :meth:`write`
         """
         filename = self.get_filename(context)
-        with open(filename, 'w') as fp:
-            self.write(fp, resources)
+        if self.write_delay is None:
+            self._write_file(filename, resources)
+            return
+
+        # The resources may be modified in the cache before they are written
+        snapshot = copy.deepcopy(resources)
+        with _pending_lock:
+            scheduled = filename in _pending_writes
+            _pending_writes[filename] = (snapshot, next(_generations), self)
+
+        if not scheduled:
+            run_background(self._write_behind, filename)
+
+    def _write_behind(self, filename):
+        while True:
+            time.sleep(self.write_delay)
+            with _writing_lock:
+                with _pending_lock:
+                    pending = _pending_writes.get(filename)
+                if pending is None:
+                    # Written by flush_pending_writes
+                    return
+
+                resources, generation, manager = pending
+                try:
+                    self._write_file(filename, resources)
+                except Exception:
+                    logger.exception('Cannot write %s, retrying in %ss',
+                                     filename, self.write_delay)
+                    continue
+
+                with _pending_lock:
+                    if _pending_writes[filename][1] == generation:
+                        del _pending_writes[filename]
+                        return
+
+    def _write_file(self, filename, resources):
+        if not self.atomic:
+            with open(filename, 'w') as fp:
+                self.write(fp, resources)
+            return
+
+        directory, basename = os.path.split(filename)
+        directory = directory or os.curdir
+        fd, temporary = tempfile.mkstemp(prefix='.{0}.'.format(basename),
+                                         dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                self.write(fp, resources)
+                if self.fsync:
+                    fp.flush()
+                    os.fsync(fp.fileno())
+
+            try:
+                mode = os.stat(filename).st_mode & 0o7777
+            except OSError:
+                # mkstemp creates the file with the mode 0600,
+                # open would have applied the umask to 0666
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temporary, mode)
+
+            os.rename(temporary, filename)
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+
+        if self.fsync:
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
 
     def get_filename(self, context):
         """
@@ -302,3 +745,29 @@ class UniqueManager(ReadOnlyUniqueManager):
         resource = wrapper.resource
         resource.update(resource_dict)
         self.save(self.context, resource)
+
+
+def flush_pending_writes():
+    """
+    Writes now the resources delayed by :attr:`FileManager.write_delay`.
+
+    It is called when the process exits.
+    """
+    with _pending_lock:
+        filenames = list(_pending_writes)
+
+    for filename in filenames:
+        with _writing_lock:
+            with _pending_lock:
+                pending = _pending_writes.pop(filename, None)
+            if pending is None:
+                continue
+
+            resources, generation, manager = pending
+            try:
+                manager._write_file(filename, resources)
+            except Exception:
+                logger.exception('Cannot write %s', filename)
+
+
+atexit.register(flush_pending_writes)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The metrics endpoint of napixd and the recording of the requests.
+"""
+
+from napixd.chrono import Chrono
+from napixd.http.response import HTTPResponse
+from napixd.utils.metrics import registry as default_registry
+
+#: The labels of the requests outside of the services.
+NO_LABELS = {'service': u'', 'collection': u''}
+
+
+class MetricsEndpoint(object):
+    """
+    Serves the metrics of the *registry* in the text format of Prometheus
+    at ``/_napix_metrics``.
+
+    The default registry is :data:`napixd.utils.metrics.registry`.
+
+    The view is routed on the router of the services, behind the
+    authentication.
+    """
+    CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else default_registry
+
+    def setup_bottle(self, router):
+        """
+        Routes the view on the *router* of the services.
+        """
+        router.route('/_napix_metrics', self.metrics)
+
+    def metrics(self, request):
+        """
+        View of the metrics.
+        """
+        return HTTPResponse({
+            'Content-Type': self.CONTENT_TYPE,
+        }, self.registry.render().encode('utf-8'))
+
+
+class MetricsMiddleware(object):
+    """
+    WSGI middleware recording the requests in the *registry*.
+
+    The requests are counted in ``napixd_requests_total`` by method and status
+    and their durations are observed in ``napixd_request_duration_seconds``.
+
+    Both are labelled by the ``napixd.metrics.labels`` of the environ, set by
+    the requests on the services, in order to label by URL template rather than
+    by URL. The other requests have empty labels.
+    """
+    def __init__(self, application, registry=None):
+        self.application = application
+        self.registry = registry if registry is not None else default_registry
+
+    def __call__(self, environ, start_response):
+        statuses = []
+
+        def metered_start_response(status, headers, exc_info=None):
+            statuses.append(status.split(' ', 1)[0])
+            if exc_info is None:
+                return start_response(status, headers)
+            return start_response(status, headers, exc_info)
+
+        chrono = Chrono()
+        try:
+            with chrono:
+                return self.application(environ, metered_start_response)
+        finally:
+            self.record(environ, statuses[-1] if statuses else '500', chrono.total)
+
+    def record(self, environ, status, duration):
+        """
+        Records a request on *environ* answered with *status* after *duration*
+        seconds.
+        """
+        labels = environ.get('napixd.metrics.labels', NO_LABELS)
+        self.registry.counter(
+            'napixd_requests_total', 'Requests by method and status',
+            method=environ.get('REQUEST_METHOD', ''), status=status, **labels).inc()
+        self.registry.histogram(
+            'napixd_request_duration_seconds', 'Time spent handling the requests',
+            **labels).observe(duration)
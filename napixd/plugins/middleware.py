@@ -8,7 +8,7 @@ Various WSGI compatible middlewares.
 import urlparse
 import logging
 import datetime
-from napixd.chrono import Chrono
+from napixd.chrono import Chrono, get_timings
 
 
 class PathInfoMiddleware(object):
@@ -110,7 +110,7 @@ class LoggedRequest(object):
 
         total_time = (transfert.total + self.chrono.total) * 1000
 
-        self.logger.info('%s - %s [%s] "%s %s" %s %s %.2fms',
+        self.logger.info('%s - %s [%s] "%s %s" %s %s %.2fms%s',
                          self.environ.get('REMOTE_ADDR', '-'),
                          self.username,
                          datetime.datetime.now().replace(microsecond=0),
@@ -119,8 +119,14 @@ class LoggedRequest(object):
                          self.status.split(' ')[0],
                          size,
                          total_time,
+                         self.timings,
                          )
 
+    @property
+    def timings(self):
+        timings = get_timings(self.environ)
+        return ' ' + str(timings) if timings else ''
+
 
 def LoggerMiddleware(application):
     """
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Profiling of the slow requests.
+
+The :class:`ProfilerPlugin` samples the stacks of the requests with a
+:class:`StackSampler` and keeps the profiles of the requests slower than a
+threshold in a :class:`ProfileStore`. The :class:`ProfileEndpoint` lists them
+at ``/_napix_profile``.
+
+The profiles are written in the collapsed stack format used by the flame graph
+tools: one line by stack, with the frames separated by ``;`` and followed by
+the number of samples.
+"""
+
+import os
+import sys
+import time
+import thread
+import logging
+import threading
+
+from napixd.chrono import Chrono
+from napixd.http.response import HTTPResponse, HTTP404
+
+__all__ = (
+    'StackSampler',
+    'ProfileStore',
+    'ProfilerPlugin',
+    'ProfileEndpoint',
+)
+
+logger = logging.getLogger('Napix.profiler')
+
+MAX_DEPTH = 100
+
+
+def collapse(frame):
+    """
+    Returns the collapsed representation of the stack of *frame*.
+    """
+    frames = []
+    while frame is not None and len(frames) < MAX_DEPTH:
+        code = frame.f_code
+        frames.append('{0} ({1}:{2})'.format(
+            code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    frames.reverse()
+    return ';'.join(frames)
+
+
+class StackSampler(object):
+    """
+    Samples the stacks of the profiled requests every *interval* seconds
+    of wall-clock time, so that the time spent waiting for the I/O, the locks
+    or the other servers is in the profiles as well as the running time.
+
+    The samples are taken by a thread started with *start_thread*, which has
+    the signature of :func:`thread.start_new_thread`, and waiting with
+    *sleep*. The thread is started with the first profiled request and waits
+    *idle_interval* seconds between two checks while no request is profiled.
+
+    *current* is a function returning the current greenlet, like
+    :func:`gevent.getcurrent`. A greenlet switched out is sampled from its
+    ``gr_frame``. The running greenlet has no ``gr_frame``, it is sampled
+    from the stack of the thread of the hub, identified by *get_ident*. When
+    *current* is ``None``, the requests are identified by their thread.
+
+    With :mod:`gevent.monkey`, the *start_thread*, *sleep* and *get_ident*
+    functions must be the original ones of the :mod:`thread` and :mod:`time`
+    modules.
+    """
+    def __init__(self, interval=.005, current=None, start_thread=None,
+                 sleep=None, get_ident=None, idle_interval=.1):
+        self.interval = interval
+        self.idle_interval = max(interval, idle_interval)
+        self._current = current
+        self._start_thread = start_thread or thread.start_new_thread
+        self._sleep = sleep or time.sleep
+        self._get_ident = get_ident or thread.get_ident
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self, owner=None):
+        """
+        Starts profiling the greenlet or the thread *owner*, by default
+        the current one.
+
+        Returns the :class:`dict` of the stacks and their number of samples.
+        """
+        ident = self._get_ident()
+        if self._current is None:
+            owner = ident = ident if owner is None else owner
+        elif owner is None:
+            owner = self._current()
+        stacks = {}
+        self._profiles[owner] = (ident, stacks)
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self._start_thread(self._run, ())
+        return stacks
+
+    def stop(self, owner=None):
+        """
+        Stops profiling *owner*.
+        """
+        if owner is None:
+            owner = self._current() if self._current else self._get_ident()
+        self._profiles.pop(owner, None)
+
+    def _run(self):
+        while True:
+            try:
+                sampled = self.sample()
+            except Exception:
+                logger.exception('Cannot sample the stacks')
+                sampled = False
+            self._sleep(self.interval if sampled else self.idle_interval)
+
+    def sample(self):
+        """
+        Adds a sample of the stacks of the profiled requests.
+
+        Returns ``False`` if no request is profiled.
+        """
+        profiles = self._profiles.items()
+        if not profiles:
+            return False
+
+        frames = sys._current_frames()
+        for owner, (ident, stacks) in profiles:
+            frame = None
+            if self._current is not None:
+                frame = owner.gr_frame
+            if frame is None:
+                frame = frames.get(ident)
+            if frame is not None:
+                self._add(stacks, frame)
+        return True
+
+    def _add(self, stacks, frame):
+        stack = collapse(frame)
+        stacks[stack] = stacks.get(stack, 0) + 1
+
+
+class ProfileStore(object):
+    """
+    A directory keeping the *keep* most recent profiles.
+
+    Each profile is a file beginning with a comment line with the method,
+    the path and the duration of the request.
+    """
+    EXTENSION = '.collapsed'
+
+    def __init__(self, directory, keep=50):
+        self.directory = directory
+        self.keep = keep
+
+    def _names(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(self.EXTENSION))
+
+    def save(self, method, path, duration, stacks):
+        """
+        Writes the *stacks* of the request *method* *path* that lasted
+        *duration* seconds and removes the oldest profiles.
+
+        Returns the name of the profile.
+        """
+        name = '{0:.6f}-{1}{2}'.format(time.time(), os.getpid(), self.EXTENSION)
+        with open(os.path.join(self.directory, name), 'w') as handle:
+            handle.write('# {0} {1} {2:.2f}ms\n'.format(method, path, duration * 1000))
+            for stack, count in sorted(stacks.items()):
+                handle.write('{0} {1}\n'.format(stack, count))
+
+        for old in self._names()[:-self.keep]:
+            try:
+                os.unlink(os.path.join(self.directory, old))
+            except OSError:
+                pass
+        return name
+
+    def list(self):
+        """
+        Returns the description of the profiles, the most recent first.
+        """
+        profiles = []
+        for name in reversed(self._names()):
+            try:
+                with open(os.path.join(self.directory, name)) as handle:
+                    method, path, duration = handle.readline()[2:].split()
+                profiles.append({
+                    'name': name,
+                    'time': float(name.split('-', 1)[0]),
+                    'method': method,
+                    'path': path,
+                    'duration': float(duration[:-2]),
+                })
+            except (IOError, ValueError):
+                continue
+        return profiles
+
+    def get(self, name):
+        """
+        Returns the content of the profile *name* or ``None``.
+        """
+        if name not in self._names():
+            return None
+        with open(os.path.join(self.directory, name)) as handle:
+            return handle.read()
+
+
+class ProfilerPlugin(object):
+    """
+    Plugin for :mod:`napixd.http` that samples the stacks of the requests
+    with the *sampler* and saves the profile of the requests lasting more
+    than *threshold* seconds in the *store*.
+    """
+
+    @classmethod
+    def from_settings(cls, settings, greenlets=False):
+        directory = settings.get('directory', None, type=unicode)
+        if not directory:
+            from napixd import get_path
+            directory = get_path('profiles')
+        elif not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        threshold = settings.get('threshold', 1000, type=(int, float))
+        interval = settings.get('interval', 5, type=(int, float))
+        keep = settings.get('keep', 50, type=int)
+
+        if greenlets:
+            import gevent
+            from gevent.monkey import get_original
+            sampler = StackSampler(
+                interval / 1000., gevent.getcurrent,
+                start_thread=get_original('thread', 'start_new_thread'),
+                sleep=get_original('time', 'sleep'),
+                get_ident=get_original('thread', 'get_ident'))
+        else:
+            sampler = StackSampler(interval / 1000.)
+
+        logger.info('Profiling the requests slower than %sms to %s', threshold, directory)
+        return cls(sampler, ProfileStore(directory, keep), threshold / 1000.)
+
+    def __init__(self, sampler, store, threshold):
+        self.sampler = sampler
+        self.store = store
+        self.threshold = threshold
+
+    def __call__(self, callback, request):
+        stacks = self.sampler.start()
+        try:
+            with Chrono() as chrono:
+                return callback(request)
+        finally:
+            self.sampler.stop()
+            if chrono.total >= self.threshold:
+                self.save(request, chrono.total, stacks)
+
+    def save(self, request, duration, stacks):
+        try:
+            name = self.store.save(request.method, request.path, duration, stacks)
+        except (IOError, OSError) as e:
+            logger.error('Cannot save the profile of %s: %s', request.path, e)
+        else:
+            logger.info('Request %s %s took %.2fms, profiled in %s',
+                        request.method, request.path, duration * 1000, name)
+
+
+class ProfileEndpoint(object):
+    """
+    Serves the profiles of the *store* at ``/_napix_profile``.
+
+    The profiles show the code and the arguments of the requests: the views
+    are routed on the router of the services, behind the authentication.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def setup_bottle(self, router):
+        """
+        Routes the views on the *router* of the services.
+        """
+        router.route('/_napix_profile', self.profiles)
+        router.route('/_napix_profile/?', self.profile)
+
+    def profiles(self, request):
+        """
+        View of the list of the profiles.
+        """
+        return self.store.list()
+
+    def profile(self, request, name):
+        """
+        View of the profile *name*.
+        """
+        content = self.store.get(name)
+        if content is None:
+            return HTTP404()
+        return HTTPResponse({
+            'Content-Type': 'text/plain',
+        }, content)
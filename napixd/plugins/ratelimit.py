@@ -3,15 +3,33 @@
 
 """
 Limit the requests launched by users.
+
+The ``algorithm`` setting of a rate limiter selects how the requests are counted:
+
+sliding
+    The default, :class:`RateLimiterPlugin`, a log of the requests of the
+    last *timespan* seconds.
+gcra
+    :class:`GCRARateLimiterPlugin`, the Generic Cell Rate Algorithm in a
+    single Lua script.
+batched
+    :class:`BatchedRateLimiterPlugin`, fixed windows counted in the process
+    and pushed to Redis by batches.
+
+The :class:`ConcurrentLimiterPlugin` limits the number of requests running
+at the same time.
 """
 
 import time
+import math
+import uuid
 import logging
+import threading
 
-from napixd.store import Counter
 from napixd.utils.connection import ConnectionFactory, transaction
 from napixd.http.response import HTTPError, HTTPResponse
 from napixd.conf.lazy import LazyConf
+from napixd.utils import metrics
 
 logger = logging.getLogger('Napix.ratelimit')
 
@@ -52,8 +70,22 @@ class RateLimiterPlugin(LimiterPlugin):
         timespan = settings.get('timespan', type=int)
         con = connection_factory(settings.get('connection'))
         excludes = settings.get_list('excludes')
-        logger.info('Ratelimiting to %s/%ss via %s', max, timespan, con)
-        return cls(max, timespan, con, criteria, excludes)
+        algorithm = settings.get('algorithm', u'sliding', type=unicode)
+        if algorithm not in ALGORITHMS:
+            raise ValueError('Rate limit algorithm must be one of {0}'.format(
+                ', '.join(sorted(ALGORITHMS))))
+
+        limiter_class = ALGORITHMS[algorithm]
+        logger.info('Ratelimiting to %s/%ss via %s with %s', max, timespan, con, algorithm)
+        return limiter_class(max, timespan, con, criteria, excludes,
+                             **limiter_class.get_options(settings))
+
+    @classmethod
+    def get_options(cls, settings):
+        """
+        Returns the keyword arguments specific to this algorithm.
+        """
+        return {}
 
     def __init__(self, max, timespan, con, criteria, excludes):
         super(RateLimiterPlugin, self).__init__(criteria, excludes)
@@ -76,7 +108,7 @@ class RateLimiterPlugin(LimiterPlugin):
         if criteria is None:
             return callback(request)
 
-        used = self.get_rate_used(criteria)
+        used, retry_after = self.get_usage(criteria)
 
         headers = {
             'x-ratelimit-limit': '{0}/{1}s'.format(self._max, self._timespan),
@@ -85,11 +117,24 @@ class RateLimiterPlugin(LimiterPlugin):
         }
 
         if used >= self._max:
+            if retry_after is not None:
+                headers['retry-after'] = retry_after
             logger.warning('Rejecting request of %s, quota maxed', criteria)
+            metrics.registry.counter(
+                'napixd_ratelimit_rejected_total', 'Requests rejected by the rate limiters',
+                limiter='rate').inc()
             return HTTPResponse(429, headers, 'You exceeded your quota')
 
         return HTTPResponse(headers, callback(request))
 
+    def get_usage(self, criteria):
+        """
+        Counts a request of *criteria* and returns the number of requests
+        used and the number of seconds before a request is accepted again,
+        or ``None`` if it is not known.
+        """
+        return self.get_rate_used(criteria), None
+
     def get_rate_used(self, criteria):
         key = 'rate_limit:{0}'.format(criteria)
         period_end = time.time()
@@ -106,21 +151,251 @@ class RateLimiterPlugin(LimiterPlugin):
             pipe.multi()
             pipe.zadd(key, period_end, period_end)
             pipe.expireat(key, int(period_end + self._timespan))
+            pipe.zremrangebyscore(key, '-inf', '({0}'.format(period_start))
             return count
 
         count = run()
         return count
 
 
-class ConcurrentLimiterPlugin(RateLimiterPlugin):
-    def __init__(self, max=2):
-        self.max = max
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local timespan = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+if tat - now + interval > timespan then
+    return {0, tostring(tat - now + interval - timespan)}
+end
+redis.call('SET', KEYS[1], tostring(tat + interval),
+           'PX', math.ceil((tat - now + interval) * 1000))
+return {1, tostring(tat - now)}
+"""
+
+
+class GCRARateLimiterPlugin(RateLimiterPlugin):
+    """
+    Limits the number of requests with the Generic Cell Rate Algorithm.
+
+    The theoretical arrival time of the next request is kept in a single
+    Redis key by criteria and updated by a Lua script, without transaction
+    retries. The requests are spaced by *timespan* / *max* seconds with a
+    burst of *max* requests.
+
+    The denied requests have a *Retry-After* header with the number of
+    seconds before a request is accepted.
+    """
+    def __init__(self, max, timespan, con, criteria, excludes):
+        super(GCRARateLimiterPlugin, self).__init__(max, timespan, con, criteria, excludes)
+        self._interval = float(timespan) / max
+        self._script = con.register_script(GCRA_SCRIPT)
+
+    def get_usage(self, criteria):
+        allowed, delay = self._script(
+            keys=['rate_limit_gcra:{0}'.format(criteria)],
+            args=[repr(time.time()), repr(self._interval), self._timespan])
+        if not allowed:
+            # The delay is the time before the next request is allowed
+            return self._max, max(int(math.ceil(float(delay))), 1)
+        # The delay is the time taken by the previous requests
+        return min(int(math.ceil(float(delay) / self._interval)), self._max - 1), None
+
+    def get_rate_used(self, criteria):
+        return self.get_usage(criteria)[0]
+
+
+class BatchedRateLimiterPlugin(RateLimiterPlugin):
+    """
+    Limits the number of requests by fixed windows of *timespan* seconds.
+
+    The requests are counted in the process and pushed to the shared counter
+    of the window in Redis every *batch* requests. The count used is the last
+    shared count known plus the requests not yet pushed, so each instance may
+    accept up to *batch* - 1 requests over the limit.
+
+    The counters of the previous windows are dropped from the process and
+    expire in Redis.
+    """
+    @classmethod
+    def get_options(cls, settings):
+        return {'batch': settings.get('batch', 10, type=int)}
+
+    def __init__(self, max, timespan, con, criteria, excludes, batch=10):
+        super(BatchedRateLimiterPlugin, self).__init__(max, timespan, con, criteria, excludes)
+        self._batch = batch
+        self._window = None
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get_rate_used(self, criteria):
+        window = int(time.time() // self._timespan)
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._counters.clear()
+
+            # [requests not pushed, last shared count]
+            counter = self._counters.setdefault(criteria, [0, None])
+            pending, shared = counter
+            used = pending + (shared or 0)
+            if used >= self._max:
+                return self._max
+
+            counter[0] = pending = pending + 1
+            if shared is not None and pending < self._batch:
+                return used
+            counter[0] = 0
+
+        shared = self.push(criteria, window, pending)
+        with self._lock:
+            if window == self._window:
+                counter[1] = max(counter[1] or 0, shared)
+        return min(shared - 1, self._max)
+
+    def push(self, criteria, window, count):
+        """
+        Adds *count* requests to the shared counter of the *window* and
+        returns its value.
+        """
+        key = 'rate_limit:{0}:{1}'.format(criteria, window)
+        pipe = self._con.pipeline()
+        pipe.incrby(key, count)
+        pipe.expireat(key, (window + 1) * self._timespan)
+        shared, expire = pipe.execute()
+        return shared
+
+
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local lease = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now + lease, ARGV[4])
+redis.call('PEXPIRE', KEYS[1], math.ceil(lease * 1000))
+return 1
+"""
+
+
+class LocalLeases(object):
+    """
+    Leases of the slots of the concurrent requests kept in the process.
+    """
+    def __init__(self):
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, criteria, token, max, lease):
+        """
+        Takes a slot of *criteria* for *lease* seconds with *token*.
+
+        Returns ``False`` if the *max* slots are already taken.
+        """
+        now = time.time()
+        with self._lock:
+            leases = self._leases.setdefault(criteria, {})
+            for other, expire in leases.items():
+                if expire <= now:
+                    del leases[other]
+            if len(leases) >= max:
+                return False
+            leases[token] = now + lease
+            return True
+
+    def release(self, criteria, token):
+        """
+        Frees the slot of *criteria* taken with *token*.
+        """
+        with self._lock:
+            leases = self._leases.get(criteria)
+            if leases is not None:
+                leases.pop(token, None)
+                if not leases:
+                    del self._leases[criteria]
+
+
+class RedisLeases(object):
+    """
+    Leases of the slots of the concurrent requests shared by the napix
+    instances using the Redis server *con*.
+
+    The leases of a criteria are kept in a sorted set by expiration time.
+    """
+    def __init__(self, con):
+        self._con = con
+        self._acquire = con.register_script(ACQUIRE_SCRIPT)
+
+    def acquire(self, criteria, token, max, lease):
+        return bool(self._acquire(
+            keys=['concurrent_limit:{0}'.format(criteria)],
+            args=[repr(time.time()), lease, max, token]))
+
+    def release(self, criteria, token):
+        self._con.zrem('concurrent_limit:{0}'.format(criteria), token)
+
+
+class ConcurrentLimiterPlugin(LimiterPlugin):
+    """
+    Limits the number of concurrent requests made by users to *max*.
+
+    Each request takes a slot in the *leases* before the callback is called
+    and frees it when it returns. A slot is freed after *lease* seconds even
+    if it was not released, so that the slots of a crashed worker are not
+    lost.
+
+    When all the slots are taken, a 429 status response is returned with
+    a *Retry-After* header of *retry_after* seconds.
+    """
+
+    @classmethod
+    def from_settings(cls, settings, criteria):
+        max = settings.get('max', 2, type=int)
+        lease = settings.get('lease', 300, type=(int, float))
+        retry_after = settings.get('retry_after', 1, type=int)
+        excludes = settings.get_list('excludes')
+        backend = settings.get('backend', u'redis', type=unicode)
+        if backend == 'redis':
+            leases = RedisLeases(connection_factory(settings.get('connection')))
+        elif backend == 'local':
+            leases = LocalLeases()
+        else:
+            raise ValueError('Concurrent limit backend must be "redis" or "local"')
+
+        logger.info('Limiting to %s concurrent requests via %s', max, backend)
+        return cls(max, leases, criteria, excludes, lease, retry_after)
+
+    def __init__(self, max, leases, criteria, excludes, lease=300, retry_after=1):
+        super(ConcurrentLimiterPlugin, self).__init__(criteria, excludes)
+        self._max = max
+        self._leases = leases
+        self._lease = lease
+        self._retry_after = retry_after
 
     def __call__(self, callback, request):
-        with self.get_counter(request) as concurrent:
-            if concurrent > self.max:
-                raise HTTPError(429, 'Too many concurrent connections')
-        return callback(request)
+        criteria = self.get_criteria(request)
+        if criteria is None:
+            return callback(request)
+
+        token = uuid.uuid4().hex
+        if not self._leases.acquire(criteria, token, self._max, self._lease):
+            logger.warning('Rejecting request of %s, too many concurrent requests', criteria)
+            metrics.registry.counter(
+                'napixd_ratelimit_rejected_total', 'Requests rejected by the rate limiters',
+                limiter='concurrent').inc()
+            raise HTTPError(429, 'Too many concurrent requests',
+                            **{'Retry-After': self._retry_after})
+
+        try:
+            return callback(request)
+        finally:
+            self._leases.release(criteria, token)
+
 
-    def get_counter(self, request):
-        return Counter(self.get_criteria(request))
+ALGORITHMS = {
+    'sliding': RateLimiterPlugin,
+    'gcra': GCRARateLimiterPlugin,
+    'batched': BatchedRateLimiterPlugin,
+}
@@ -36,3 +36,25 @@ class WaitPlugin(object):
         if wait > 0:
             time.sleep(wait)
         return resp
+
+
+class LockTimePlugin(object):
+    """
+    Plugin for :mod:`napixd.http` that sends the time spent waiting for the
+    locks of the services and holding them in the headers ``x-lock-wait-time``
+    and ``x-lock-hold-time``.
+
+    The times are recorded by
+    :meth:`napixd.services.requests.base.ServiceRequest.record_lock`.
+    """
+
+    def __call__(self, callback, request):
+        resp = callback(request)
+        environ = request.environ
+        if 'napixd.lock.wait' not in environ:
+            return resp
+
+        return HTTPResponse({
+            'x-lock-wait-time': environ['napixd.lock.wait'],
+            'x-lock-hold-time': environ['napixd.lock.hold'],
+        }, resp)
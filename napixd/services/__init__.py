@@ -16,7 +16,7 @@ from napixd.services.collection import (
     FirstCollectionService,
     CollectionService
 )
-from napixd.services.lock import LockFactory
+from napixd.services.lock import LockFactory, StripedServiceLock
 from napixd.services.served import (
     FirstServedManager,
     ServedManager,
@@ -72,6 +72,13 @@ class Service(object):
         self._collection_services[namespaces] = service
         self._create_collection_service(collection, namespaces, service, 0)
 
+        if isinstance(self.lock, StripedServiceLock):
+            for collection_service in self._collection_services.values():
+                if collection_service.collection.saves_collection:
+                    logger.warning('%s saves the whole collection, its writes '
+                                   'acquire all the stripes of the lock',
+                                   collection_service.collection.__name__)
+
     def get_collection_service(self, aliases):
         """
         Gets a :class:`collection.CollectionService` instance for the manager
@@ -12,6 +12,7 @@ from napixd.services.requests import (
     ServiceActionRequest
 )
 from napixd.services.contexts import CollectionContext
+from napixd.utils.cache import LoadCache
 
 __all__ = (
     'BaseCollectionService',
@@ -37,6 +38,11 @@ class BaseCollectionService(object):
 
         The :class:`~napixd.services.urls.URL` where the
         requests on the resource are served
+
+    .. attribute:: metrics_labels
+
+        The labels of the metrics of the requests on this manager:
+        the ``service`` and the template of the ``collection`` URL.
     """
 
     def __init__(self, served_manager, url):
@@ -46,6 +52,10 @@ class BaseCollectionService(object):
         self.collection_url = url
         self.resource_url = self.collection_url.add_variable()
         self.lock = served_manager.lock
+        self.metrics_labels = {
+            'service': url.segments[0] if url.segments else u'',
+            'collection': unicode(url),
+        }
 
         self.all_actions = [
             ActionService(self, action)
@@ -181,21 +191,70 @@ class CollectionService(BaseCollectionService):
 
     *previous_service* is the :class:`CollectionService` or the
     :class:`FirstCollectionService` of the parent manager.
+
+    When the configuration of the manager has a ``parent_cache_ttl`` key,
+    the parent resources are kept for this many seconds between the requests.
+    The parent resources modified in the meantime are stale until the
+    expiration.
+
+    .. attribute:: parents_cache
+
+        The :class:`napixd.utils.cache.LoadCache` of the parent resources
+        by path or ``None`` if they are not cached.
     """
 
     def __init__(self, previous_service, served_manager, url):
         super(CollectionService, self).__init__(served_manager, url)
         self.previous_service = previous_service
 
-    def get_manager(self, path, call_context):
-        served_manager = self.previous_service.get_manager(path[:-1], call_context)
+        ttl = served_manager.configuration.get('parent_cache_ttl', None, type=(int, float))
+        self.parents_cache = LoadCache(ttl) if ttl else None
 
-        served_manager.validate_id(path[-1])
-        wrapped = served_manager.get_resource()
+    def get_manager(self, path, call_context):
+        wrapped = self.get_parent(path, call_context)
 
         # The manager for self is generated here.
         return super(CollectionService, self).get_manager(wrapped, call_context)
 
+    def get_parent(self, path, call_context):
+        """
+        Returns the :class:`~napixd.services.wrapper.ResourceWrapper` of the
+        parent resource at *path*.
+
+        The parent is resolved once by request and stored in the
+        :attr:`~napixd.services.contexts.NapixdContext.resolved` memo shared
+        by the sibling managers.
+        """
+        resolved = getattr(call_context, 'resolved', None)
+        key = (self.previous_service, tuple(path))
+        if resolved is not None and key in resolved:
+            return resolved[key]
+
+        served_manager = self.previous_service.get_manager(path[:-1], call_context)
+        if self.parents_cache is None:
+            served_manager.validate_id(path[-1])
+            wrapped = served_manager.get_resource()
+        else:
+            wrapped = self._get_cached_parent(served_manager, path)
+
+        if resolved is not None:
+            resolved[key] = wrapped
+        return wrapped
+
+    def _get_cached_parent(self, served_manager, path):
+        loaded = []
+
+        def load():
+            served_manager.validate_id(path[-1])
+            wrapped = served_manager.get_resource()
+            loaded.append(wrapped)
+            return wrapped.id, wrapped.resource
+
+        id, resource = self.parents_cache.get(tuple(path), load)
+        if loaded:
+            return loaded[0]
+        return served_manager.set_resource(id, resource)
+
 
 class ActionService(object):
     """
@@ -208,10 +267,12 @@ class ActionService(object):
 
     def __init__(self, collection_service, served_action):
         self.service = collection_service
+        self.collection = collection_service.collection
         self.action = served_action.name
         self.url = self.service.resource_url.add_segment('_napix_action').add_segment(served_action.name)
         self.meta_data = served_action.meta_data
         self.lock = served_action.lock
+        self.metrics_labels = collection_service.metrics_labels
 
     def setup_bottle(self, app):
         app.route(unicode(self.url.add_segment('_napix_help')), self.as_help)
@@ -12,7 +12,8 @@ managers and factories to get a manager or a resource from a
 """
 
 from napixd.services.requests.resource import (
-    FetchResource
+    FetchResource,
+    FetchResources,
 )
 from napixd.services.wrapper import ResourceWrapper
 
@@ -44,6 +45,16 @@ class NapixdContext(object):
     .. attribute:: parameters
 
         The parameters of the request. The GET of the *requet* is used by default.
+
+    .. attribute:: resolved
+
+        A memo of the parent resources resolved during the request, see
+        :meth:`napixd.services.collection.CollectionService.get_parent`.
+
+    .. attribute:: fetched
+
+        The resources fetched by URL during the request, see
+        :meth:`CollectionContext.get_resource`.
     """
     def __init__(self, napixd, request):
         self.request = request
@@ -51,6 +62,8 @@ class NapixdContext(object):
         self.method = request.method
         self.parameters = request.GET
         self.data = request.data
+        self.resolved = {}
+        self.fetched = {}
 
     def get_service(self, service):
         """
@@ -108,29 +121,70 @@ class CollectionContext(object):
         cs = service.get_collection_service(namespaces)
         return cs
 
+    def _get_fetched(self):
+        fetched = getattr(self.napixd, 'fetched', None)
+        return {} if fetched is None else fetched
+
+    def _split_url(self, url):
+        path = url.split('/')
+        if path[0] != '':
+            raise ValueError('get_resource is called with a path starting by a "/"')
+        if path[-1] == '':
+            raise ValueError('get_resource is called with a path not ending with a "/"')
+
+        # Takes the name segments and all the ID segments
+        return path[1::2], path[2::2]
+
     def get_resource(self, url):
         """
         Fetches the resource at *url*.
         URL is a resource URL starting and not ending with a **/**.
 
+        The resource is fetched once by request, the next calls with the same
+        *url* return the same :class:`~napixd.services.wrapper.ResourceWrapper`.
+
         This method will raise :exc:`napixd.exceptions.InternalRequestFailed`
         if there is no resource at this URL.
         """
-        path = url.split('/')
-        if path[0] != '':
-            raise ValueError('get_resource is called with a path starting by a "/"')
-        if path[-1] == '':
-            raise ValueError('get_resource is called with a path not ending with a "/"')
+        fetched = self._get_fetched()
+        if url in fetched:
+            return fetched[url]
 
-        # Takes the name segments
-        managers = path[1::2]
-        # Takes all the ID segments
-        ids = path[2::2]
+        managers, ids = self._split_url(url)
         cs = self.get_collection_service(managers)
 
         resource = FetchResource(
             CollectionContext(cs, self.napixd, method='GET'), ids)
-        return resource.handle()
+        fetched[url] = resource = resource.handle()
+        return resource
+
+    def get_resources(self, urls):
+        """
+        Fetches the resources at each of the *urls* and returns them
+        in the same order.
+
+        The URLs of the same collection are fetched together by a
+        :class:`~napixd.services.requests.resource.FetchResources`.
+        Like :meth:`get_resource`, each URL is fetched once by request.
+        """
+        fetched = self._get_fetched()
+        by_collection = {}
+        for url in urls:
+            if url in fetched:
+                continue
+            managers, ids = self._split_url(url)
+            batch = by_collection.setdefault(tuple(managers), {})
+            batch[url] = ids
+
+        for managers, batch in by_collection.items():
+            cs = self.get_collection_service(list(managers))
+            batch_urls = list(batch)
+            resources = FetchResources(
+                CollectionContext(cs, self.napixd, method='GET'),
+                [batch[url] for url in batch_urls]).handle()
+            fetched.update(zip(batch_urls, resources))
+
+        return [fetched[url] for url in urls]
 
 
 class maybe(object):
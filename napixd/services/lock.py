@@ -1,26 +1,227 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+"""
+The locks of the services.
+
+The ``Lock`` section of the configuration of a manager defines the lock
+acquired by the requests on the service.
+
+name
+    The name of the lock, shared by the services and the napix instances
+    using the same Redis server.
+backend
+    ``redis``, the default, shares the lock with the other napix instances
+    using the same Redis server. ``local`` keeps the lock inside the process,
+    see :class:`napixd.utils.lock.LocalLock`.
+shared_reads
+    When true, the GET and HEAD requests share the lock and only the other
+    methods are exclusive, see :class:`napixd.utils.lock.ReadWriteLock`.
+stripes
+    The number of locks to spread the requests by id of resource.
+    The requests on a resource and its sub-resources acquire only one of
+    those locks, whereas the requests on the collection acquire all of them.
+    The stripes are always acquired in the same order, see
+    :class:`StripedServiceLock`. The writes on a manager that saves the whole
+    collection acquire all the stripes, see
+    :attr:`napixd.managers.base.Manager.saves_collection`.
+"""
+
+import zlib
+import threading
 
 from napixd.conf.lazy import LazyConf
-from napixd.utils.lock import Lock
+from napixd.utils.lock import (
+    Lock,
+    ReadWriteLock,
+    LocalLock,
+    LocalReadWriteLock,
+    Timeout,
+)
 from napixd.utils.connection import ConnectionFactory
 
 __all__ = [
     'LockFactory',
+    'ServiceLock',
+    'StripedServiceLock',
+    'StripesLock',
 ]
 
 cf = ConnectionFactory(LazyConf('lock'))
 
 
+def _select(lock, write):
+    if isinstance(lock, ReadWriteLock):
+        return lock.write if write else lock.read
+    return lock
+
+
+class ServiceLock(object):
+    """
+    Selects the lock acquired by a request on a service.
+
+    *lock* is a :class:`napixd.utils.lock.Lock` or a
+    :class:`napixd.utils.lock.ReadWriteLock`.
+    """
+    def __init__(self, lock):
+        self.lock = lock
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, self.lock.name)
+
+    def get(self, key, write):
+        """
+        Returns the lock for a request on the resource *key* of the first
+        manager, or on the collection if *key* is ``None``.
+
+        *write* is True when the request may modify the resources.
+        """
+        return _select(self.lock, write)
+
+
+class StripedServiceLock(ServiceLock):
+    """
+    Spreads the requests on the *stripes* by the id of the resource.
+
+    The ids are dispatched by their CRC32 in order to share the same stripes
+    across the instances.
+
+    The stripes are acquired by increasing index. The stripes already held by
+    the current thread are acquired again, as the locks are reentrant. A
+    nested request needing a stripe of a lower index than a stripe held by the
+    thread would break the order and may deadlock with an other request: the
+    stripe is only tried and a :exc:`napixd.utils.lock.Timeout` is raised
+    when it is not available.
+    """
+    def __init__(self, stripes):
+        self.stripes = list(stripes)
+        self._local = threading.local()
+
+    def __repr__(self):
+        return '<{0} {1} stripes>'.format(self.__class__.__name__, len(self.stripes))
+
+    def _held(self):
+        try:
+            return self._local.held
+        except AttributeError:
+            held = self._local.held = {}
+            return held
+
+    def get(self, key, write):
+        if key is None:
+            return StripesLock(self, range(len(self.stripes)), write)
+
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        index = (zlib.crc32(str(key)) & 0xffffffff) % len(self.stripes)
+        return StripesLock(self, [index], write)
+
+
+class StripesLock(object):
+    """
+    The lock of the stripes at *indexes* of a :class:`StripedServiceLock`.
+
+    It has the same interface as a :class:`napixd.utils.lock.Lock`.
+    """
+    def __init__(self, striped, indexes, write):
+        self.striped = striped
+        self.indexes = sorted(indexes)
+        self.locks = [_select(striped.stripes[index], write)
+                      for index in self.indexes]
+        self.name = '+'.join(getattr(lock, 'name', '?') for lock in self.locks)
+        self._acquired = []
+
+    def __repr__(self):
+        return '<{0} of {1}>'.format(self.__class__.__name__, self.name)
+
+    def acquire(self, blocking=True, timeout=5):
+        """
+        Acquires the stripes, see :meth:`napixd.utils.lock.Lock.acquire`.
+        """
+        held = self.striped._held()
+        highest = max(held) if held else -1
+        acquired = []
+        try:
+            for index, lock in zip(self.indexes, self.locks):
+                in_order = index in held or index > highest
+                if not lock.acquire(blocking and in_order, timeout):
+                    if blocking:
+                        raise Timeout('Stripe {0} is not available'.format(index))
+                    break
+                held[index] = held.get(index, 0) + 1
+                acquired.append((index, lock))
+            else:
+                self._acquired = acquired
+                return self
+        except Exception:
+            self._release(acquired)
+            raise
+
+        self._release(acquired)
+        return self
+
+    def _release(self, acquired):
+        held = self.striped._held()
+        for index, lock in reversed(acquired):
+            lock.release()
+            held[index] -= 1
+            if not held[index]:
+                del held[index]
+
+    def release(self):
+        """
+        Releases the stripes.
+        """
+        acquired, self._acquired = self._acquired, []
+        self._release(acquired)
+        return self
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+
+    def __nonzero__(self):
+        return bool(self._acquired)
+
+
 class LockFactory(object):
-    def __init__(self, connection_factory=None, lock_class=Lock):
+    def __init__(self, connection_factory=None, lock_class=Lock,
+                 rw_lock_class=ReadWriteLock, local_lock_class=LocalLock,
+                 local_rw_lock_class=LocalReadWriteLock):
         self._lock_cls = lock_class
+        self._rw_lock_cls = rw_lock_class
+        self._local_lock_cls = local_lock_class
+        self._local_rw_lock_cls = local_rw_lock_class
         self._con_fac = (connection_factory
                          if connection_factory is not None
                          else cf)
 
     def __call__(self, conf):
         name = conf.get('name', type=unicode)
-        con = self._con_fac(conf)
-        return self._lock_cls(name, con)
+        backend = conf.get('backend', u'redis', type=unicode)
+        shared_reads = conf.get('shared_reads', False, type=bool)
+        stripes = conf.get('stripes', 1, type=int)
+        if stripes < 1:
+            raise ValueError('Lock stripes must be a positive number')
+
+        if backend == 'redis':
+            con = self._con_fac(conf)
+            lock_cls = self._rw_lock_cls if shared_reads else self._lock_cls
+            make = lambda lock_name: lock_cls(lock_name, con)
+        elif backend == 'local':
+            lock_cls = self._local_rw_lock_cls if shared_reads else self._local_lock_cls
+            make = lock_cls
+        else:
+            raise ValueError('Lock backend must be "redis" or "local"')
+
+        if stripes == 1 and not shared_reads:
+            return make(name)
+        if stripes == 1:
+            return ServiceLock(make(name))
+
+        return StripedServiceLock(
+            make(u'{0}:{1}'.format(name, i))
+            for i in range(stripes))
@@ -1,6 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from napixd.chrono import get_timings, null_timings
+from napixd.utils.lock import InstrumentedLock
+from napixd.services.lock import ServiceLock
+from napixd.services.transaction import Transaction
+
 
 class ServiceRequest(object):
     """
@@ -9,6 +14,10 @@ class ServiceRequest(object):
     The object handles the request for the *path* given on the *context*.
     *context* is an instance of :class:`napixd.services.collection.CollectionContext`.
     *path* is a list of **escaped strings** which are used as *id* for the managers.
+
+    .. attribute:: timings
+
+        The :class:`napixd.chrono.Timings` of the HTTP request.
     """
 
     def __init__(self, context, path):
@@ -18,6 +27,9 @@ class ServiceRequest(object):
         self.path = list(path)
         self.lock = self.service.lock
 
+        request = getattr(context, 'request', None)
+        self.timings = get_timings(request.environ) if request is not None else null_timings
+
     def check_datas(self):
         """
         Filter and check the collection fields.
@@ -31,7 +43,8 @@ class ServiceRequest(object):
         """
         Retreive the manager associated with the current request
         """
-        manager = self.context.get_manager_instance(self.path if path is None else path)
+        with self.timings('manager'):
+            manager = self.context.get_manager_instance(self.path if path is None else path)
         return manager
 
     def call(self):
@@ -52,28 +65,78 @@ class ServiceRequest(object):
     def get_callback(self):
         raise NotImplementedError
 
+    def get_lock(self):
+        """
+        Returns the lock acquired during the request or ``None``.
+
+        When the lock of the service is a :class:`napixd.services.lock.ServiceLock`,
+        the lock depends on the first id of the :attr:`path` and on the method:
+        the ``GET`` and ``HEAD`` requests only read the resources.
+        The writes on a manager that
+        :attr:`~napixd.managers.base.Manager.saves_collection` lock the
+        whole collection.
+        """
+        if not isinstance(self.lock, ServiceLock):
+            return self.lock
+
+        write = self.context.method not in ('GET', 'HEAD')
+        if write and self.service.collection.saves_collection:
+            key = None
+        else:
+            key = self.path[0] if self.path else None
+        return self.lock.get(key, write)
+
+    def record_lock(self, lock):
+        """
+        Adds the time waiting for and holding the *lock* to the
+        ``napixd.lock.wait`` and ``napixd.lock.hold`` keys of the environ
+        of the request.
+        """
+        request = getattr(self.context, 'request', None)
+        if request is None:
+            return
+        environ = request.environ
+        environ['napixd.lock.wait'] = environ.get('napixd.lock.wait', 0) + lock.wait
+        environ['napixd.lock.hold'] = environ.get('napixd.lock.hold', 0) + lock.hold
+
     def handle(self):
         """
         Calls the request.
         This method takes care of acquiring the lock and releasing it.
 
+        The usage of the lock is recorded by an
+        :class:`napixd.utils.lock.InstrumentedLock` and :meth:`record_lock`.
+
+        The request runs in a :class:`napixd.services.transaction.Transaction`
+        set as the ``transaction`` of the :attr:`context`. It is committed
+        before the lock is released.
+
         .. warning::
 
             When this method is overriden, the locking is not enforced.
         """
-        lock = self.lock.acquire() if self.lock else None
+        lock = self.get_lock()
+        if lock is not None:
+            with self.timings('lock'):
+                lock = InstrumentedLock(lock).acquire()
 
         try:
-            # obtient l'object designé
-            self.manager = self.get_manager()
-
-            # recupère la vue qui va effectuer la requete
-            self.callback = self.get_callback()
-            # recupère les données valides pour cet objet
-            self.data = self.check_datas()
-            # recupere les arguments a passer a cette vue
-            result = self.call()
+            with Transaction() as transaction:
+                self.context.transaction = transaction
+
+                # obtient l'object designé
+                self.manager = self.get_manager()
+
+                # recupère la vue qui va effectuer la requete
+                self.callback = self.get_callback()
+                # recupère les données valides pour cet objet
+                with self.timings('check'):
+                    self.data = self.check_datas()
+                # recupere les arguments a passer a cette vue
+                with self.timings('call'):
+                    result = self.call()
             return result
         finally:
             if lock is not None:
                 lock.release()
+                self.record_lock(lock)
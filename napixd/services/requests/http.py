@@ -4,6 +4,7 @@
 
 from napixd.exceptions import NotFound, ValidationError, Duplicate
 from napixd.http.response import HTTPError, HTTP405
+from napixd.utils import metrics
 
 
 class MethodMixin(object):
@@ -79,10 +80,24 @@ class HTTPMixin(object):
         Handle the request and calls :meth:`serialize` on the request.
 
         It catches errors thrown by the managers and translate them in HTTP status codes.
+
+        The requests being handled are counted by the ``napixd_requests_in_flight``
+        gauge and the :attr:`~napixd.services.collection.BaseCollectionService.metrics_labels`
+        of the service are stored in the ``napixd.metrics.labels`` key of the environ
+        for :class:`napixd.plugins.metrics.MetricsMiddleware`.
         """
+        labels = self.service.metrics_labels
+        request = getattr(self.context, 'request', None)
+        if request is not None:
+            request.environ.setdefault('napixd.metrics.labels', labels)
+
+        in_flight = metrics.registry.gauge(
+            'napixd_requests_in_flight', 'Requests being handled by the services', **labels)
+        in_flight.inc()
         try:
             result = super(HTTPMixin, self).handle()
-            return self.serialize(result)
+            with self.timings('serialize'):
+                return self.serialize(result)
         except ValidationError as e:
             raise HTTPError(400, dict(e))
         except NotFound as e:
@@ -90,6 +105,8 @@ class HTTPMixin(object):
         except Duplicate as e:
             raise HTTPError(409, u'`{0}` already exists'.format(
                 unicode(e) or u'object'))
+        finally:
+            in_flight.dec()
 
     def serialize(self, result):
         """
@@ -27,9 +27,11 @@ class ServiceResourceRequest(ServiceRequest):
         served_manager = super(ServiceResourceRequest, self).get_manager(self.path[:-1])
 
         # verifie l'identifiant de la resource aussi
-        resource_id = served_manager.validate_id(resource_id)
+        with self.timings('validate'):
+            resource_id = served_manager.validate_id(resource_id)
 
-        self.resource = served_manager.get_resource()
+        with self.timings('fetch'):
+            self.resource = served_manager.get_resource()
         return served_manager.manager
 
 
@@ -182,6 +184,39 @@ class FetchResource(ServiceResourceRequest):
             raise InternalRequestFailed(e)
 
 
+class FetchResources(FetchResource):
+    """
+    :class:`ServiceResourceRequest` for the internal requests passed through
+    :meth:`napixd.services.contexts.CollectionContext.get_resources`.
+
+    It fetches the resources at each of the *paths* of the same collection
+    under a single acquisition of the lock. The manager is instantiated once
+    for the resources sharing the same parent.
+    """
+    def __init__(self, context, paths):
+        super(FetchResources, self).__init__(context, [])
+        self.paths = paths
+
+    def get_manager(self):
+        return None
+
+    def call(self):
+        served_managers = {}
+        resources = []
+        for path in self.paths:
+            parent = tuple(path[:-1])
+            if parent not in served_managers:
+                served_managers[parent] = self.context.get_manager_instance(list(parent))
+            served_manager = served_managers[parent]
+
+            try:
+                served_manager.validate_id(path[-1])
+                resources.append(served_manager.get_resource())
+            except (ValidationError, NotFound) as e:
+                raise InternalRequestFailed(e)
+        return resources
+
+
 class HTTPServiceManagedClassesRequest(HTTPMixin, ServiceResourceRequest):
     """
     The :class:`ServiceRequest` class for the listing of the managed classes
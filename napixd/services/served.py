@@ -196,5 +196,16 @@ class ServedManagerInstance(object):
         self._resource_context.resource = wrapped
         return wrapped
 
+    def set_resource(self, id, resource):
+        """
+        Sets the :attr:`napixd.services.contexts.ResourceContext.id` and the
+        :attr:`napixd.services.contexts.ResourceContext.resource` with an *id*
+        and a *resource* already known, without calling the manager.
+        """
+        self._resource_context.id = id
+        wrapped = self._resource_context.make_resource(resource)
+        self._resource_context.resource = wrapped
+        return wrapped
+
     def __repr__(self):
         return 'SMI of {self._resource_context}'.format(self=self)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Unit of work of the requests.
+"""
+
+from napixd.utils.undo import UndoManager
+
+__all__ = [
+    'Transaction',
+]
+
+
+class Transaction(object):
+    """
+    A unit of work spanning a request.
+
+    The :class:`napixd.services.requests.base.ServiceRequest` creates a
+    transaction for each request and makes it available to the managers as
+    the ``transaction`` attribute of their
+    :attr:`~napixd.managers.Manager.napix_context`.
+
+    The managers :meth:`defer` the persistence of their changes and
+    :meth:`register` the callbacks cancelling the changes. At the end of the
+    request, the deferred callbacks are called once each in the order they
+    have been deferred. If the request fails or a deferred callback fails,
+    the registered callbacks are called by an
+    :class:`~napixd.utils.undo.UndoManager`.
+    """
+    def __init__(self):
+        self.undo_manager = UndoManager()
+        self._deferred = []
+        self._deferred_keys = set()
+
+    def register(self, callback):
+        """
+        Registers a *callback* to cancel a change.
+        """
+        return self.undo_manager.register(callback)
+
+    def defer(self, key, callback):
+        """
+        Defers the call of *callback* at the end of the transaction.
+
+        The callback is called only once for a given *key*.
+        """
+        if key in self._deferred_keys:
+            return
+        self._deferred_keys.add(key)
+        self._deferred.append(callback)
+
+    def commit(self):
+        """
+        Calls the deferred callbacks.
+        """
+        deferred, self._deferred = self._deferred, []
+        self._deferred_keys.clear()
+        for callback in deferred:
+            callback()
+
+    def rollback(self):
+        """
+        Calls the registered callbacks to cancel the changes.
+        """
+        self._deferred = []
+        self._deferred_keys.clear()
+        self.undo_manager.undo()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if exception_type is not None:
+            self.rollback()
+            return
+
+        try:
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+In-process caches shared between the requests.
+"""
+
+import sys
+import copy
+import time
+import logging
+import threading
+
+from napixd.utils import metrics
+
+__all__ = ('LoadCache', 'LRUCache', 'SingleFlight')
+
+logger = logging.getLogger('Napix.cache')
+
+PREV, NEXT, KEY, VALUE, EXPIRE = range(5)
+
+
+class LoadCache(object):
+    """
+    A cache of values computed by a loading function.
+
+    The values are stored by key. An entry is valid for *ttl* seconds, or
+    indefinitely when *ttl* is ``None``, and as long as the *version* given
+    to :meth:`get` is the same as the version stored with the entry.
+
+    Concurrent calls to :meth:`get` for the same missing key and version are
+    coalesced by a :class:`SingleFlight`: only the first caller runs the
+    loading function and the others share its result, or raise a copy of its
+    exception.
+
+    >>> cache = LoadCache(ttl=10)
+    >>> cache.get('key', lambda: expensive_load())
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._entries = {}
+        self._flights = SingleFlight()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _valid(self, entry, version):
+        value, expire, entry_version = entry
+        if entry_version != version:
+            return False
+        return expire is None or time.time() < expire
+
+    def get(self, key, load, version=None):
+        """
+        Returns the value for *key*.
+
+        If there is no valid value in the cache, *load* is called without
+        arguments and its return value is stored with *version*. The *version*
+        must be hashable.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and self._valid(entry, version):
+            return entry[0]
+
+        value, saved = self._flights.do((key, version),
+                                        lambda: self._load(key, load, version))
+        return value
+
+    def _load(self, key, load, version):
+        # A flight may have stored the value since the first check
+        entry = self._entries.get(key)
+        if entry is not None and self._valid(entry, version):
+            return entry[0]
+
+        value = load()
+        self.set(key, value, version)
+        return value
+
+    def set(self, key, value, version=None):
+        """
+        Stores *value* at *key* with *version*.
+        """
+        expire = time.time() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (value, expire, version)
+
+    def invalidate(self, key):
+        """
+        Removes the entry for *key*.
+        """
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        self._entries.clear()
+
+
+class LRUCache(object):
+    """
+    A cache keeping at most *size* values and evicting the least
+    recently used.
+
+    Each value is stored with its own time to live. When *stale* is set, the
+    values expired for less than *stale* seconds are still returned by
+    :meth:`get` while they are reloaded in a background thread.
+
+    When the cache has a *name*, its hits, stale hits and misses are counted
+    in the ``napixd_cache_requests_total`` metric.
+
+    >>> cache = LRUCache(size=1000, stale=5, name='auth')
+    >>> cache.get('key', lambda: expensive_load(), ttl=10)
+    """
+    def __init__(self, size=1000, stale=0, name=None):
+        self.size = size
+        self.stale = stale
+        self.name = name
+        self._entries = {}
+        self._root = root = []
+        root[:] = [root, root, None, None, None]
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _unlink(self, link):
+        previous, next = link[PREV], link[NEXT]
+        previous[NEXT] = next
+        next[PREV] = previous
+
+    def _append(self, link):
+        root = self._root
+        last = root[PREV]
+        link[PREV] = last
+        link[NEXT] = root
+        last[NEXT] = root[PREV] = link
+
+    def _record(self, result):
+        if self.name is not None:
+            metrics.registry.counter(
+                'napixd_cache_requests_total', 'Lookups in the caches',
+                cache=self.name, result=result).inc()
+
+    def get(self, key, load, ttl=None):
+        """
+        Returns the value for *key*.
+
+        If there is no valid value in the cache, *load* is called without
+        arguments and its return value is stored for *ttl* seconds.
+
+        *ttl* is a number of seconds, ``None`` for values that do not expire,
+        or a function returning the time to live of the value it is called
+        with.
+        """
+        with self._lock:
+            link = self._entries.get(key)
+            if link is not None:
+                self._unlink(link)
+                self._append(link)
+                value, expire = link[VALUE], link[EXPIRE]
+
+        if link is not None:
+            now = time.time()
+            if expire is None or now < expire:
+                self._record('hit')
+                return value
+            if now < expire + self.stale:
+                self._record('stale')
+                self._refresh(key, load, ttl)
+                return value
+
+        self._record('miss')
+        value = load()
+        self.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores *value* at *key* for *ttl* seconds.
+
+        *ttl* is the same as for :meth:`get`. The value is not stored when its
+        time to live is 0.
+        """
+        if callable(ttl):
+            ttl = ttl(value)
+        if ttl is not None and ttl <= 0:
+            return
+        expire = time.time() + ttl if ttl is not None else None
+
+        with self._lock:
+            link = self._entries.get(key)
+            if link is not None:
+                self._unlink(link)
+            else:
+                link = self._entries[key] = [None, None, key, None, None]
+            link[VALUE] = value
+            link[EXPIRE] = expire
+            self._append(link)
+
+            while len(self._entries) > self.size:
+                oldest = self._root[NEXT]
+                self._unlink(oldest)
+                del self._entries[oldest[KEY]]
+
+    def _refresh(self, key, load, ttl):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        thread = threading.Thread(target=self._reload, args=(key, load, ttl))
+        thread.daemon = True
+        thread.start()
+
+    def _reload(self, key, load, ttl):
+        try:
+            self.set(key, load(), ttl)
+        except Exception:
+            logger.exception('Failed to refresh %s', key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def invalidate(self, key):
+        """
+        Removes the entry for *key*.
+        """
+        with self._lock:
+            link = self._entries.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            root = self._root
+            root[:] = [root, root, None, None, None]
+
+
+class _Flight(object):
+    def __init__(self):
+        self.start = time.time()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _copy_error(error):
+    """
+    Returns a copy of the exception *error*, so that the calls raising it do
+    not share the attributes they may alter, like the headers of a
+    :class:`napixd.http.response.HTTPError`.
+    """
+    try:
+        attributes = copy.deepcopy(error.__dict__)
+    except Exception:
+        return error
+    copied = error.__class__.__new__(error.__class__, *error.args)
+    copied.args = error.args
+    copied.__dict__.update(attributes)
+    return copied
+
+
+class SingleFlight(object):
+    """
+    Coalesces the concurrent calls for the same key.
+
+    While a call for a key is running, the other calls for this key wait
+    for it and share its result instead of running. When the call fails,
+    each waiting call raises its own copy of the exception.
+
+    The threads wait on :class:`threading.Event`, that also work with
+    the greenlets when gevent is monkey-patched.
+
+    >>> flights = SingleFlight()
+    >>> result, saved = flights.do('key', lambda: expensive_call())
+    """
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, function):
+        """
+        Calls *function* without arguments, unless a call for *key* is
+        already running.
+
+        Returns the result and ``None`` for the call that ran *function*, or
+        the time in seconds that the running call had already spent when the
+        waiting call joined it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            saved = time.time() - flight.start
+            flight.event.wait()
+            if flight.error is not None:
+                error_class, error, traceback = flight.error
+                raise error_class, _copy_error(error), traceback
+            return flight.result, saved
+
+        try:
+            flight.result = function()
+        except BaseException:
+            flight.error = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+        return flight.result, None
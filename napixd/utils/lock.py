@@ -22,18 +22,88 @@ server, feeding the first to wait in first.
 
 The control key, determine if a lock does not exists or if its an empty list,
 meaning a held lock.
+
+The acquisition creates the control key if it does not exist and pops the
+list in a single transaction. The client creating the control key holds the
+lock. The control key expires with the holder, so that a lock held by a dead
+process is created again by the next client. The value of the control key is a
+random token identifying the holder. The release checks that the control key
+still holds its token, makes it persistent and pushes in the list in a single
+Lua script, so that a holder releasing after its expiration does not free the
+lock of the next holder.
+
+A :class:`ReadWriteLock` adds a sorted set of the readers and a list where the
+last reader notifies the writer waiting for the readers to finish. Each reader
+is a random token scored by its expiration time, so that a dead reader does
+not block the writers for more than its expiration and a late release does
+not remove an other reader.
+
+
+In-process locks
+----------------
+
+The :class:`LocalLock` and :class:`LocalReadWriteLock` have the same
+semantics inside a single process, without a Redis server. The locks with the
+same name share a state made of a :class:`threading.Condition` and the
+expiration of the current holder.
 """
 
 import time
+import math
+import uuid
 import functools
 import threading
 
-__all__ = ('synchronized', 'Lock', 'Timeout')
+from napixd.utils import metrics
+
+__all__ = (
+    'synchronized',
+    'Lock',
+    'Timeout',
+    'ReadWriteLock',
+    'MultiLock',
+    'LocalLock',
+    'LocalReadWriteLock',
+    'InstrumentedLock',
+)
 
 # The prefix for all the redis lists
 PREFIX = 'napixd:locks:queues:'
 # The prefix for all redis values that control the existense of the queues
 CONTROL_PREFIX = 'napixd:locks:control:'
+# The prefix for the sorted sets of readers
+READERS_PREFIX = 'napixd:locks:readers:'
+# The prefix for the lists where the writers wait for the readers
+DRAINED_PREFIX = 'napixd:locks:drained:'
+
+# Releases the lock held by the token ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PERSIST', KEYS[1])
+    redis.call('RPUSH', KEYS[2], 1)
+    return 1
+end
+return 0
+"""
+
+# Adds the reader ARGV[2] expiring at ARGV[1]
+ADD_READER_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+"""
+
+# Removes the reader ARGV[2] and the readers expired at ARGV[1] and notifies
+# the writer if no reader remains
+RELEASE_READER_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('RPUSH', KEYS[2], 1)
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return 1
+end
+return 0
+"""
 
 
 def synchronized(lock):
@@ -149,17 +219,19 @@ class Lock(object):
         self._owner = None
         self._acquired = 0
         self._acquired_until = None
+        self._token = None
+        self._release_script = conn.register_script(RELEASE_SCRIPT)
 
     def _clean(self):
         self.conn.delete(self.key)
         self.conn.delete(self.control)
 
-    def _init_lock(self, pipe):
-        if not pipe.exists(self.control):
-            pipe.multi()
-            pipe.delete(self.key)
-            pipe.rpush(self.key, 1)
-            pipe.set(self.control, 1)
+    def _try_acquire(self, token):
+        pipe = self.conn.pipeline()
+        pipe.set(self.control, token, nx=True, px=int(self.expire * 1000))
+        pipe.rpop(self.key)
+        created, acquired = pipe.execute()
+        return bool(created), acquired is not None
 
     def acquire(self, blocking=True, timeout=5):
         """
@@ -194,20 +266,22 @@ class Lock(object):
             self._acquired += 1
             return self
 
-        self.conn.transaction(self._init_lock, self.control)
-        if blocking:
-            acquired = self.conn.brpop(self.key, timeout=int(timeout))
-        else:
-            acquired = self.conn.rpop(self.key)
-
-        if acquired is None:
-            if blocking:
+        token = uuid.uuid4().hex
+        # The expiration starts at the latest when the command is received
+        start = time.time()
+        created, acquired = self._try_acquire(token)
+        if not created and not acquired and blocking:
+            acquired = self.conn.brpop(self.key, timeout=max(1, int(timeout))) is not None
+            if not acquired:
                 raise Timeout()
-        else:
-            self._owner = threading.current_thread()
-            self._acquired_until = until = time.time() + self.expire
-            self.conn.expireat(self.key, int(until))
 
+        if created or acquired:
+            if not created:
+                start = time.time()
+                self.conn.set(self.control, token, px=int(self.expire * 1000))
+            self._owner = threading.current_thread()
+            self._token = token
+            self._acquired_until = start + self.expire
             self._acquired += 1
         return self
 
@@ -232,8 +306,9 @@ class Lock(object):
         self._acquired -= 1
         if self._acquired == 0:
             self._owner = None
+            token, self._token = self._token, None
             if time.time() < self._acquired_until:
-                self.conn.rpush(self.key, 1)
+                self._release_script(keys=[self.control, self.key], args=[token])
 
         return self
 
@@ -253,3 +328,511 @@ class Lock(object):
 
     def __nonzero__(self):
         return self.owned and bool(self._acquired)
+
+
+class ReadWriteLock(object):
+    """
+    A lock shared by the readers and exclusive for the writers.
+
+    The :attr:`read` and :attr:`write` attributes are the lock objects used
+    respectively by the readers and by the writers. They have the same
+    interface as a :class:`Lock`.
+
+    >>> rw = ReadWriteLock('l1', redis.Redis())
+    >>> with rw.read:
+    ...     pass  # Other readers may run at the same time
+
+    >>> with rw.write:
+    ...     pass  # No reader nor writer run at the same time
+
+    The writers and the readers wait in the same queue of a :class:`Lock`. The
+    readers hold it only the time to add themselves to the readers, whereas
+    the writers hold it until they release the write lock. Once a writer is
+    at the head of the queue, it waits for the running readers to finish.
+
+    Both locks are reentrant in the same thread and the read lock is granted
+    to the thread holding the write lock. A thread holding the read lock
+    cannot acquire the write lock.
+
+    .. attribute:: expire
+
+        The maximum time a lock is held. A reader not released after *expire*
+        seconds is not waited by the writers.
+    """
+    def __init__(self, name, conn, expire=60, lock_class=Lock):
+        if isinstance(name, ReadWriteLock):
+            name = name.name
+
+        self.name = name
+        self.conn = conn
+        self.expire = expire
+        self.lock = lock_class(name, conn, expire=expire)
+        self.readers = READERS_PREFIX + name
+        self.drained = DRAINED_PREFIX + name
+        self._local = threading.local()
+        self._add_reader = conn.register_script(ADD_READER_SCRIPT)
+        self._release_reader = conn.register_script(RELEASE_READER_SCRIPT)
+
+        self.read = _ReadLock(self)
+        self.write = _WriteLock(self)
+
+    def _get(self, attr):
+        return getattr(self._local, attr, 0)
+
+    def _set(self, attr, value):
+        setattr(self._local, attr, value)
+
+    def _acquire_read(self, blocking, timeout):
+        if self._get('reading') or self._get('writing'):
+            self._set('reading', self._get('reading') + 1)
+            return True
+
+        if not self.lock.acquire(blocking, timeout):
+            return False
+        token = uuid.uuid4().hex
+        try:
+            self._add_reader(keys=[self.readers],
+                             args=[time.time() + self.expire, token,
+                                   int(math.ceil(self.expire))])
+        finally:
+            self.lock.release()
+
+        self._local.token = token
+        self._set('reading', 1)
+        return True
+
+    def _release_read(self):
+        reading = self._get('reading')
+        if not reading:
+            raise RuntimeError('Releasing a non-acquired read lock')
+
+        self._set('reading', reading - 1)
+        if reading == 1 and not self._get('writing'):
+            token, self._local.token = self._local.token, None
+            self._release_reader(keys=[self.readers, self.drained],
+                                 args=[time.time(), token,
+                                       int(math.ceil(self.expire))])
+
+    def _count_readers(self):
+        pipe = self.conn.pipeline()
+        pipe.zremrangebyscore(self.readers, '-inf', time.time())
+        pipe.zcard(self.readers)
+        return pipe.execute()[1]
+
+    def _acquire_write(self, blocking, timeout):
+        writing = self._get('writing')
+        if writing:
+            self._set('writing', writing + 1)
+            return True
+        if self._get('reading'):
+            raise RuntimeError('Cannot acquire the write lock while holding the read lock')
+
+        deadline = time.time() + timeout
+        if not self.lock.acquire(blocking, timeout):
+            return False
+        try:
+            self.conn.delete(self.drained)
+            while self._count_readers() > 0:
+                remaining = deadline - time.time()
+                if not blocking:
+                    self.lock.release()
+                    return False
+                if remaining <= 0 or self.conn.brpop(
+                        self.drained, timeout=max(1, int(remaining))) is None:
+                    raise Timeout()
+        except Exception:
+            if self.lock:
+                self.lock.release()
+            raise
+
+        self._set('writing', 1)
+        return True
+
+    def _release_write(self):
+        writing = self._get('writing')
+        if not writing:
+            raise RuntimeError('Releasing a non-acquired write lock')
+
+        self._set('writing', writing - 1)
+        if writing == 1:
+            self.lock.release()
+
+
+class _RWLockView(object):
+    def __init__(self, rwlock):
+        self.rwlock = rwlock
+        self.name = rwlock.name
+
+    def __repr__(self):
+        return '<{0} of {1}>'.format(self.__class__.__name__, self.name)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+
+
+class _ReadLock(_RWLockView):
+    def acquire(self, blocking=True, timeout=5):
+        self.rwlock._acquire_read(blocking, timeout)
+        return self
+
+    def release(self):
+        self.rwlock._release_read()
+        return self
+
+    def __nonzero__(self):
+        return bool(self.rwlock._get('reading'))
+
+
+class _WriteLock(_RWLockView):
+    def acquire(self, blocking=True, timeout=5):
+        self.rwlock._acquire_write(blocking, timeout)
+        return self
+
+    def release(self):
+        self.rwlock._release_write()
+        return self
+
+    def __nonzero__(self):
+        return bool(self.rwlock._get('writing'))
+
+
+class MultiLock(object):
+    """
+    A lock acquiring all the *locks* in the given order and releasing them in
+    the reverse order.
+
+    If the acquisition of one of the *locks* fails, the locks already acquired
+    are released.
+    """
+    def __init__(self, locks):
+        self.locks = list(locks)
+        self.name = '+'.join(getattr(lock, 'name', '?') for lock in self.locks)
+
+    def __repr__(self):
+        return '<MultiLock of {0}>'.format(self.name)
+
+    def acquire(self, blocking=True, timeout=5):
+        """
+        Acquires all the locks, see :meth:`Lock.acquire`.
+        """
+        acquired = []
+        try:
+            for lock in self.locks:
+                if not lock.acquire(blocking, timeout):
+                    break
+                acquired.append(lock)
+            else:
+                return self
+        except Exception:
+            for lock in reversed(acquired):
+                lock.release()
+            raise
+
+        for lock in reversed(acquired):
+            lock.release()
+        return self
+
+    def release(self):
+        """
+        Releases all the locks.
+        """
+        for lock in reversed(self.locks):
+            lock.release()
+        return self
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+
+    def __nonzero__(self):
+        return all(self.locks)
+
+
+class _LocalState(object):
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.holder = None
+        self.held_until = None
+        self.readers = 0
+        self.waiting_writers = 0
+
+    def is_held(self):
+        if self.holder is None:
+            return False
+        if time.time() < self.held_until:
+            return True
+        # The holder did not release the lock before its expiration
+        self.holder = None
+        return False
+
+    def wait(self, blocking, deadline):
+        """
+        Waits a notification on the condition until the *deadline* or raises
+        a :exc:`Timeout`. Returns False if not *blocking*.
+        """
+        if not blocking:
+            return False
+
+        now = time.time()
+        if now >= deadline:
+            raise Timeout()
+        until = deadline
+        if self.holder is not None:
+            until = min(until, self.held_until)
+        self.condition.wait(max(until - now, 0.001))
+        return True
+
+    def take(self, expire):
+        self.holder = holder = object()
+        self.held_until = time.time() + expire
+        return holder
+
+    def give_back(self, holder):
+        if self.holder is holder:
+            self.holder = None
+        self.condition.notify_all()
+
+
+_local_states = {}
+_local_states_lock = threading.Lock()
+
+
+def _get_local_state(name):
+    with _local_states_lock:
+        try:
+            return _local_states[name]
+        except KeyError:
+            state = _local_states[name] = _LocalState()
+            return state
+
+
+class LocalLock(Lock):
+    """
+    A :class:`Lock` held inside the current process.
+
+    The *conn* is ignored. The locks with the same *name* in the process
+    exclude each other.
+    """
+    def __init__(self, name, conn=None, expire=60):
+        if isinstance(name, Lock):
+            name = name.name
+
+        self.name = name
+        self.expire = expire
+        self._state = _get_local_state(name)
+        self._holder = None
+        self._owner = None
+        self._acquired = 0
+
+    def _clean(self):
+        with self._state.condition:
+            self._state.holder = None
+
+    def acquire(self, blocking=True, timeout=5):
+        if self.owned:
+            if self._acquired == 0:
+                raise RuntimeError('Reentering in a non-acquired lock')
+
+            self._acquired += 1
+            return self
+
+        state = self._state
+        deadline = time.time() + timeout
+        with state.condition:
+            while state.is_held():
+                if not state.wait(blocking, deadline):
+                    return self
+            self._holder = state.take(self.expire)
+
+        self._owner = threading.current_thread()
+        self._acquired += 1
+        return self
+
+    def release(self):
+        if not self.owned:
+            raise RuntimeError('Releasing a non-owned lock')
+
+        if self._acquired == 0:
+            raise RuntimeError('Releasing a non-acquired lock')
+
+        self._acquired -= 1
+        if self._acquired == 0:
+            self._owner = None
+            with self._state.condition:
+                self._state.give_back(self._holder)
+            self._holder = None
+
+        return self
+
+
+class LocalReadWriteLock(ReadWriteLock):
+    """
+    A :class:`ReadWriteLock` held inside the current process.
+
+    The writers waiting for the lock have the priority over the new readers.
+    """
+    def __init__(self, name, conn=None, expire=60):
+        if isinstance(name, ReadWriteLock):
+            name = name.name
+
+        self.name = name
+        self.expire = expire
+        self._state = _get_local_state(READERS_PREFIX + name)
+        self._local = threading.local()
+
+        self.read = _ReadLock(self)
+        self.write = _WriteLock(self)
+
+    def _acquire_read(self, blocking, timeout):
+        if self._get('reading') or self._get('writing'):
+            self._set('reading', self._get('reading') + 1)
+            return True
+
+        state = self._state
+        deadline = time.time() + timeout
+        with state.condition:
+            while state.is_held() or state.waiting_writers:
+                if not state.wait(blocking, deadline):
+                    return False
+            state.readers += 1
+
+        self._set('reading', 1)
+        return True
+
+    def _release_read(self):
+        reading = self._get('reading')
+        if not reading:
+            raise RuntimeError('Releasing a non-acquired read lock')
+
+        self._set('reading', reading - 1)
+        if reading == 1 and not self._get('writing'):
+            with self._state.condition:
+                self._state.readers -= 1
+                if self._state.readers == 0:
+                    self._state.condition.notify_all()
+
+    def _acquire_write(self, blocking, timeout):
+        writing = self._get('writing')
+        if writing:
+            self._set('writing', writing + 1)
+            return True
+        if self._get('reading'):
+            raise RuntimeError('Cannot acquire the write lock while holding the read lock')
+
+        state = self._state
+        deadline = time.time() + timeout
+        with state.condition:
+            state.waiting_writers += 1
+            acquired = False
+            try:
+                while state.is_held() or state.readers:
+                    if not state.wait(blocking, deadline):
+                        return False
+                acquired = True
+            finally:
+                state.waiting_writers -= 1
+                if not acquired:
+                    # Wakes up the readers waiting behind this writer
+                    state.condition.notify_all()
+            self._local.holder = state.take(self.expire)
+
+        self._set('writing', 1)
+        return True
+
+    def _release_write(self):
+        writing = self._get('writing')
+        if not writing:
+            raise RuntimeError('Releasing a non-acquired write lock')
+
+        self._set('writing', writing - 1)
+        if writing == 1:
+            with self._state.condition:
+                self._state.give_back(self._local.holder)
+            self._local.holder = None
+
+
+class InstrumentedLock(object):
+    """
+    Records the usage of a *lock* in a :class:`napixd.utils.metrics.Registry`.
+
+    The metrics, labelled by the name of the lock, are:
+
+    ``napixd_lock_wait_seconds``
+        The histogram of the time spent in :meth:`acquire`.
+    ``napixd_lock_hold_seconds``
+        The histogram of the time between the acquisition and the release.
+    ``napixd_lock_timeouts_total``
+        The number of :exc:`Timeout`.
+    ``napixd_lock_waiting``
+        The number of threads of this process waiting for the lock.
+
+    .. attribute:: wait
+
+        The time spent in the last :meth:`acquire`.
+
+    .. attribute:: hold
+
+        The time the lock was held before the last :meth:`release`.
+    """
+    def __init__(self, lock, registry=None):
+        self.lock = lock
+        self.name = name = getattr(lock, 'name', '')
+        self.registry = registry = registry or metrics.registry
+        self.wait = 0
+        self.hold = 0
+        self._acquired_at = None
+
+        self._wait_histogram = registry.histogram(
+            'napixd_lock_wait_seconds', 'Time spent acquiring the lock', lock=name)
+        self._hold_histogram = registry.histogram(
+            'napixd_lock_hold_seconds', 'Time the lock is held', lock=name)
+        self._waiting = registry.gauge(
+            'napixd_lock_waiting', 'Threads waiting for the lock', lock=name)
+
+    def __repr__(self):
+        return '<InstrumentedLock {0!r}>'.format(self.lock)
+
+    def acquire(self, *args, **kw):
+        """
+        Acquires the lock, see :meth:`Lock.acquire`.
+        """
+        self._waiting.inc()
+        start = time.time()
+        try:
+            self.lock.acquire(*args, **kw)
+        except Timeout:
+            self.registry.counter('napixd_lock_timeouts_total',
+                                  'Acquisitions ended by a timeout', lock=self.name).inc()
+            raise
+        finally:
+            self._waiting.dec()
+            self._acquired_at = now = time.time()
+            self.wait = now - start
+            self._wait_histogram.observe(self.wait)
+        return self
+
+    def release(self):
+        """
+        Releases the lock.
+        """
+        self.lock.release()
+        self.hold = time.time() - self._acquired_at
+        self._hold_histogram.observe(self.hold)
+        return self
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.release()
+
+    def __nonzero__(self):
+        return bool(self.lock)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+In-process metrics.
+
+The metrics are kept in a :class:`Registry` by name and labels and rendered in
+the text format of Prometheus.
+
+>>> wait = registry.histogram('napixd_lock_wait_seconds', lock='vhosts')
+>>> wait.observe(.012)
+"""
+
+import bisect
+import threading
+
+__all__ = (
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'Registry',
+    'registry',
+)
+
+DEFAULT_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        u'{0}="{1}"'.format(key, unicode(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels) + '}'
+
+
+class Counter(object):
+    """
+    A value that only increases.
+    """
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        """
+        Yields the tuples of the suffix, the extra labels and the value of
+        the samples of this metric.
+        """
+        yield '', (), self.value
+
+
+class Gauge(Counter):
+    """
+    A value that increases and decreases.
+    """
+    kind = 'gauge'
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram(object):
+    """
+    Counts the observed values by *buckets*.
+
+    Each bucket counts the values lesser or equal to its upper bound.
+    """
+    kind = 'histogram'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        cumulated = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulated += count
+            yield '_bucket', (('le', _format_value(float(bound))), ), cumulated
+        yield '_bucket', (('le', '+Inf'), ), self.count
+        yield '_sum', (), self.sum
+        yield '_count', (), self.count
+
+
+class Registry(object):
+    """
+    A collection of metrics by name and labels.
+
+    The metrics are created at their first access by :meth:`counter`,
+    :meth:`gauge` or :meth:`histogram` with the labels given as keyword
+    arguments.
+    """
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_class, name, help, labels, *args):
+        labels = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and family[0] is metric_class:
+            metric = family[2].get(labels)
+            if metric is not None:
+                return metric
+
+        with self._lock:
+            family = self._families.setdefault(name, (metric_class, help, {}))
+            if family[0] is not metric_class:
+                raise TypeError('The metric {0} is a {1}'.format(name, family[0].kind))
+            metrics = family[2]
+            if labels not in metrics:
+                metrics[labels] = metric_class(*args)
+            return metrics[labels]
+
+    def counter(self, name, help='', **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help='', **labels):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def collect(self):
+        """
+        Yields the tuples of the name, the labels and the value
+        of each sample.
+        """
+        for name, (metric_class, help, metrics) in sorted(self._families.items()):
+            for labels, metric in sorted(metrics.items()):
+                for suffix, extra_labels, value in metric.samples():
+                    yield name + suffix, labels + extra_labels, value
+
+    def render(self):
+        """
+        Returns the metrics in the text format of Prometheus.
+        """
+        lines = []
+        for name, (metric_class, help, metrics) in sorted(self._families.items()):
+            if help:
+                lines.append(u'# HELP {0} {1}'.format(name, help))
+            lines.append(u'# TYPE {0} {1}'.format(name, metric_class.kind))
+            for labels, metric in sorted(metrics.items()):
+                for suffix, extra_labels, value in metric.samples():
+                    lines.append(u'{0}{1} {2}'.format(
+                        name + suffix,
+                        _format_labels(labels + extra_labels),
+                        _format_value(value)))
+        lines.append(u'')
+        return u'\n'.join(lines)
+
+    def clear(self):
+        """
+        Removes all the metrics.
+        """
+        with self._lock:
+            self._families.clear()
+
+
+#: The registry used by default by napixd.
+registry = Registry()
@@ -5,9 +5,10 @@
 import unittest
 import mock
 
-from napixd.auth.autonomous import AutonomousAuthProvider
+from napixd.auth.autonomous import AutonomousAuthProvider, _compare_digest
 from napixd.http.request import Request
 from napixd.conf import Conf
+from napixd.utils.cache import LRUCache
 
 
 class TestAutonomous(unittest.TestCase):
@@ -30,6 +31,15 @@ class TestAutonomous(unittest.TestCase):
         }))
         self.assertEqual(ap.login, 'user')
         self.assertEqual(ap.password, 'that')
+        self.assertTrue(isinstance(ap.cache, LRUCache))
+        self.assertEqual(ap.signature_ttl, 60)
+
+    def test_from_settings_no_cache(self):
+        ap = AutonomousAuthProvider.from_settings(Conf({
+            'password': u'that',
+            'signature_cache': 0,
+        }))
+        self.assertEqual(ap.cache, None)
 
     def test_not_login(self):
         self.content['login'] = 'normal_login'
@@ -41,3 +51,50 @@ class TestAutonomous(unittest.TestCase):
     def test_login_bad(self):
         self.content['signature'] = 'blalblalbla'
         self.assertTrue(self.call() is False)
+
+    def test_login_unicode(self):
+        self.content['signature'] = unicode(self.content['signature'])
+        self.content['msg'] = u'master_local'
+        self.assertTrue(self.call() is True)
+
+    def test_sign_twice(self):
+        self.assertEqual(self.ap.sign('abc'), self.ap.sign('abc'))
+
+
+class TestAutonomousCache(unittest.TestCase):
+    def setUp(self):
+        self.ap = AutonomousAuthProvider(u'master_local', u'password', LRUCache(10), 60)
+        self.request = mock.Mock(spec=Request)
+        self.content = {
+            'login': 'master_local',
+            'signature': 'bd4dfeebe49e0ce2a4edeaf9f32fb0ec80b638993a6ab695987545ca2ebce7df',
+            'msg': 'master_local',
+        }
+
+    def call(self):
+        with mock.patch.object(self.ap, 'sign', wraps=self.ap.sign) as sign:
+            result = self.ap(self.request, self.content)
+        return result, sign.call_count
+
+    def test_valid_cached(self):
+        self.assertEqual(self.call(), (True, 1))
+        self.assertEqual(self.call(), (True, 0))
+
+    def test_invalid_not_cached(self):
+        self.content['signature'] = 'blalblalbla'
+        self.assertEqual(self.call(), (False, 1))
+        self.assertEqual(self.call(), (False, 1))
+
+    def test_other_signature(self):
+        self.call()
+        self.content['signature'] = 'blalblalbla'
+        self.assertEqual(self.call(), (False, 1))
+
+
+class TestCompareDigest(unittest.TestCase):
+    def test_equal(self):
+        self.assertTrue(_compare_digest('abc', 'abc'))
+
+    def test_different(self):
+        self.assertFalse(_compare_digest('abc', 'abd'))
+        self.assertFalse(_compare_digest('abc', 'ab'))
@@ -7,23 +7,34 @@ import mock
 
 import httplib
 import socket
+import threading
+import BaseHTTPServer
 
 from napixd.conf import Conf
 from napixd.http.request import Request
 from napixd.http.response import HTTPError
 
 try:
+    from permissions.models import Perm
     from permissions.managers import PermSet
 except ImportError:
     __test__ = False
 else:
-    from napixd.auth.central import CentralAuthProvider, Filter, ConnectionFactory
+    from napixd.auth.central import (
+        CentralAuthProvider,
+        Filter,
+        FilterFactory,
+        ConnectionFactory,
+        ConnectionPool,
+    )
+    from napixd.utils.cache import LRUCache, _Flight
 
 
 class TestFilter(unittest.TestCase):
     def setUp(self):
         self.rules = rules = mock.Mock(spec=PermSet)
-        rules.filter_paths.return_value = ['/x/abc', '/x/def']
+        rules.filter_paths.side_effect = lambda paths: [
+            path for path in paths if path in ('/x/abc', '/x/def')]
         self.filter = Filter(rules)
 
     def test_filter_list(self):
@@ -42,6 +53,178 @@ class TestFilter(unittest.TestCase):
             '/x/def': 2,
         })
 
+    def test_filter_all_allowed(self):
+        resp = ['/x/abc', '/x/def']
+        self.assertTrue(self.filter(resp) is resp)
+
+    def test_filter_bad_type(self):
+        self.assertRaises(ValueError, self.filter, '/x/abc')
+
+    def test_filter_known_paths(self):
+        self.filter(['/x/abc', '/x/ghi'])
+        f = self.filter(['/x/abc', '/x/def', '/x/ghi'])
+        self.rules.filter_paths.assert_called_with(['/x/def'])
+        self.assertEqual(f, ['/x/abc', '/x/def'])
+
+        self.filter(['/x/ghi', '/x/abc'])
+        self.assertEqual(self.rules.filter_paths.call_count, 2)
+
+    def test_filter_size(self):
+        filter = Filter(self.rules, size=2)
+        filter(['/x/abc', '/x/ghi'])
+        filter(['/x/abc'])
+        f = filter(['/x/def', '/x/ghi'])
+        self.assertEqual(f, ['/x/def'])
+        self.assertEqual(list(filter._decisions), ['/x/ghi', '/x/def'])
+        filter(['/x/abc'])
+        self.rules.filter_paths.assert_called_with(['/x/abc'])
+
+
+class TestFilterPermSet(unittest.TestCase):
+    def setUp(self):
+        self.filter = Filter(PermSet([
+            Perm('*', ['GET'], '/x/abc'),
+            Perm('*', ['GET'], '/y/*'),
+        ]).on_host('server.napix.io'))
+
+    def test_filter(self):
+        self.assertEqual(self.filter(['/x/abc', '/x/ghi', '/y/1', '/z/1']),
+                         ['/x/abc', '/y/1'])
+
+    def test_filter_known_paths(self):
+        self.filter(['/x/abc', '/x/ghi'])
+        self.assertEqual(self.filter(['/x/ghi', '/x/abc', '/y/2']),
+                         ['/x/abc', '/y/2'])
+
+
+class TestFilterFactory(unittest.TestCase):
+    def setUp(self):
+        self.rules = [{'host': '*', 'methods': ['GET'], 'path': '/a/*'}]
+
+    def test_create(self):
+        ff = FilterFactory('server.napix.io')
+        self.assertTrue(isinstance(ff(self.rules), Filter))
+
+    def test_cache(self):
+        ff = FilterFactory('server.napix.io', LRUCache(10))
+        self.assertTrue(ff(self.rules) is ff(list(self.rules)))
+        self.assertFalse(ff(self.rules) is ff([]))
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.factory = mock.Mock(spec=ConnectionFactory, host='central.napix.io')
+        self.factory.side_effect = self.connect
+        self.connections = []
+        self.pool = ConnectionPool(self.factory, size=2, timeout=.01)
+
+    def connect(self):
+        connection = mock.Mock(spec=httplib.HTTPConnection, sock=None)
+        connection.getresponse.return_value.will_close = False
+        self.connections.append(connection)
+        return connection
+
+    def request(self):
+        return self.pool.request('POST', '/auth', '{}', {})
+
+    def test_request(self):
+        resp, content = self.request()
+        connection, = self.connections
+        connection.request.assert_called_once_with('POST', '/auth', body='{}', headers={})
+        self.assertEqual(resp, connection.getresponse.return_value)
+        self.assertEqual(content, resp.read.return_value)
+
+    def test_reuse(self):
+        self.request()
+        self.request()
+        self.assertEqual(len(self.connections), 1)
+
+    def test_will_close(self):
+        connection = self.pool.checkout()
+        connection.getresponse.return_value.will_close = True
+        self.pool.checkin(connection)
+        self.request()
+        connection.close.assert_called_once_with()
+
+    def test_exhausted(self):
+        self.pool.checkout()
+        self.pool.checkout()
+        self.assertRaises(socket.timeout, self.pool.checkout)
+
+    def test_unhealthy(self):
+        connection = self.pool.checkout()
+        connection.sock = mock.Mock()
+        self.pool.checkin(connection)
+        with mock.patch('select.select', return_value=([connection.sock], [], [])):
+            self.assertEqual(self.pool.checkout(), connection)
+        connection.close.assert_called_once_with()
+
+    def test_retry_reused(self):
+        connection = self.pool.checkout()
+        connection.sock = mock.Mock()
+        connection.getresponse.side_effect = [httplib.BadStatusLine(''), mock.DEFAULT]
+        self.pool.checkin(connection)
+        with mock.patch('select.select', return_value=([], [], [])):
+            self.request()
+        self.assertEqual(connection.request.call_count, 2)
+        connection.close.assert_called_once_with()
+
+    def test_no_retry_new(self):
+        connection = self.pool.checkout()
+        connection.getresponse.side_effect = socket.error('broken pipe')
+        self.pool.checkin(connection)
+        self.assertRaises(socket.error, self.request)
+        self.assertEqual(connection.request.call_count, 1)
+        self.assertEqual(self.pool.checkout(), connection)
+
+    def test_no_retry_timeout(self):
+        connection = self.pool.checkout()
+        connection.sock = mock.Mock()
+        connection.getresponse.side_effect = socket.timeout()
+        self.pool.checkin(connection)
+        with mock.patch('select.select', return_value=([], [], [])):
+            self.assertRaises(socket.timeout, self.request)
+        self.assertEqual(connection.request.call_count, 1)
+
+
+class AuthHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPoolServer(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), AuthHandler)
+        self.connections = 0
+        process_request = self.server.process_request
+
+        def count(*args):
+            self.connections += 1
+            return process_request(*args)
+        self.server.process_request = count
+
+        thread = threading.Thread(target=self.server.serve_forever, args=(.01, ))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_keep_alive(self):
+        pool = ConnectionPool(ConnectionFactory('127.0.0.1:{0}'.format(self.server.server_port)))
+        for x in range(3):
+            resp, content = pool.request('POST', '/auth', '{}', {})
+            self.assertEqual(resp.status, 200)
+        pool.checkout().close()
+        self.assertEqual(self.connections, 1)
+
 
 class TestCentralAuthProviderBuilder(unittest.TestCase):
 
@@ -53,6 +236,27 @@ class TestCentralAuthProviderBuilder(unittest.TestCase):
         self.assertEqual(cap.url, '/abc/def')
         self.assertEqual(cap.http_client_factory, ConnectionFactory('new.url'))
 
+    def test_from_settings_cache(self):
+        cap = CentralAuthProvider.from_settings('service.name', Conf({
+            'url': u'http://new.url/abc/def',
+            'cache': Conf({
+                'size': 100,
+                'ttl': 30,
+                'stale': 5,
+            }),
+        }))
+        self.assertEqual(cap.cache.size, 100)
+        self.assertEqual(cap.cache.stale, 5)
+        self.assertEqual(cap.ttl, 30)
+        self.assertEqual(cap.negative_ttl, 2)
+        self.assertTrue(cap.filter_factory.cache is not None)
+
+    def test_from_settings_no_cache(self):
+        cap = CentralAuthProvider.from_settings('service.name', Conf({
+            'url': u'http://new.url/abc/def',
+        }))
+        self.assertTrue(cap.cache is None)
+
     def test_from_settings_old(self):
         cap = CentralAuthProvider.from_settings('service.name', Conf({
             'auth_url': u'http://old.url/abc/ghi',
@@ -149,3 +353,108 @@ class TestCentralAuthProvider(unittest.TestCase):
             'methods': ['GET'],
             'path': '/a/b',
         }])
+
+
+class TestCentralAuthProviderCache(unittest.TestCase):
+    def setUp(self):
+        con_fac = mock.Mock()
+        self.connection = con_fac.return_value = mock.Mock(httplib.HTTPConnection)
+        self.response = self.connection.getresponse.return_value
+        self.response.status = 200
+
+        self.filter_factory = ff = mock.Mock()
+        self.checker = CentralAuthProvider(con_fac, '/auth/authorization/', ff,
+                                           'server.napix.io', cache=LRUCache(10),
+                                           ttl=10, negative_ttl=1)
+        self.request = mock.Mock(spec=Request, path='/abc/def', method='GET')
+
+    def call(self, now=1000, **content):
+        content.setdefault('login', 'user')
+        content.setdefault('signature', 'sign')
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = now
+            return self.checker(self.request, content)
+
+    def test_cached(self):
+        self.assertTrue(self.call() is True)
+        self.assertTrue(self.call(now=1009) is True)
+        self.assertEqual(self.connection.request.call_count, 1)
+
+    def test_expired(self):
+        self.call()
+        self.call(now=1011)
+        self.assertEqual(self.connection.request.call_count, 2)
+
+    def test_negative(self):
+        self.response.status = 403
+        self.assertTrue(self.call() is False)
+        self.assertTrue(self.call(now=1000.5) is False)
+        self.call(now=1002)
+        self.assertEqual(self.connection.request.call_count, 2)
+
+    def test_other_signature(self):
+        self.call()
+        self.call(signature='other')
+        self.assertEqual(self.connection.request.call_count, 2)
+
+    def test_other_path(self):
+        self.call()
+        self.request.path = '/abc/ghi'
+        self.call()
+        self.assertEqual(self.connection.request.call_count, 2)
+
+    def test_nonce(self):
+        self.call(nonce='1')
+        self.call(nonce='1')
+        self.assertEqual(self.connection.request.call_count, 2)
+
+    def test_non_authoritative(self):
+        self.request.path = '/abc/'
+        self.response.status = 403
+        self.response.read.return_value = '["/a/b"]'
+        self.response.getheader.return_value = 'application/json'
+
+        self.assertRaises(HTTPError, self.call)
+        try:
+            self.call()
+        except HTTPError as resp:
+            self.assertEqual(resp.status, 203)
+            self.assertEqual(resp.body, ['/a/b'])
+        self.assertEqual(self.connection.request.call_count, 1)
+
+    def test_error(self):
+        self.response.status = 504
+        self.assertRaises(HTTPError, self.call)
+        self.assertRaises(HTTPError, self.call)
+        self.assertEqual(self.connection.request.call_count, 2)
+
+
+class TestCentralAuthProviderCoalescing(unittest.TestCase):
+    def setUp(self):
+        con_fac = mock.Mock()
+        self.connection = con_fac.return_value = mock.Mock(httplib.HTTPConnection)
+        self.connection.getresponse.return_value.status = 200
+        self.checker = CentralAuthProvider(con_fac, '/auth/authorization/', mock.Mock(),
+                                           'server.napix.io')
+        self.request = mock.Mock(spec=Request, path='/abc/def', method='GET', environ={})
+        self.content = {'login': 'user', 'signature': 'sign'}
+
+    def test_alone(self):
+        self.assertTrue(self.checker(self.request, self.content) is True)
+        self.assertEqual(self.connection.request.call_count, 1)
+        self.assertFalse('napixd.auth.saved' in self.request.environ)
+
+    def test_join(self):
+        content = dict(self.content, host='server.napix.io')
+        key = self.checker.get_cache_key(self.request, content)
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = 1000
+            flight = self.checker.flights._flights[key] = _Flight()
+            flight.result = True
+            flight.event.set()
+
+            time.time.return_value = 1000.5
+            self.assertTrue(self.checker(self.request, self.content) is True)
+
+        self.assertEqual(self.connection.request.call_count, 0)
+        self.assertEqual(self.request.environ['napixd.auth.saved'], .5)
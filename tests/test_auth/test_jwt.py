@@ -7,8 +7,23 @@ import json
 
 import base64
 
-from napixd.auth.jwt import JSONWebToken
+from napixd.auth.jwt import JSONWebToken, b64decode
+from napixd.conf import Conf
 from napixd.http.response import HTTPError
+from napixd.utils.cache import LRUCache
+
+
+class TestB64Decode(unittest.TestCase):
+    def test_padded(self):
+        self.assertEqual(b64decode('YWJjZA=='), 'abcd')
+
+    def test_unpadded(self):
+        self.assertEqual(b64decode('YWJjZA'), 'abcd')
+        self.assertEqual(b64decode(u'YWJjZGU'), 'abcde')
+
+    def test_bad(self):
+        self.assertEqual(b64decode('YWJjZ'), None)
+        self.assertEqual(b64decode(u'\xe9t\xe9'), None)
 
 
 class TestJSONWebToken(unittest.TestCase):
@@ -54,6 +69,11 @@ class TestJSONWebToken(unittest.TestCase):
             'timestamp': 1234567,
         })
 
+    def test_unpadded(self):
+        self.body['jti'] = 'unique'
+        signed_body = self.signed_body().replace('=', '')
+        self.assertEqual(self.call(signed_body + '.signature')['nonce'], u'unique')
+
     def test_bad_base64(self):
         self.assertEqual(self.call('pim.pam.poum=zib-zob'), None)
 
@@ -75,8 +95,9 @@ class TestJSONWebToken(unittest.TestCase):
     def test_http_detect(self):
         request = mock.Mock(headers={
             'Authorization': self.whole_jwt()
-        })
+        }, environ={})
         self.assertTrue(isinstance(self.jwt(request), dict))
+        self.assertTrue(request.environ['napixd.auth.expires'])
 
     def test_http_no_detect(self):
         request = mock.Mock(headers={
@@ -88,3 +109,56 @@ class TestJSONWebToken(unittest.TestCase):
         request = mock.Mock(headers={
         })
         self.assertTrue(self.jwt(request) is None)
+
+
+class TestJSONWebTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.jwt = JSONWebToken(LRUCache(10))
+        self.token = '.'.join([
+            base64.urlsafe_b64encode(json.dumps({'alg': 'HS256'})),
+            base64.urlsafe_b64encode(json.dumps({
+                'iss': 'login',
+                'sub': 'GET /path/',
+                'aud': 'server.napix.nx',
+                'exp': 1300,
+                'jti': 'unique-unique',
+            })),
+            'signature',
+        ])
+
+    def call(self, token, now=1000):
+        with mock.patch('time.time', return_value=now):
+            with mock.patch.object(self.jwt, '_decode', wraps=self.jwt._decode) as decode:
+                return self.jwt.decode_jwt(token), decode.call_count
+
+    def test_from_settings(self):
+        jwt = JSONWebToken.from_settings(Conf({}))
+        self.assertTrue(isinstance(jwt.cache, LRUCache))
+
+    def test_from_settings_no_cache(self):
+        jwt = JSONWebToken.from_settings(Conf({'jwt_cache': 0}))
+        self.assertEqual(jwt.cache, None)
+
+    def test_cached(self):
+        claims, count = self.call(self.token)
+        self.assertEqual(count, 1)
+        claims['login'] = 'other'
+        claims, count = self.call(self.token)
+        self.assertEqual(count, 0)
+        self.assertEqual(claims['login'], u'login')
+
+    def test_expired(self):
+        self.call(self.token)
+        claims, count = self.call(self.token, now=1301)
+        self.assertEqual(count, 1)
+
+    def test_not_cached_expired(self):
+        self.call(self.token, now=1400)
+        claims, count = self.call(self.token, now=1400)
+        self.assertEqual(count, 1)
+
+    def test_invalid_not_cached(self):
+        self.call('pim.pam.signature')
+        result, count = self.call('pim.pam.signature')
+        self.assertEqual(result, None)
+        self.assertEqual(count, 1)
@@ -9,7 +9,7 @@ import mock
 from napixd.http.request import Request
 from napixd.http.response import HTTPError
 
-from napixd.auth.plugin import AAAPlugin
+from napixd.auth.plugin import AAAPlugin, authorization_kinds
 
 
 class TestAuthPlugin(unittest.TestCase):
@@ -79,3 +79,149 @@ class TestAuthPlugin(unittest.TestCase):
 
         self.assertEqual(check, f.return_value)
         f.assert_called_once_with(self.cb.return_value)
+
+    def test_timed(self):
+        self.source.return_value = {'a': 1}
+        self.provider.return_value = True
+        resp = AAAPlugin(self.sources, self.providers, timed=True)(self.cb, self.request)
+        self.assertTrue('x-auth-time' in resp.headers)
+        self.assertFalse('x-auth-saved-time' in resp.headers)
+
+    def test_timed_saved(self):
+        self.source.return_value = {'a': 1}
+
+        def provider(request, content):
+            request.environ['napixd.auth.saved'] = .5
+            return True
+        self.provider.side_effect = provider
+        resp = AAAPlugin(self.sources, self.providers, timed=True)(self.cb, self.request)
+        self.assertEqual(resp.headers['x-auth-saved-time'], '0.5')
+
+
+class Source(object):
+    def __init__(self, authorization=None, result=None):
+        if authorization is not None:
+            self.authorization = authorization
+        self.result = result
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        return self.result
+
+
+class SignedSource(Source):
+    authorization = 'signed'
+
+
+class JWTSource(Source):
+    authorization = 'jwt'
+
+
+class Provider(object):
+    def __init__(self, result=None):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self, request, content):
+        self.calls += 1
+        return self.result
+
+
+class LoginProvider(Provider):
+    logins = frozenset(['local'])
+
+
+class FinalProvider(Provider):
+    final = True
+
+
+class CheckingProvider(Provider):
+    def __init__(self, result=None):
+        super(CheckingProvider, self).__init__(result)
+        self.authenticated_calls = []
+
+    def authenticated(self, request, content):
+        self.authenticated_calls.append(content)
+
+
+class TestAuthorizationKinds(unittest.TestCase):
+    def kinds(self, **headers):
+        return authorization_kinds(mock.Mock(spec=Request, headers=headers))
+
+    def test_none(self):
+        self.assertEqual(self.kinds(), frozenset())
+
+    def test_signed(self):
+        self.assertEqual(self.kinds(Authorization='host=a&path=/:abc'), frozenset(['signed']))
+
+    def test_jwt(self):
+        self.assertEqual(self.kinds(Authorization='abc.def.ghi'), frozenset(['jwt']))
+
+    def test_both(self):
+        self.assertEqual(self.kinds(Authorization='host=a.b.c:abc'),
+                         frozenset(['signed', 'jwt']))
+
+
+class TestAuthDispatch(unittest.TestCase):
+    def setUp(self):
+        self.request = mock.Mock(spec=Request, environ={}, headers={})
+        self.cb = mock.Mock()
+
+    def test_sources_jwt(self):
+        signed = SignedSource()
+        jwt = JWTSource(result={'login': 'user'})
+        token = Source()
+        plugin = AAAPlugin([signed, token, jwt], [Provider(True)], timed=False)
+        self.request.headers['Authorization'] = 'abc.def.ghi'
+        plugin(self.cb, self.request)
+
+        self.assertEqual((signed.calls, token.calls, jwt.calls), (0, 1, 1))
+
+    def test_sources_no_authorization(self):
+        signed = SignedSource()
+        token = Source(result={'login': 'user'})
+        plugin = AAAPlugin([signed, token], [Provider(True)], timed=False)
+        plugin(self.cb, self.request)
+
+        self.assertEqual((signed.calls, token.calls), (0, 1))
+
+    def test_providers_by_login(self):
+        checker = Provider()
+        local = LoginProvider(True)
+        central = FinalProvider(True)
+        plugin = AAAPlugin([Source(result={'login': 'user'})],
+                           [checker, local, central], timed=False)
+        plugin(self.cb, self.request)
+        self.assertEqual((checker.calls, local.calls, central.calls), (1, 0, 1))
+
+        plugin = AAAPlugin([Source(result={'login': 'local'})],
+                           [checker, local, central], timed=False)
+        plugin(self.cb, self.request)
+        self.assertEqual((checker.calls, local.calls, central.calls), (2, 1, 1))
+
+    def test_providers_unhashable_login(self):
+        provider = Provider(True)
+        plugin = AAAPlugin([Source(result={'login': ['user']})],
+                           [LoginProvider(), provider], timed=False)
+        plugin(self.cb, self.request)
+        self.assertEqual(provider.calls, 1)
+
+    def test_authenticated(self):
+        checker = CheckingProvider()
+        plugin = AAAPlugin([Source(result={'login': 'user'})],
+                           [checker, Provider(True)], timed=False)
+        plugin(self.cb, self.request)
+        self.assertEqual(checker.authenticated_calls, [{'login': 'user'}])
+
+    def test_not_authenticated(self):
+        checker = CheckingProvider()
+        plugin = AAAPlugin([Source(result={'login': 'user'})],
+                           [checker, Provider(False)], timed=False)
+        self.assertRaises(HTTPError, plugin, self.cb, self.request)
+        self.assertEqual(checker.authenticated_calls, [])
+        self.assertEqual(self.cb.call_count, 0)
+
+    def test_providers_order(self):
+        self.assertRaises(ValueError, AAAPlugin, [Source()],
+                          [FinalProvider(), Provider()])
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+import unittest
+import mock
+
+from napixd.conf import Conf
+from napixd.http.request import Request
+from napixd.http.response import HTTPError
+from napixd.auth.replay import (
+    ReplayChecker,
+    LocalNonceStore,
+    RedisNonceStore,
+)
+
+
+class TestLocalNonceStore(unittest.TestCase):
+    def setUp(self):
+        self.store = LocalNonceStore()
+
+    def add(self, nonce, expire, now=1000):
+        with mock.patch('time.time', return_value=now):
+            return self.store.add(nonce, expire)
+
+    def test_add(self):
+        self.assertTrue(self.add('abc', 1005))
+        self.assertTrue(self.add('def', 1005))
+        self.assertFalse(self.add('abc', 1005))
+
+    def test_expired(self):
+        self.add('abc', 1005)
+        self.assertFalse(self.add('abc', 1010, now=1005))
+        self.assertTrue(self.add('abc', 1015, now=1007))
+
+    def test_evict(self):
+        self.add('abc', 1005)
+        self.add('def', 1005)
+        self.add('ghi', 1017, now=1010)
+        self.assertEqual(len(self.store), 1)
+
+    def test_full(self):
+        store = LocalNonceStore(size=2)
+        with mock.patch('time.time', return_value=1000):
+            store.add('abc', 1010)
+            store.add('def', 1005)
+            self.assertTrue(store.add('ghi', 1020))
+        self.assertEqual(len(store), 2)
+        self.assertEqual(sorted(store._nonces), ['abc', 'ghi'])
+
+    def test_long_expire(self):
+        self.add('abc', 5000)
+        self.assertFalse(self.add('abc', 1005, now=4000))
+        self.assertTrue(self.add('abc', 6000, now=5001))
+
+
+class TestRedisNonceStore(unittest.TestCase):
+    def setUp(self):
+        self.con = mock.Mock()
+        self.store = RedisNonceStore(self.con)
+
+    def test_add(self):
+        self.con.set.return_value = True
+        with mock.patch('time.time', return_value=1000):
+            self.assertTrue(self.store.add('abc', 1300))
+        self.con.set.assert_called_once_with('napixd:nonce:abc', 1, ex=301, nx=True)
+
+    def test_add_known(self):
+        self.con.set.return_value = None
+        self.assertFalse(self.store.add('abc', 1300))
+
+
+class TestReplayChecker(unittest.TestCase):
+    def setUp(self):
+        self.store = mock.Mock(spec=LocalNonceStore)
+        self.store.add.return_value = True
+        self.checker = ReplayChecker(self.store, 300, 3600)
+        self.request = mock.Mock(spec=Request, environ={})
+        self.content = {
+            'login': 'user',
+            'nonce': 'abc',
+            'timestamp': '1000',
+        }
+
+    def call(self, now=1100):
+        with mock.patch('time.time', return_value=now):
+            result = self.checker(self.request, self.content)
+            self.checker.authenticated(self.request, self.content)
+            return result
+
+    def test_from_settings(self):
+        checker = ReplayChecker.from_settings(Conf({'window': 60, 'size': 10}))
+        self.assertEqual(checker.window, 60)
+        self.assertEqual(checker.max_lifetime, 86400)
+        self.assertTrue(isinstance(checker.store, LocalNonceStore))
+        self.assertEqual(checker.store.size, 10)
+
+    def test_from_settings_redis(self):
+        with mock.patch('napixd.auth.replay.connection_factory') as cf:
+            checker = ReplayChecker.from_settings(Conf({'backend': u'redis'}))
+        self.assertTrue(isinstance(checker.store, RedisNonceStore))
+        self.assertEqual(checker.store._con, cf.return_value)
+
+    def test_from_settings_bad_backend(self):
+        self.assertRaises(ValueError, ReplayChecker.from_settings,
+                          Conf({'backend': u'memcache'}))
+
+    def test_no_nonce(self):
+        del self.content['nonce']
+        self.assertEqual(self.call(), None)
+        self.assertEqual(self.store.add.call_count, 0)
+
+    def test_valid(self):
+        self.assertEqual(self.call(), None)
+        self.store.add.assert_called_once_with('user:abc', 1300)
+
+    def test_not_authenticated(self):
+        with mock.patch('time.time', return_value=1100):
+            self.assertEqual(self.checker(self.request, self.content), None)
+        self.assertEqual(self.store.add.call_count, 0)
+
+    def test_replayed(self):
+        self.store.add.return_value = False
+        self.assertRaises(HTTPError, self.call)
+
+    def test_expired(self):
+        self.assertRaises(HTTPError, self.call, now=1400)
+        self.assertEqual(self.store.add.call_count, 0)
+
+    def test_future(self):
+        self.assertRaises(HTTPError, self.call, now=600)
+
+    def test_token_expire_later(self):
+        self.request.environ['napixd.auth.expires'] = True
+        self.content['timestamp'] = 4600
+        self.assertEqual(self.call(now=1000), None)
+        self.store.add.assert_called_once_with('user:abc', 4600)
+
+    def test_token_too_long(self):
+        self.request.environ['napixd.auth.expires'] = True
+        self.content['timestamp'] = 4601
+        self.assertRaises(HTTPError, self.call, now=1000)
+        self.assertEqual(self.store.add.call_count, 0)
+
+    def test_token_expired(self):
+        self.request.environ['napixd.auth.expires'] = True
+        self.content['timestamp'] = 800
+        self.assertRaises(HTTPError, self.call, now=1000)
+        self.assertEqual(self.store.add.call_count, 0)
+
+    def test_token_replayed(self):
+        self.checker = ReplayChecker(LocalNonceStore(), 300, 3600)
+        self.request.environ['napixd.auth.expires'] = True
+        self.content['timestamp'] = 4600
+        self.call(now=1000)
+        self.assertRaises(HTTPError, self.call, now=4000)
+
+    def test_bad_timestamp(self):
+        self.content['timestamp'] = 'yesterday'
+        self.assertRaises(HTTPError, self.call)
@@ -7,7 +7,7 @@ import unittest
 import time
 import mock
 
-from napixd.chrono import Chrono
+from napixd.chrono import Chrono, Timings, NullTimings, get_timings, null_timings, monotonic
 
 
 class TestChrono(unittest.TestCase):
@@ -42,3 +42,56 @@ class TestChrono(unittest.TestCase):
             with chrono:
                 self.assertEqual(repr(chrono), '<Chrono for 10>')
         self.assertEqual(repr(chrono), '<Chrono 20>')
+
+
+class TestMonotonic(unittest.TestCase):
+    def test_monotonic(self):
+        start = monotonic()
+        time.sleep(.1)
+        self.assertAlmostEquals(monotonic() - start, .1, places=2)
+
+
+class TestTimings(unittest.TestCase):
+    def setUp(self):
+        self.timings = Timings()
+
+    def test_empty(self):
+        self.assertFalse(self.timings)
+        self.assertEqual(str(self.timings), '')
+        self.assertEqual(self.timings.server_timing(), '')
+
+    def test_add(self):
+        self.timings.add('auth', .0123)
+        self.timings.add('call', .1)
+        self.timings.add('auth', .001)
+        self.assertTrue(self.timings)
+        self.assertEqual(str(self.timings), 'auth=13.30ms call=100.00ms')
+        self.assertEqual(self.timings.server_timing(),
+                         'auth;dur=13.30, call;dur=100.00')
+
+    def test_phase(self):
+        with mock.patch('time.time', side_effect=[100, 100.5]):
+            with self.timings('lock'):
+                pass
+        self.assertEqual(self.timings.durations, {'lock': .5})
+
+    def test_phase_exception(self):
+        with mock.patch('time.time', side_effect=[100, 100.5]):
+            try:
+                with self.timings('call'):
+                    raise ValueError()
+            except ValueError:
+                pass
+        self.assertEqual(self.timings.durations, {'call': .5})
+
+    def test_null_timings(self):
+        timings = NullTimings()
+        with timings('call'):
+            pass
+        self.assertFalse(timings)
+
+    def test_get_timings(self):
+        self.assertTrue(get_timings({'napixd.timings': self.timings}) is self.timings)
+
+    def test_get_timings_missing(self):
+        self.assertTrue(get_timings({}) is null_timings)
@@ -12,6 +12,8 @@ import functools
 try:
     import gevent
     from napixd.gevent_tools import Greenlet, Tracer, AddGeventTimeHeader
+    from napixd.chrono import Timings
+    from napixd.utils.metrics import Registry
 except ImportError:
     __test__ = False
 
@@ -25,20 +27,33 @@ class TestTimedGreenlet(unittest.TestCase):
         self.assertEquals(self.greenlet.get_running_time(), 0)
 
     def test_running(self):
-        self.greenlet.add_time()
+        self.greenlet.switch_in()
+        time.sleep(.1)
+        self.greenlet.switch_out()
+        self.assertAlmostEquals(self.greenlet.get_running_time(), .1, places=2)
+
+    def test_still_running(self):
+        self.greenlet.switch_in()
         time.sleep(.1)
-        self.greenlet.add_time()
         self.assertAlmostEquals(self.greenlet.get_running_time(), .1, places=2)
 
     def test_running_and_yielding(self):
-        self.greenlet.add_time()
+        self.greenlet.switch_in()
         time.sleep(.1)  # running
-        self.greenlet.add_time()
+        self.greenlet.switch_out()
         time.sleep(.1)  # not running
-        self.greenlet.add_time()
+        self.greenlet.switch_in()
         time.sleep(.1)  # running
-        self.greenlet.add_time()
+        self.greenlet.switch_out()
         self.assertAlmostEquals(self.greenlet.get_running_time(), .2, places=2)
+        self.assertEquals(self.greenlet.switches, 2)
+
+    def test_switch_out_twice(self):
+        with mock.patch('napixd.gevent_tools.monotonic', side_effect=[10, 11]):
+            self.greenlet.switch_in()
+            self.greenlet.switch_out()
+            self.greenlet.switch_out()
+        self.assertEquals(self.greenlet.get_running_time(), 1)
 
 
 class TestTracer(unittest.TestCase):
@@ -68,8 +83,8 @@ class TestTracer(unittest.TestCase):
 
         g1.join()
 
-        self.assertEquals(len(list(g1.get_running_intervals())), 3)
-        self.assertEquals(len(list(g2.get_running_intervals())), 2)
+        self.assertEquals(g1.switches, 3)
+        self.assertEquals(g2.switches, 2)
 
 
 class TestGeventHeaders(unittest.TestCase):
@@ -81,7 +96,11 @@ class TestGeventHeaders(unittest.TestCase):
 
     def setUp(self):
         self.plugin = AddGeventTimeHeader()
-        self.callback = functools.partial(self.plugin, self._do_something, mock.Mock())
+        self.request = mock.Mock(environ={'napixd.timings': Timings()})
+        self.callback = functools.partial(self.plugin, self._do_something, self.request)
+
+    def tearDown(self):
+        self.plugin.tracer.unset_trace()
 
     def test_run_solo(self):
         resp = self.callback()
@@ -93,3 +112,15 @@ class TestGeventHeaders(unittest.TestCase):
         for resp in resps:
             self.assertAlmostEquals(float(resp.headers['x-total-time']), .2, places=1)
             self.assertAlmostEquals(float(resp.headers['x-running-time']), .1, places=1)
+
+    def test_timings(self):
+        self.callback()
+        self.assertAlmostEquals(self.request.environ['napixd.timings'].durations['cpu'], .1, places=1)
+
+    def test_metrics(self):
+        registry = Registry()
+        self.request.environ['napixd.metrics.labels'] = {'service': u'a', 'collection': u'/a'}
+        with mock.patch('napixd.utils.metrics.registry', registry):
+            self.callback()
+        histogram = registry.histogram('napixd_request_cpu_seconds', service=u'a', collection=u'/a')
+        self.assertEquals(histogram.count, 1)
@@ -53,6 +53,27 @@ class TestServer(unittest.TestCase):
         cast = Cast.return_value
         self.assertEqual(resp, cast.body)
 
+    def test_server_timing(self):
+        self.server = WSGIServer(server_timing=True)
+        self.environ = {}
+        with mock.patch.object(self.server, 'cast') as Cast:
+            Cast.return_value.headers = {}
+            with mock.patch.object(self.server, 'handle') as handle:
+                handle.side_effect = lambda request: self.environ['napixd.timings'].add('route', .002)
+                self.call()
+
+        self.assertEqual(Cast.return_value.headers['Server-Timing'], 'route;dur=2.00')
+
+    def test_no_server_timing(self):
+        self.environ = {}
+        with mock.patch.object(self.server, 'cast') as Cast:
+            Cast.return_value.headers = {}
+            with mock.patch.object(self.server, 'handle') as handle:
+                handle.side_effect = lambda request: self.environ['napixd.timings'].add('route', .002)
+                self.call()
+
+        self.assertFalse('Server-Timing' in Cast.return_value.headers)
+
     def test_handle_404(self):
         self.router.resolve.return_value = None
         resp = self.server.handle(self.request)
@@ -83,3 +83,28 @@ class TestDiffDict(unittest.TestCase):
         self.assertEqual(self.cs.deleted, set(['deleted', 'changed']))
         self.assertEqual(self.cs.added, set(['new']))
         self.assertEqual(self.cs.changed, set())
+
+    def test_view(self):
+        patches = {'a': 1}
+        cs = DiffDict({}, patches)
+        cs['b'] = 2
+        self.assertEqual(patches, {'a': 1, 'b': 2})
+
+    def test_update_after_access(self):
+        self.assertEqual(self.cs.added, set(['new']))
+        self.assertEqual(self.cs.deleted, set(['deleted']))
+        self.assertEqual(self.cs.changed, set(['changed']))
+
+        self.cs['deleted'] = 2
+        self.cs['untouched'] = 5
+        self.cs['added_after'] = 1
+        del self.cs['new']
+        del self.cs['changed']
+
+        self.assertEqual(self.cs.added, set(['added_after']))
+        self.assertEqual(self.cs.deleted, set(['changed']))
+        self.assertEqual(self.cs.changed, set(['untouched']))
+
+    def test_returned_sets_are_copies(self):
+        self.cs.added.add('other')
+        self.assertEqual(self.cs.added, set(['new']))
@@ -3,13 +3,23 @@
 
 from __future__ import absolute_import
 
+import os
+import shutil
+import tempfile
 import unittest
 import mock
 
-from napixd.managers.default import ReadOnlyDictManager, DictManager, FileManager
+from napixd.managers.default import (
+    ReadOnlyDictManager,
+    DictManager,
+    FileManager,
+    flush_pending_writes,
+)
 from napixd.exceptions import NotFound, Duplicate
 from napixd.services.wrapper import ResourceWrapper
 from napixd.managers.changeset import DiffDict
+from napixd.http.request import Query
+from napixd.services.transaction import Transaction
 
 
 class _TestDM(unittest.TestCase):
@@ -141,6 +151,218 @@ class TestDictManager(_TestDM):
                           })
 
 
+class TestIndexedDictManager(_TestDM):
+
+    def setUp(self):
+        self.spy_save = spy_save = mock.Mock()
+        super(TestIndexedDictManager, self).setUp(DictManager, {
+            'save': spy_save,
+            'indexes': ['french', 'german'],
+            'generate_new_id': mock.Mock(return_value='four'),
+        })
+
+    def test_filter(self):
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'french': 'deux'})), ['two'])
+
+    def test_filter_several_values(self):
+        self.assertEqual(sorted(self.manager.list_resource_filter(
+            Query([('french', 'deux'), ('french', 'un')]))), ['one', 'two'])
+
+    def test_filter_several_fields(self):
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'french': 'deux', 'german': 'eins'})), [])
+
+    def test_filter_not_indexed(self):
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'english': 'one'})), [])
+
+    def test_filter_scan(self):
+        self.resources['one']['english'] = 'one'
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'english': 'one'})), ['one'])
+
+    def test_filter_index_and_scan(self):
+        self.resources['one']['english'] = 'one'
+        self.resources['two']['english'] = 'one'
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'english': 'one', 'french': 'deux'})), ['two'])
+
+    def test_filter_ignored(self):
+        self.assertEqual(sorted(self.manager.list_resource_filter(
+            Query({'getall': '', 'token': 'user:sign'}))), ['one', 'three', 'two'])
+
+    def test_filter_not_string(self):
+        self.resources['one']['german'] = 1
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'german': '1'})), ['one'])
+
+    def test_get_all_filter(self):
+        self.assertEqual(self.manager.get_all_resources_filter(
+            Query({'german': 'drei'})),
+            [('three', {'french': 'trois', 'german': 'drei'})])
+
+    def test_create_resource(self):
+        self.manager.list_resource_filter(Query({}))
+        self.manager.create_resource({'french': 'quatre', 'german': 'vier'})
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'french': 'quatre'})), ['four'])
+
+    def test_modify_resource(self):
+        self.manager.list_resource_filter(Query({}))
+        self.manager.modify_resource(
+            ResourceWrapper(self.manager, 'one', self.resources['one']),
+            {'german': 'Kartofel'})
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'german': 'eins'})), [])
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'german': 'Kartofel'})), ['one'])
+
+    def test_delete_resource(self):
+        self.manager.list_resource_filter(Query({}))
+        self.manager.delete_resource(ResourceWrapper(self.manager, 'one'))
+        self.assertEqual(self.manager.list_resource_filter(
+            Query({'french': 'un'})), [])
+
+
+class TestCachedIndexedDictManager(_TestDM):
+
+    def setUp(self):
+        self.spy_save = spy_save = mock.Mock()
+        super(TestCachedIndexedDictManager, self).setUp(DictManager, {
+            'save': spy_save,
+            'cache': True,
+            'indexes': ['french'],
+            'get_cache_key': mock.Mock(return_value='key'),
+            'generate_new_id': mock.Mock(return_value='four'),
+        })
+        self.Manager = type(self.manager)
+
+    def new_manager(self):
+        return self.Manager(self.parent, self.request)
+
+    def test_index_shared(self):
+        self.manager.list_resource_filter(Query({'french': 'un'}))
+        with mock.patch.object(self.Manager, '_build_index') as build:
+            self.assertEqual(self.new_manager().list_resource_filter(
+                Query({'french': 'un'})), ['one'])
+        self.assertEqual(build.call_count, 0)
+
+    def test_index_modified(self):
+        self.manager.list_resource_filter(Query({'french': 'un'}))
+        self.new_manager().create_resource({'french': 'quatre'})
+        self.assertEqual(self.new_manager().list_resource_filter(
+            Query({'french': 'quatre'})), ['four'])
+
+    def test_index_reloaded(self):
+        self.manager.list_resource_filter(Query({'french': 'un'}))
+        self.spy_load.return_value = {'five': {'french': 'un'}}
+        with mock.patch.object(self.Manager, 'get_cache_version', return_value=1):
+            self.assertEqual(self.new_manager().list_resource_filter(
+                Query({'french': 'un'})), ['five'])
+
+
+class TestCachedDictManager(_TestDM):
+
+    def setUp(self):
+        self.spy_save = spy_save = mock.Mock()
+        super(TestCachedDictManager, self).setUp(DictManager, {
+            'save': spy_save,
+            'cache': True,
+            'get_cache_key': mock.Mock(return_value='key'),
+            'generate_new_id': mock.Mock(return_value='four'),
+        })
+        self.Manager = type(self.manager)
+
+    def new_manager(self):
+        return self.Manager(self.parent, self.request)
+
+    def test_shared(self):
+        self.manager.list_resource()
+        self.new_manager().list_resource()
+        self.spy_load.assert_called_once_with(self.parent)
+
+    def test_version(self):
+        self.manager.list_resource()
+        with mock.patch.object(self.Manager, 'get_cache_version', return_value=1):
+            self.new_manager().list_resource()
+        self.assertEqual(self.spy_load.call_count, 2)
+
+    def test_save(self):
+        self.manager.create_resource({'french': 'quatre'})
+        self.assertEqual(sorted(self.new_manager().list_resource()),
+                         ['four', 'one', 'three', 'two'])
+        self.spy_load.assert_called_once_with(self.parent)
+
+    def test_save_error(self):
+        self.spy_save.side_effect = IOError()
+        self.assertRaises(IOError, self.manager.create_resource, {'french': 'quatre'})
+        self.new_manager().list_resource()
+        self.assertEqual(self.spy_load.call_count, 2)
+
+    def test_cache_by_class(self):
+        self.manager.list_resource()
+        _TestDM.setUp(self, DictManager, {
+            'cache': True,
+            'get_cache_key': mock.Mock(return_value='key'),
+        })
+        self.manager.list_resource()
+        self.spy_load.assert_called_once_with(self.parent)
+
+
+class TestTransactionalDictManager(_TestDM):
+
+    def setUp(self):
+        self.spy_save = spy_save = mock.Mock()
+        super(TestTransactionalDictManager, self).setUp(DictManager, {
+            'save': spy_save,
+            'transactional': True,
+            'generate_new_id': mock.Mock(side_effect=['four', 'five']),
+        })
+        self.transaction = self.request.transaction = Transaction()
+
+    def test_coalesce(self):
+        with self.transaction:
+            self.manager.create_resource({'french': 'quatre'})
+            self.manager.create_resource({'french': 'cinq'})
+            self.manager.delete_resource(ResourceWrapper(self.manager, 'one'))
+            self.assertEqual(self.spy_save.call_count, 0)
+        self.spy_save.assert_called_once_with(self.parent, self.manager.resources)
+
+    def test_rollback(self):
+        try:
+            with self.transaction:
+                self.manager.create_resource({'french': 'quatre'})
+                self.manager.delete_resource(ResourceWrapper(self.manager, 'one'))
+                self.manager.modify_resource(
+                    ResourceWrapper(self.manager, 'two', self.resources['two']),
+                    {'german': 'Kartofel'})
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual(self.spy_save.call_count, 0)
+        self.assertEqual(self.manager.resources, {
+            'one': {'french': 'un', 'german': 'eins'},
+            'two': {'french': 'deux', 'german': 'zwei'},
+            'three': {'french': 'trois', 'german': 'drei'}
+        })
+
+    def test_rollback_change_id(self):
+        self.manager.generate_id = mock.Mock(return_value='seven')
+        try:
+            with self.transaction:
+                self.manager.modify_resource(
+                    ResourceWrapper(self.manager, 'two', self.resources['two']),
+                    {'german': 'Kartofel'})
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertEqual(sorted(self.manager.resources), ['one', 'three', 'two'])
+        self.assertEqual(self.manager.resources['two']['german'], 'zwei')
+
+
 class MyFileManager(FileManager):
 
     def get_filename(self, context):
@@ -192,6 +414,141 @@ class TestFileManager(unittest.TestCase):
             popen.side_effect = IOError()
             self.assertEqual(self.fm.resources, {})
 
+    def test_cache_key(self):
+        self.assertEqual(self.fm.get_cache_key(self.parent), self.parent.fname)
+
+    def test_cache_version(self):
+        with mock.patch('os.path.getmtime') as getmtime:
+            self.assertEqual(self.fm.get_cache_version(self.parent),
+                             getmtime.return_value)
+        getmtime.assert_called_once_with(self.parent.fname)
+
+    def test_cache_version_no_file(self):
+        with mock.patch('os.path.getmtime', side_effect=OSError()):
+            self.assertEqual(self.fm.get_cache_version(self.parent), None)
+
+
+class LinesFileManager(FileManager):
+    def get_filename(self, context):
+        return context
+
+    def parse(self, fp):
+        for line in fp:
+            key, value = line.strip().split(':')
+            yield key, {'value': value}
+
+    def write(self, fp, resources):
+        for key, resource in sorted(resources.items()):
+            fp.write('{0}:{1}\n'.format(key, resource['value']))
+
+
+class TestFileManagerWrites(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'resources')
+        with open(self.filename, 'w') as handle:
+            handle.write('a:1\n')
+        os.chmod(self.filename, 0o640)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def manager(self, **attrs):
+        Manager = type('Manager', (LinesFileManager, ), attrs)
+        return Manager(self.filename, mock.Mock())
+
+    def content(self):
+        with open(self.filename) as handle:
+            return handle.read()
+
+    def test_atomic(self):
+        self.manager(atomic=True).save(self.filename, {'b': {'value': 2}})
+        self.assertEqual(self.content(), 'b:2\n')
+        self.assertEqual(os.listdir(self.directory), ['resources'])
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o640)
+
+    def test_atomic_new_file(self):
+        os.unlink(self.filename)
+        umask = os.umask(0o027)
+        try:
+            self.manager(atomic=True).save(self.filename, {'b': {'value': 2}})
+        finally:
+            os.umask(umask)
+        self.assertEqual(self.content(), 'b:2\n')
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o640)
+
+    def test_atomic_no_fsync(self):
+        with mock.patch('os.fsync') as fsync:
+            self.manager(atomic=True, fsync=False).save(
+                self.filename, {'b': {'value': 2}})
+        self.assertEqual(fsync.call_count, 0)
+        self.assertEqual(self.content(), 'b:2\n')
+
+    def test_atomic_error(self):
+        manager = self.manager(atomic=True)
+        with mock.patch.object(manager, 'write', side_effect=ValueError()):
+            self.assertRaises(ValueError, manager.save, self.filename, {})
+        self.assertEqual(self.content(), 'a:1\n')
+        self.assertEqual(os.listdir(self.directory), ['resources'])
+
+    def test_write_behind(self):
+        manager = self.manager(write_delay=.01)
+        with mock.patch('napixd.managers.default.run_background') as background:
+            manager.save(self.filename, {'b': {'value': 2}})
+            manager.save(self.filename, {'c': {'value': 3}})
+
+        background.assert_called_once_with(manager._write_behind, self.filename)
+        self.assertEqual(self.content(), 'a:1\n')
+        self.assertEqual(manager.load(self.filename), {'c': {'value': 3}})
+
+        manager._write_behind(self.filename)
+        self.assertEqual(self.content(), 'c:3\n')
+        self.assertEqual(manager.load(self.filename), {'c': {'value': '3'}})
+
+    def test_write_behind_snapshot(self):
+        manager = self.manager(write_delay=.01)
+        resources = {'b': {'value': 2}}
+        with mock.patch('napixd.managers.default.run_background'):
+            manager.save(self.filename, resources)
+        resources['b']['value'] = 3
+        manager.load(self.filename)['b']['value'] = 4
+
+        self.assertEqual(manager.load(self.filename), {'b': {'value': 2}})
+        manager._write_behind(self.filename)
+        self.assertEqual(self.content(), 'b:2\n')
+
+    def test_write_behind_error(self):
+        manager = self.manager(write_delay=.01)
+        with mock.patch('napixd.managers.default.run_background'):
+            manager.save(self.filename, {'b': {'value': 2}})
+
+        errors = [IOError()]
+        write = manager.write
+
+        def failing_write(fp, resources):
+            if errors:
+                raise errors.pop()
+            write(fp, resources)
+
+        with mock.patch.object(manager, 'write', side_effect=failing_write):
+            with mock.patch('napixd.managers.default.logger') as logger:
+                manager._write_behind(self.filename)
+
+        self.assertEqual(logger.exception.call_count, 1)
+        self.assertEqual(self.content(), 'b:2\n')
+
+    def test_flush(self):
+        manager = self.manager(write_delay=10)
+        with mock.patch('napixd.managers.default.run_background'):
+            manager.save(self.filename, {'b': {'value': 2}})
+
+        flush_pending_writes()
+        self.assertEqual(self.content(), 'b:2\n')
+        # The background write has nothing left to write
+        with mock.patch('time.sleep'):
+            manager._write_behind(self.filename)
+        self.assertEqual(manager.load(self.filename), {'b': {'value': '2'}})
+
 
 class MyManager(DictManager):
     resource_fields = {
@@ -265,6 +622,17 @@ class TestImplements(unittest.TestCase):
             'modify_resource',
         ]))
 
+    def test_implements_indexes(self):
+        class MyMGR(DictManager):
+            indexes = ['field']
+
+        self.assertEqual(MyMGR.implements(), set([
+            'list_resource',
+            'get_resource',
+            'list_resource_filter',
+            'get_all_resources_filter',
+        ]))
+
     def test_implements_no_save(self):
         class MyMGR(DictManager):
             pass
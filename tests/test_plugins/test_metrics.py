@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import mock
+
+from napixd.http.request import Request
+from napixd.http.router.router import Router
+from napixd.utils.metrics import Registry
+from napixd.plugins.metrics import MetricsEndpoint, MetricsMiddleware
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.registry.counter('requests').inc()
+        self.endpoint = MetricsEndpoint(self.registry)
+
+    def test_setup_bottle(self):
+        router = mock.Mock(spec=Router)
+        self.endpoint.setup_bottle(router)
+        router.route.assert_called_once_with(
+            '/_napix_metrics', self.endpoint.metrics)
+
+    def test_setup_bottle_filtered(self):
+        router = Router()
+        auth = mock.Mock(side_effect=lambda callback, request: 'denied')
+        router.add_filter(auth)
+        self.endpoint.setup_bottle(router)
+
+        resolved = router.resolve('/_napix_metrics')
+        self.assertEqual(resolved(mock.Mock(spec=Request)), 'denied')
+
+    def test_metrics(self):
+        resp = self.endpoint.metrics(mock.Mock(spec=Request))
+        self.assertEqual(resp.headers['Content-Type'], 'text/plain; version=0.0.4')
+        self.assertEqual(resp.body, '# TYPE requests counter\nrequests 1\n')
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.app = mock.Mock()
+        self.start_response = mock.Mock()
+        self.environ = {'REQUEST_METHOD': 'GET'}
+        self.middleware = MetricsMiddleware(self.app, self.registry)
+
+    def call(self):
+        return self.middleware(self.environ, self.start_response)
+
+    def samples(self):
+        return dict((name, dict(labels)) for name, labels, value in self.registry.collect()
+                    if name in ('napixd_requests_total', 'napixd_request_duration_seconds_count'))
+
+    def test_call(self):
+        def app(environ, start_response):
+            environ['napixd.metrics.labels'] = {'service': u'vhosts', 'collection': u'/vhosts'}
+            start_response('200 OK', [])
+            return ['body']
+        self.app.side_effect = app
+
+        self.assertEqual(self.call(), ['body'])
+        self.start_response.assert_called_once_with('200 OK', [])
+        self.assertEqual(self.samples(), {
+            'napixd_requests_total': {
+                'service': u'vhosts',
+                'collection': u'/vhosts',
+                'method': 'GET',
+                'status': '200',
+            },
+            'napixd_request_duration_seconds_count': {
+                'service': u'vhosts',
+                'collection': u'/vhosts',
+            },
+        })
+
+    def test_call_no_labels(self):
+        def app(environ, start_response):
+            start_response('404 Not Found', [])
+            return ['body']
+        self.app.side_effect = app
+
+        self.call()
+        self.assertEqual(self.samples()['napixd_requests_total'], {
+            'service': u'',
+            'collection': u'',
+            'method': 'GET',
+            'status': '404',
+        })
+
+    def test_call_error(self):
+        self.app.side_effect = ValueError()
+        self.assertRaises(ValueError, self.call)
+        self.assertEqual(self.samples()['napixd_requests_total']['status'], '500')
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import shutil
+import threading
+import tempfile
+import unittest
+import mock
+import gevent
+
+from napixd.http.request import Request
+from napixd.http.router.router import Router
+from napixd.plugins.profiler import (
+    collapse,
+    StackSampler,
+    ProfileStore,
+    ProfilerPlugin,
+    ProfileEndpoint,
+)
+
+
+def frame(name, back=None):
+    return mock.Mock(
+        f_code=mock.Mock(co_name=name, co_filename='/a/b/mod.py', co_firstlineno=12),
+        f_back=back)
+
+
+class TestCollapse(unittest.TestCase):
+    def test_collapse(self):
+        self.assertEqual(collapse(frame('inner', frame('outer'))),
+                         'outer (mod.py:12);inner (mod.py:12)')
+
+
+class TestStackSampler(unittest.TestCase):
+    def setUp(self):
+        self.start_thread = mock.Mock()
+        self.current = mock.Mock(return_value=mock.Mock(gr_frame=None))
+        self.sampler = StackSampler(.01, self.current, start_thread=self.start_thread,
+                                    get_ident=mock.Mock(return_value=123))
+
+    def test_start_stop(self):
+        self.sampler.start()
+        self.start_thread.assert_called_once_with(self.sampler._run, ())
+        self.sampler.start(mock.Mock())
+        self.assertEqual(self.start_thread.call_count, 1)
+
+        self.sampler.stop()
+        self.assertEqual(len(self.sampler._profiles), 1)
+
+    def test_sample_idle(self):
+        self.assertFalse(self.sampler.sample())
+
+    def test_sample_greenlet(self):
+        running = self.current.return_value
+        stacks = self.sampler.start()
+        waiting = mock.Mock(gr_frame=frame('wait'))
+        waiting_stacks = self.sampler.start(waiting)
+
+        with mock.patch('sys._current_frames', return_value={123: frame('run')}):
+            self.assertTrue(self.sampler.sample())
+            self.assertTrue(self.sampler.sample())
+            running.gr_frame = frame('switched')
+            self.sampler.sample()
+
+        self.assertEqual(stacks, {'run (mod.py:12)': 2, 'switched (mod.py:12)': 1})
+        self.assertEqual(waiting_stacks, {'wait (mod.py:12)': 3})
+
+    def test_sample_thread(self):
+        sampler = StackSampler(.01, start_thread=self.start_thread)
+        stacks = sampler.start(123)
+        with mock.patch('sys._current_frames', return_value={123: frame('run')}):
+            sampler.sample()
+        self.assertEqual(stacks, {'run (mod.py:12)': 1})
+
+
+def wait_io(wait):
+    wait()
+
+
+class TestStackSamplerWaiting(unittest.TestCase):
+    """
+    The requests waiting for the I/O are sampled.
+    """
+    def sampled(self, stacks):
+        return sum(count for stack, count in stacks.items() if 'wait_io' in stack)
+
+    def test_thread(self):
+        sampler = StackSampler(.001)
+        stacks = sampler.start()
+        try:
+            server, client = socket.socketpair()
+            threading.Timer(.1, client.send, ['x']).start()
+            wait_io(lambda: server.recv(1))
+        finally:
+            sampler.stop()
+        self.assertTrue(self.sampled(stacks) > 10)
+
+    def test_greenlet(self):
+        sampler = StackSampler(.001, gevent.getcurrent)
+
+        def request():
+            stacks = sampler.start()
+            try:
+                wait_io(lambda: gevent.sleep(.1))
+            finally:
+                sampler.stop()
+            return stacks
+
+        stacks = gevent.spawn(request).get()
+        self.assertTrue(self.sampled(stacks) > 10)
+
+
+class TestProfileStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = ProfileStore(self.directory, keep=2)
+
+    def save(self, time, path='/a/b'):
+        with mock.patch('time.time', return_value=time):
+            with mock.patch('os.getpid', return_value=42):
+                return self.store.save('GET', path, 1.5, {'a;b': 3, 'a': 1})
+
+    def test_save(self):
+        name = self.save(1000)
+        self.assertEqual(name, '1000.000000-42.collapsed')
+        self.assertEqual(self.store.get(name),
+                         '# GET /a/b 1500.00ms\na 1\na;b 3\n')
+
+    def test_list(self):
+        self.save(1000, '/a')
+        self.save(1001, '/b')
+        self.assertEqual(self.store.list(), [
+            {'name': '1001.000000-42.collapsed', 'time': 1001., 'method': 'GET',
+             'path': '/b', 'duration': 1500.},
+            {'name': '1000.000000-42.collapsed', 'time': 1000., 'method': 'GET',
+             'path': '/a', 'duration': 1500.},
+        ])
+
+    def test_rotate(self):
+        self.save(1000)
+        self.save(1001)
+        self.save(1002)
+        self.assertEqual(sorted(os.listdir(self.directory)), [
+            '1001.000000-42.collapsed',
+            '1002.000000-42.collapsed',
+        ])
+
+    def test_get_unknown(self):
+        self.assertEqual(self.store.get('../../etc/passwd'), None)
+
+
+class TestProfilerPlugin(unittest.TestCase):
+    def setUp(self):
+        self.sampler = mock.Mock(spec=StackSampler)
+        self.store = mock.Mock(spec=ProfileStore)
+        self.plugin = ProfilerPlugin(self.sampler, self.store, 1)
+        self.callback = mock.Mock()
+        self.request = mock.Mock(spec=Request, method='GET', path='/a/b')
+
+    def call(self, duration):
+        with mock.patch('napixd.plugins.profiler.Chrono') as Chrono:
+            Chrono.return_value.__enter__.return_value.total = duration
+            Chrono.return_value.total = duration
+            return self.plugin(self.callback, self.request)
+
+    def test_fast(self):
+        resp = self.call(.5)
+        self.assertEqual(resp, self.callback.return_value)
+        self.sampler.start.assert_called_once_with()
+        self.sampler.stop.assert_called_once_with()
+        self.assertEqual(self.store.save.call_count, 0)
+
+    def test_slow(self):
+        self.call(2)
+        self.store.save.assert_called_once_with(
+            'GET', '/a/b', 2, self.sampler.start.return_value)
+
+    def test_slow_error(self):
+        self.callback.side_effect = ValueError()
+        self.assertRaises(ValueError, self.call, 2)
+        self.sampler.stop.assert_called_once_with()
+        self.assertEqual(self.store.save.call_count, 1)
+
+    def test_save_error(self):
+        self.store.save.side_effect = IOError()
+        resp = self.call(2)
+        self.assertEqual(resp, self.callback.return_value)
+
+
+class TestProfileEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.store = mock.Mock(spec=ProfileStore)
+        self.endpoint = ProfileEndpoint(self.store)
+        self.request = mock.Mock(spec=Request)
+
+    def test_setup_bottle(self):
+        router = mock.Mock(spec=Router)
+        self.endpoint.setup_bottle(router)
+        router.route.assert_has_calls([
+            mock.call('/_napix_profile', self.endpoint.profiles),
+            mock.call('/_napix_profile/?', self.endpoint.profile),
+        ])
+
+    def test_setup_bottle_filtered(self):
+        router = Router()
+        auth = mock.Mock(side_effect=lambda callback, request: 'denied')
+        router.add_filter(auth)
+        self.endpoint.setup_bottle(router)
+
+        resolved = router.resolve('/_napix_profile')
+        self.assertEqual(resolved(self.request), 'denied')
+        self.assertFalse(self.store.list.called)
+
+    def test_profiles(self):
+        self.assertEqual(self.endpoint.profiles(self.request),
+                         self.store.list.return_value)
+
+    def test_profile(self):
+        self.store.get.return_value = 'a;b 1\n'
+        resp = self.endpoint.profile(self.request, 'name')
+        self.store.get.assert_called_once_with('name')
+        self.assertEqual(resp.headers['Content-Type'], 'text/plain')
+        self.assertEqual(resp.body, 'a;b 1\n')
+
+    def test_profile_404(self):
+        self.store.get.return_value = None
+        resp = self.endpoint.profile(self.request, 'name')
+        self.assertEqual(resp.status, 404)
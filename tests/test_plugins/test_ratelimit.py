@@ -7,8 +7,21 @@ from __future__ import absolute_import
 import unittest
 import mock
 
-from napixd.http.response import HTTPResponse
-from napixd.plugins.ratelimit import RateLimiterPlugin
+from napixd.conf import Conf
+from napixd.http.response import HTTPResponse, HTTPError
+from napixd.utils.metrics import Registry
+from napixd.plugins.ratelimit import (
+    RateLimiterPlugin,
+    GCRARateLimiterPlugin,
+    BatchedRateLimiterPlugin,
+    ConcurrentLimiterPlugin,
+    LocalLeases,
+    RedisLeases,
+)
+
+from tests.utils.fake_redis import FakeRedis, lupa
+
+requires_lua = unittest.skipIf(lupa is None, 'The Lua scripts require lupa')
 
 
 class TestRateLimiterPlugin(unittest.TestCase):
@@ -41,6 +54,7 @@ class TestRateLimiterPlugin(unittest.TestCase):
             mock.call.multi(),
             mock.call.zadd('rate_limit:123', 1200, 1200),
             mock.call.expireat('rate_limit:123', 1260),
+            mock.call.zremrangebyscore('rate_limit:123', '-inf', '(1140'),
         ])
         self.assertEqual(resp, HTTPResponse({
             'x-ratelimit-remaining': '2',
@@ -67,3 +81,338 @@ class TestRateLimiterPlugin(unittest.TestCase):
             mock.call.zcount('rate_limit:123', 1140, 1200),
             mock.call.execute(),
         ])
+
+    def test_third_request_metrics(self):
+        self.pipe.zcount.return_value = 2
+        registry = Registry()
+        with mock.patch('napixd.utils.metrics.registry', registry):
+            self.call()
+        self.assertEqual(registry.counter('napixd_ratelimit_rejected_total',
+                                          limiter='rate').value, 1)
+
+
+class TestRateLimiterFromSettings(unittest.TestCase):
+    def from_settings(self, **settings):
+        settings.update(max=2, timespan=60)
+        with mock.patch('napixd.plugins.ratelimit.connection_factory'):
+            return RateLimiterPlugin.from_settings(Conf(settings), mock.Mock())
+
+    def test_default(self):
+        self.assertEqual(type(self.from_settings()), RateLimiterPlugin)
+
+    def test_gcra(self):
+        self.assertTrue(isinstance(self.from_settings(algorithm=u'gcra'),
+                                   GCRARateLimiterPlugin))
+
+    def test_batched(self):
+        rl = self.from_settings(algorithm=u'batched', batch=5)
+        self.assertTrue(isinstance(rl, BatchedRateLimiterPlugin))
+        self.assertEqual(rl._batch, 5)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, self.from_settings, algorithm=u'leaky')
+
+
+class TestGCRARateLimiterPlugin(unittest.TestCase):
+    def setUp(self):
+        self.con = mock.Mock()
+        self.script = self.con.register_script.return_value
+        self.rl = GCRARateLimiterPlugin(3, 60, self.con, mock.Mock(), [])
+
+    def used(self):
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = 1200.
+            return self.rl.get_rate_used('123')
+
+    def test_first(self):
+        self.script.return_value = [1, '0']
+        self.assertEqual(self.used(), 0)
+        self.script.assert_called_once_with(
+            keys=['rate_limit_gcra:123'], args=['1200.0', '20.0', 60])
+
+    def test_used(self):
+        self.script.return_value = [1, '25.5']
+        self.assertEqual(self.used(), 2)
+
+    def test_denied(self):
+        self.script.return_value = [0, '45']
+        self.assertEqual(self.used(), 3)
+
+    def test_denied_retry_after(self):
+        self.script.return_value = [0, '4.5']
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = 1200.
+            self.assertEqual(self.rl.get_usage('123'), (3, 5))
+
+
+@requires_lua
+class TestGCRAScript(unittest.TestCase):
+    def setUp(self):
+        # 2 requests by 60 seconds, a request every 30 seconds
+        self.con = FakeRedis()
+        self.rl = GCRARateLimiterPlugin(2, 60, self.con, mock.Mock(return_value='123'), [])
+        self.callback = mock.Mock(return_value='ok')
+
+    def call(self, now):
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = now
+            return self.rl(self.callback, mock.Mock())
+
+    def test_burst(self):
+        first = self.call(1000.)
+        self.assertEqual(first.status, 200)
+        self.assertEqual(first.headers['x-ratelimit-used'], '0')
+        second = self.call(1000.)
+        self.assertEqual(second.status, 200)
+        self.assertEqual(second.headers['x-ratelimit-used'], '1')
+
+        denied = self.call(1000.)
+        self.assertEqual(denied.status, 429)
+        self.assertEqual(denied.headers['retry-after'], '30')
+        self.assertEqual(self.callback.call_count, 2)
+
+    def test_boundary(self):
+        self.call(1000.)
+        self.call(1000.)
+        self.assertEqual(self.call(1029.).headers['retry-after'], '1')
+        self.assertEqual(self.call(1030.).status, 200)
+        self.assertEqual(self.call(1030.).status, 429)
+
+    def test_denied_not_counted(self):
+        self.call(1000.)
+        self.call(1000.)
+        for x in range(5):
+            self.call(1010.)
+        self.assertEqual(self.call(1030.).status, 200)
+
+    def test_idle(self):
+        self.call(1000.)
+        self.call(1000.)
+        self.assertEqual([self.call(2000.).status for x in range(3)], [200, 200, 429])
+
+
+class TestBatchedRateLimiterPlugin(unittest.TestCase):
+    def setUp(self):
+        self.con = mock.Mock()
+        self.pipe = self.con.pipeline.return_value
+        self.shared = 0
+        self.pipe.execute.side_effect = self.execute
+        self.rl = BatchedRateLimiterPlugin(10, 60, self.con, mock.Mock(), [], batch=3)
+
+    def execute(self):
+        count = self.pipe.incrby.call_args[0][1]
+        self.shared += count
+        return [self.shared, True]
+
+    def used(self, now=1200):
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = now
+            return self.rl.get_rate_used('123')
+
+    def test_first_push(self):
+        self.shared = 4
+        self.assertEqual(self.used(), 4)
+        self.pipe.incrby.assert_called_once_with('rate_limit:123:20', 1)
+        self.pipe.expireat.assert_called_once_with('rate_limit:123:20', 1260)
+
+    def test_batch(self):
+        self.assertEqual([self.used() for x in range(5)], [0, 1, 2, 3, 4])
+        self.assertEqual(self.pipe.incrby.call_args_list, [
+            mock.call('rate_limit:123:20', 1),
+            mock.call('rate_limit:123:20', 3),
+        ])
+
+    def test_limit(self):
+        self.shared = 9
+        self.assertEqual(self.used(), 9)
+        self.assertEqual(self.used(), 10)
+        self.assertEqual(self.pipe.incrby.call_count, 1)
+
+    def test_new_window(self):
+        self.used()
+        self.used()
+        self.used(now=1260)
+        self.assertEqual(self.pipe.incrby.call_args_list[-1],
+                         mock.call('rate_limit:123:21', 1))
+        self.assertEqual(list(self.rl._counters), ['123'])
+
+
+@requires_lua
+class TestBatchedRedis(unittest.TestCase):
+    def setUp(self):
+        # 6 requests by 60 seconds, pushed by 2 requests by each instance
+        self.con = FakeRedis()
+        self.instances = [
+            BatchedRateLimiterPlugin(6, 60, self.con, mock.Mock(), [], batch=2)
+            for x in range(2)]
+
+    def used(self, instance, now=1200):
+        # The keys expire at the time of the windows
+        with mock.patch('time.time', return_value=now):
+            return self.instances[instance].get_rate_used('123')
+
+    def allowed(self, instance, now=1200):
+        return self.used(instance, now) < 6
+
+    def test_shared(self):
+        self.assertEqual([self.used(0), self.used(1)], [0, 1])
+        self.assertEqual(self.con.data['rate_limit:123:20'], '2')
+        self.assertEqual(self.con.expires['rate_limit:123:20'], 1260)
+
+    def test_boundary(self):
+        allowed = [self.allowed(x % 2) for x in range(12)]
+        # The instances accept at most batch - 1 request each over the limit
+        self.assertEqual(allowed, [True] * 7 + [False] * 5)
+        self.assertEqual(self.con.data['rate_limit:123:20'], '8')
+
+    def test_new_window(self):
+        for x in range(12):
+            self.allowed(x % 2)
+        self.assertTrue(self.allowed(0, now=1260))
+        self.assertTrue(self.allowed(1, now=1260))
+        self.assertEqual(self.con.data['rate_limit:123:21'], '2')
+
+
+class TestLocalLeases(unittest.TestCase):
+    def setUp(self):
+        self.leases = LocalLeases()
+
+    def acquire(self, token, now=1000):
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = now
+            return self.leases.acquire('123', token, 2, 60)
+
+    def test_acquire(self):
+        self.assertTrue(self.acquire('a'))
+        self.assertTrue(self.acquire('b'))
+        self.assertFalse(self.acquire('c'))
+
+    def test_release(self):
+        self.acquire('a')
+        self.acquire('b')
+        self.leases.release('123', 'a')
+        self.assertTrue(self.acquire('c'))
+
+    def test_expired(self):
+        self.acquire('a')
+        self.acquire('b', now=1030)
+        self.assertTrue(self.acquire('c', now=1060))
+        self.assertFalse(self.acquire('d', now=1060))
+
+
+class TestRedisLeases(unittest.TestCase):
+    def setUp(self):
+        self.con = mock.Mock()
+        self.script = self.con.register_script.return_value
+        self.leases = RedisLeases(self.con)
+
+    def test_acquire(self):
+        self.script.return_value = 1
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = 1000.
+            self.assertTrue(self.leases.acquire('123', 'a', 2, 60))
+        self.script.assert_called_once_with(
+            keys=['concurrent_limit:123'], args=['1000.0', 60, 2, 'a'])
+
+    def test_release(self):
+        self.leases.release('123', 'a')
+        self.con.zrem.assert_called_once_with('concurrent_limit:123', 'a')
+
+
+@requires_lua
+class TestLeasesScript(unittest.TestCase):
+    def setUp(self):
+        self.con = FakeRedis()
+        self.leases = RedisLeases(self.con)
+
+    def acquire(self, token, now=1000.):
+        with mock.patch('napixd.plugins.ratelimit.time') as time:
+            time.time.return_value = now
+            return self.leases.acquire('123', token, 2, 60)
+
+    def test_acquire(self):
+        self.assertTrue(self.acquire('a'))
+        self.assertTrue(self.acquire('b'))
+        self.assertFalse(self.acquire('c'))
+        self.assertEqual(self.con.data['concurrent_limit:123'],
+                         {'a': 1060., 'b': 1060.})
+
+    def test_expire_while_held(self):
+        self.acquire('a')
+        self.acquire('b', now=1030.)
+        # The lease of a has expired while its request is still running
+        self.assertTrue(self.acquire('c', now=1061.))
+        self.assertFalse(self.acquire('d', now=1061.))
+
+        # The late release of a does not free the slot of an other request
+        self.leases.release('123', 'a')
+        self.assertFalse(self.acquire('d', now=1062.))
+        self.leases.release('123', 'c')
+        self.assertTrue(self.acquire('d', now=1062.))
+
+    def test_double_release(self):
+        self.acquire('a')
+        self.acquire('b')
+        self.leases.release('123', 'a')
+        self.leases.release('123', 'a')
+        self.assertTrue(self.acquire('c'))
+        self.assertFalse(self.acquire('d'))
+
+
+class TestConcurrentLimiterPlugin(unittest.TestCase):
+    def setUp(self):
+        self.leases = mock.Mock(spec=LocalLeases)
+        self.leases.acquire.return_value = True
+        self.criteria = mock.Mock(return_value='123')
+        self.cl = ConcurrentLimiterPlugin(2, self.leases, self.criteria, ['exclude'], 60, 3)
+        self.cb = mock.Mock(name='callback')
+        self.req = mock.Mock(name='request')
+
+    def call(self):
+        return self.cl(self.cb, self.req)
+
+    def test_from_settings(self):
+        cl = ConcurrentLimiterPlugin.from_settings(Conf({
+            'backend': u'local',
+            'max': 4,
+        }), self.criteria)
+        self.assertTrue(isinstance(cl._leases, LocalLeases))
+        self.assertEqual(cl._max, 4)
+
+    def test_from_settings_redis(self):
+        with mock.patch('napixd.plugins.ratelimit.connection_factory'):
+            cl = ConcurrentLimiterPlugin.from_settings(Conf({}), self.criteria)
+        self.assertTrue(isinstance(cl._leases, RedisLeases))
+
+    def test_exclude(self):
+        self.criteria.return_value = 'exclude'
+        self.assertEqual(self.call(), self.cb.return_value)
+        self.assertEqual(self.leases.acquire.call_count, 0)
+
+    def test_allowed(self):
+        self.assertEqual(self.call(), self.cb.return_value)
+        token = self.leases.acquire.call_args[0][1]
+        self.leases.acquire.assert_called_once_with('123', token, 2, 60)
+        self.leases.release.assert_called_once_with('123', token)
+
+    def test_release_on_error(self):
+        self.cb.side_effect = ValueError()
+        self.assertRaises(ValueError, self.call)
+        self.assertEqual(self.leases.release.call_count, 1)
+
+    def test_rejected(self):
+        self.leases.acquire.return_value = False
+        registry = Registry()
+        with mock.patch('napixd.utils.metrics.registry', registry):
+            try:
+                self.call()
+            except HTTPError as e:
+                self.assertEqual(e.status, 429)
+                self.assertEqual(e.headers['Retry-After'], '3')
+            else:
+                self.fail('HTTPError not raised')
+
+        self.assertEqual(self.cb.call_count, 0)
+        self.assertEqual(self.leases.release.call_count, 0)
+        self.assertEqual(registry.counter('napixd_ratelimit_rejected_total',
+                                          limiter='concurrent').value, 1)
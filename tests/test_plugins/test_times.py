@@ -4,9 +4,12 @@
 import unittest
 import mock
 
+from napixd.http.request import Request
+from napixd.http.response import HTTPResponse
 from napixd.plugins.times import (
     WaitPlugin,
     TimePlugin,
+    LockTimePlugin,
 )
 
 
@@ -43,3 +46,24 @@ class TestWaitPlugin(unittest.TestCase):
 
         time.sleep.assert_called_once_with(1)
         self.assertEqual(r, self.cb.return_value)
+
+
+class TestLockTimePlugin(unittest.TestCase):
+    def setUp(self):
+        self.plugin = LockTimePlugin()
+        self.cb = mock.Mock(return_value={'a': 1})
+        self.request = mock.Mock(spec=Request, environ={})
+
+    def test_no_lock(self):
+        self.assertEqual(self.plugin(self.cb, self.request), {'a': 1})
+
+    def test_lock(self):
+        self.request.environ.update({
+            'napixd.lock.wait': .5,
+            'napixd.lock.hold': 1.5,
+        })
+        resp = self.plugin(self.cb, self.request)
+        self.assertTrue(isinstance(resp, HTTPResponse))
+        self.assertEqual(resp.headers['x-lock-wait-time'], '0.5')
+        self.assertEqual(resp.headers['x-lock-hold-time'], '1.5')
+        self.assertEqual(resp.body, {'a': 1})
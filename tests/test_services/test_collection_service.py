@@ -6,6 +6,7 @@ from __future__ import absolute_import
 import mock
 import unittest
 
+from napixd.conf import Conf
 from napixd.managers import Manager
 from napixd.services.served import ServedManager, ServedAction
 from napixd.services.urls import URL
@@ -64,6 +65,12 @@ class TestFirstCollectionService(unittest.TestCase):
         self.assertEqual(self.fcs.as_help(self.request),
                          self.served_manager.meta_data)
 
+    def test_metrics_labels(self):
+        self.assertEqual(self.fcs.metrics_labels, {
+            'service': u'parent',
+            'collection': u'/parent',
+        })
+
     def test_as_resource_fields(self):
         self.assertEqual(self.fcs.as_resource_fields(self.request),
                          self.served_manager.resource_fields)
@@ -150,7 +157,7 @@ class TestCollectionService(unittest.TestCase):
             get_managed_classes=mock.Mock(return_value=[]),
         )
         self.extractor = mock.Mock()
-        self.conf = mock.Mock()
+        self.conf = Conf({})
         self.served_manager = mock.Mock(
             spec=ServedManager,
             name='served_manager',
@@ -184,6 +191,55 @@ class TestCollectionService(unittest.TestCase):
         pmgr.get_resource.assert_called_once_with()
         pmgr.validate_id.assert_called_once_with('abc')
 
+    def test_get_manager_memo(self):
+        context = mock.Mock(spec=CollectionContext, resolved={})
+        pmgr = self.ps.get_manager.return_value
+        pmgr.get_resource.return_value = pr = ResourceWrapper(pmgr, 'abc')
+
+        self.cs.get_manager(['abc'], context)
+        self.cs.get_manager(['abc'], context)
+
+        self.ps.get_manager.assert_called_once_with([], context)
+        pmgr.get_resource.assert_called_once_with()
+        self.assertEqual(self.served_manager.instantiate.call_args_list, [
+            mock.call(pr, context),
+            mock.call(pr, context),
+        ])
+        self.assertEqual(context.resolved, {(self.ps, ('abc', )): pr})
+
+    def test_get_manager_memo_by_request(self):
+        pmgr = self.ps.get_manager.return_value
+        pmgr.get_resource.return_value = ResourceWrapper(pmgr, 'abc')
+
+        self.cs.get_manager(['abc'], mock.Mock(spec=CollectionContext, resolved={}))
+        self.cs.get_manager(['abc'], mock.Mock(spec=CollectionContext, resolved={}))
+
+        self.assertEqual(pmgr.get_resource.call_count, 2)
+
+    def test_get_manager_parents_cache(self):
+        self.served_manager.configuration = Conf({'parent_cache_ttl': 10})
+        cs = self.cs
+        pmgr = self.ps.get_manager.return_value
+        pmgr.get_resource.return_value = pr = ResourceWrapper(pmgr, 'abc', {'a': 1})
+
+        self.assertEqual(cs.get_parent(['abc'], mock.Mock(spec=CollectionContext, resolved={})), pr)
+        cached = cs.get_parent(['abc'], mock.Mock(spec=CollectionContext, resolved={}))
+
+        pmgr.get_resource.assert_called_once_with()
+        self.assertEqual(self.ps.get_manager.call_count, 2)
+        pmgr.set_resource.assert_called_once_with('abc', {'a': 1})
+        self.assertEqual(cached, pmgr.set_resource.return_value)
+
+    def test_no_parents_cache(self):
+        self.assertTrue(self.cs.parents_cache is None)
+
+    def test_metrics_labels(self):
+        cs = CollectionService(self.ps, self.served_manager, URL(['parent', None, 'child']))
+        self.assertEqual(cs.metrics_labels, {
+            'service': u'parent',
+            'collection': u'/parent/?/child',
+        })
+
 
 class TestActionService(unittest.TestCase):
     def setUp(self):
@@ -198,12 +254,17 @@ class TestActionService(unittest.TestCase):
         self.collection_service = mock.Mock(
             spec=CollectionService,
             resource_url=URL(['parent', None]),
+            metrics_labels={'service': u'parent', 'collection': u'/parent'},
+            collection=mock.Mock(),
         )
 
     @property
     def acs(self):
         return ActionService(self.collection_service, self.served_action)
 
+    def test_collection(self):
+        self.assertEqual(self.acs.collection, self.collection_service.collection)
+
     def test_setup_bottle(self):
         server = mock.Mock(spec=Server)
         acs = self.acs
@@ -222,6 +283,10 @@ class TestActionService(unittest.TestCase):
         self.assertEqual(self.acs.get_manager(['id'], self.request),
                          self.collection_service.get_manager.return_value)
 
+    def test_metrics_labels(self):
+        self.assertEqual(self.acs.metrics_labels,
+                         self.collection_service.metrics_labels)
+
 
 class TestServerCollectionService(unittest.TestCase):
     def setUp(self):
@@ -234,6 +299,7 @@ class TestServerCollectionService(unittest.TestCase):
         self.served_manager = mock.Mock(
             spec=ServedManager,
             name='served_manager',
+            configuration=Conf({}),
             manager_class=mock.Mock(),
             lock=None,
             get_all_actions=mock.Mock(return_value=[]),
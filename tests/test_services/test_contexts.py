@@ -30,7 +30,7 @@ class TestNapixdContext(unittest.TestCase):
 class TestCollectionContext(unittest.TestCase):
     def setUp(self):
         self.cs = mock.Mock(spec=CollectionService)
-        self.context = mock.Mock()
+        self.context = mock.Mock(spec=NapixdContext)
         self.cc = CollectionContext(self.cs, self.context)
 
     def test_get_resource(self):
@@ -46,6 +46,38 @@ class TestCollectionContext(unittest.TestCase):
         Target_cs.assert_called_once_with(['abc', 'def'])
         Target_s.assert_called_once_with('abc')
 
+    def test_get_resource_fetched(self):
+        self.context.fetched = {}
+        with mock.patch('napixd.services.contexts.FetchResource') as FR:
+            r1 = self.cc.get_resource('/abc/123')
+            r2 = self.cc.get_resource('/abc/123')
+
+        self.assertEqual(FR.call_count, 1)
+        self.assertTrue(r1 is r2)
+        self.assertEqual(self.context.fetched, {'/abc/123': FR.return_value.handle.return_value})
+
+    def test_get_resource_bad_url(self):
+        self.assertRaises(ValueError, self.cc.get_resource, 'abc/123')
+        self.assertRaises(ValueError, self.cc.get_resource, '/abc/')
+
+    def test_get_resources(self):
+        self.context.fetched = {'/abc/1': mock.sentinel.cached}
+        Target_cs = self.context.get_service.return_value.get_collection_service
+        Target_cs.side_effect = lambda managers: managers
+
+        def handle(context, paths):
+            return mock.Mock(**{
+                'handle.return_value': ['/'.join(context.service + p) for p in paths],
+            })
+
+        with mock.patch('napixd.services.contexts.FetchResources', side_effect=handle) as FRs:
+            resources = self.cc.get_resources([
+                '/abc/2', '/abc/1', '/abc/3/def/4', '/abc/2', '/abc/5/def/6'])
+
+        self.assertEqual(resources, [
+            'abc/2', mock.sentinel.cached, 'abc/def/3/4', 'abc/2', 'abc/def/5/6'])
+        self.assertEqual(FRs.call_count, 2)
+
 
 class TestResourceContext(unittest.TestCase):
     def setUp(self):
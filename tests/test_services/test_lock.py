@@ -2,13 +2,24 @@
 # -*- coding: utf-8 -*-
 
 import mock
+import time
 import unittest
+import threading
 
 from napixd.conf import Conf
-from napixd.utils.lock import Lock
+from napixd.utils.lock import (
+    Lock,
+    ReadWriteLock,
+    LocalLock,
+    LocalReadWriteLock,
+    Timeout,
+)
 from napixd.services.lock import (
     LockFactory,
     ConnectionFactory,
+    ServiceLock,
+    StripedServiceLock,
+    StripesLock,
 )
 
 
@@ -18,9 +29,15 @@ class TestLockFactory(unittest.TestCase):
             spec=ConnectionFactory,
         )
         self.lock_class = mock.Mock(spec=Lock)
+        self.rw_lock_class = mock.Mock(spec=ReadWriteLock)
+        self.local_lock_class = mock.Mock(spec=LocalLock)
+        self.local_rw_lock_class = mock.Mock(spec=LocalReadWriteLock)
 
     def lf(self):
-        return LockFactory(self.cf, lock_class=self.lock_class)
+        return LockFactory(self.cf, lock_class=self.lock_class,
+                           rw_lock_class=self.rw_lock_class,
+                           local_lock_class=self.local_lock_class,
+                           local_rw_lock_class=self.local_rw_lock_class)
 
     def test_lock_factory(self):
         conf = Conf({
@@ -35,3 +52,170 @@ class TestLockFactory(unittest.TestCase):
     def test_expects_name(self):
         conf = Conf({})
         self.assertRaises(TypeError, self.lf(), conf)
+
+    def test_shared_reads(self):
+        lock = self.lf()(Conf({
+            'name': u'the-lock',
+            'shared_reads': True,
+        }))
+        self.assertTrue(isinstance(lock, ServiceLock))
+        self.assertEqual(lock.lock, self.rw_lock_class.return_value)
+        self.rw_lock_class.assert_called_once_with(
+            'the-lock', self.cf.return_value)
+
+    def test_stripes(self):
+        lock = self.lf()(Conf({
+            'name': u'the-lock',
+            'stripes': 3,
+        }))
+        self.assertTrue(isinstance(lock, StripedServiceLock))
+        self.assertEqual(self.lock_class.call_args_list, [
+            mock.call(u'the-lock:0', self.cf.return_value),
+            mock.call(u'the-lock:1', self.cf.return_value),
+            mock.call(u'the-lock:2', self.cf.return_value),
+        ])
+
+    def test_local(self):
+        lock = self.lf()(Conf({
+            'name': u'the-lock',
+            'backend': u'local',
+        }))
+        self.assertEqual(lock, self.local_lock_class.return_value)
+        self.local_lock_class.assert_called_once_with(u'the-lock')
+        self.assertEqual(self.cf.call_count, 0)
+
+    def test_local_shared_reads(self):
+        lock = self.lf()(Conf({
+            'name': u'the-lock',
+            'backend': u'local',
+            'shared_reads': True,
+            'stripes': 2,
+        }))
+        self.assertTrue(isinstance(lock, StripedServiceLock))
+        self.assertEqual(self.local_rw_lock_class.call_args_list, [
+            mock.call(u'the-lock:0'),
+            mock.call(u'the-lock:1'),
+        ])
+
+    def test_bad_backend(self):
+        self.assertRaises(ValueError, self.lf(), Conf({
+            'name': u'the-lock',
+            'backend': u'memcache',
+        }))
+
+    def test_bad_stripes(self):
+        self.assertRaises(ValueError, self.lf(), Conf({
+            'name': u'the-lock',
+            'stripes': 0,
+        }))
+
+
+class TestServiceLock(unittest.TestCase):
+    def test_lock(self):
+        lock = mock.Mock(spec=Lock)
+        sl = ServiceLock(lock)
+        self.assertEqual(sl.get('abc', True), lock)
+        self.assertEqual(sl.get(None, False), lock)
+
+    def test_rw_lock(self):
+        lock = mock.Mock(spec=ReadWriteLock, read=mock.Mock(), write=mock.Mock())
+        sl = ServiceLock(lock)
+        self.assertEqual(sl.get('abc', True), lock.write)
+        self.assertEqual(sl.get('abc', False), lock.read)
+
+
+class TestStripedServiceLock(unittest.TestCase):
+    def setUp(self):
+        self.stripes = [mock.Mock(spec=Lock, name='stripe{0}'.format(i))
+                        for i in range(4)]
+        self.sl = StripedServiceLock(self.stripes)
+
+    def test_stripe(self):
+        lock = self.sl.get(u'abc', True)
+        self.assertTrue(isinstance(lock, StripesLock))
+        self.assertEqual(len(lock.locks), 1)
+        self.assertTrue(lock.locks[0] in self.stripes)
+        self.assertEqual(self.sl.get('abc', False).indexes, lock.indexes)
+
+    def test_spread(self):
+        used = set(self.sl.get(str(i), True).indexes[0] for i in range(100))
+        self.assertEqual(len(used), 4)
+
+    def test_collection(self):
+        lock = self.sl.get(None, True)
+        self.assertEqual(lock.locks, self.stripes)
+        with lock:
+            for stripe in self.stripes:
+                stripe.acquire.assert_called_once_with(True, 5)
+        for stripe in self.stripes:
+            stripe.release.assert_called_once_with()
+
+
+class TestStripesOrder(unittest.TestCase):
+    def setUp(self):
+        self.stripes = [LocalLock('stripe-test:{0}'.format(i)) for i in range(2)]
+        self.sl = StripedServiceLock(self.stripes)
+        self.keys = {}
+        for i in range(20):
+            self.keys.setdefault(self.sl.get(str(i), True).indexes[0], str(i))
+
+    def tearDown(self):
+        for stripe in self.stripes:
+            stripe._clean()
+
+    def run_holding(self, index, fn):
+        """
+        Runs *fn* in an other thread holding the stripe *index*.
+        """
+        holding = threading.Event()
+        done = threading.Event()
+
+        def other():
+            with self.sl.get(self.keys[index], True):
+                holding.set()
+                done.wait(1)
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        holding.wait(1)
+        try:
+            return fn()
+        finally:
+            done.set()
+            thread.join()
+
+    def test_nested_same(self):
+        with self.sl.get(self.keys[0], True):
+            with self.sl.get(self.keys[0], True):
+                pass
+            self.assertTrue(self.stripes[0])
+        self.assertFalse(self.stripes[0])
+
+    def test_nested_collection(self):
+        with self.sl.get(self.keys[1], True):
+            with self.sl.get(None, True):
+                self.assertTrue(self.stripes[0])
+            self.assertFalse(self.stripes[0])
+            self.assertTrue(self.stripes[1])
+
+    def test_out_of_order(self):
+        # The thread holding the stripe 1 and needing the stripe 0 fails
+        # immediately instead of waiting for the holder of the stripe 0,
+        # that may wait for the stripe 1.
+        def nested():
+            with self.sl.get(self.keys[1], True):
+                start = time.time()
+                self.assertRaises(Timeout, self.sl.get(self.keys[0], True).acquire)
+                return time.time() - start
+
+        self.assertTrue(self.run_holding(0, nested) < .5)
+        self.assertFalse(self.stripes[1])
+
+    def test_in_order(self):
+        # The thread holding the stripe 0 waits for the stripe 1
+        def nested():
+            with self.sl.get(self.keys[0], True):
+                self.assertRaises(Timeout, self.sl.get(self.keys[1], True).acquire,
+                                  timeout=.1)
+
+        self.run_holding(1, nested)
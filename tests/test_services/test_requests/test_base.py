@@ -7,9 +7,11 @@ import mock
 from napixd.utils.lock import Lock
 
 from napixd.services.collection import CollectionService
+from napixd.services.lock import ServiceLock
 from napixd.services.contexts import CollectionContext
 
 from napixd.services.requests.base import ServiceRequest
+from napixd.services.transaction import Transaction
 
 
 class MyServiceRequest(ServiceRequest):
@@ -30,6 +32,7 @@ class TestServiceRequest(unittest.TestCase):
         self.cs = mock.Mock(
             spec=CollectionService,
             lock=self.lock,
+            collection=mock.Mock(saves_collection=False),
         )
         self.context = mock.Mock(
             spec=CollectionContext,
@@ -46,3 +49,53 @@ class TestServiceRequest(unittest.TestCase):
 
         self.lock.acquire.assert_called_once_with()
         self.lock.release.assert_called_once_with()
+
+    def test_handle_held_lock(self):
+        # A Lock evaluates to False when it is not held
+        self.lock.__nonzero__ = mock.Mock(return_value=False)
+        self.sr().handle()
+        self.lock.acquire.assert_called_once_with()
+
+    def test_get_lock_service_lock(self):
+        self.cs.lock = service_lock = mock.Mock(spec=ServiceLock)
+        sr = MyServiceRequest(self.context, ['abc', 'def'])
+        self.assertEqual(sr.get_lock(), service_lock.get.return_value)
+        service_lock.get.assert_called_once_with('abc', False)
+
+    def test_get_lock_service_lock_write(self):
+        self.cs.lock = service_lock = mock.Mock(spec=ServiceLock)
+        self.context.method = 'PUT'
+        self.sr().get_lock()
+        service_lock.get.assert_called_once_with(None, True)
+
+    def test_get_lock_service_lock_write_resource(self):
+        self.cs.lock = service_lock = mock.Mock(spec=ServiceLock)
+        self.context.method = 'PUT'
+        MyServiceRequest(self.context, ['abc']).get_lock()
+        service_lock.get.assert_called_once_with('abc', True)
+
+    def test_get_lock_service_lock_saves_collection(self):
+        self.cs.lock = service_lock = mock.Mock(spec=ServiceLock)
+        self.cs.collection.saves_collection = True
+        self.context.method = 'PUT'
+        MyServiceRequest(self.context, ['abc']).get_lock()
+        service_lock.get.assert_called_once_with(None, True)
+
+    def test_get_lock_service_lock_saves_collection_read(self):
+        self.cs.lock = service_lock = mock.Mock(spec=ServiceLock)
+        self.cs.collection.saves_collection = True
+        MyServiceRequest(self.context, ['abc']).get_lock()
+        service_lock.get.assert_called_once_with('abc', False)
+
+    def test_handle_transaction(self):
+        sr = self.sr()
+        sr.handle()
+        self.assertTrue(isinstance(self.context.transaction, Transaction))
+
+    def test_handle_transaction_commit(self):
+        sr = self.sr()
+        save = mock.Mock()
+        sr.call = lambda: self.context.transaction.defer('key', save)
+        sr.handle()
+        save.assert_called_once_with()
+        self.lock.release.assert_called_once_with()
@@ -31,7 +31,8 @@ class TestServiceCollectionRequest(unittest.TestCase):
             spec=CollectionService,
             lock=None,
             collection=manager,
-            resource_url=url
+            resource_url=url,
+            metrics_labels={'service': u'abc', 'collection': u'/abc'}
         )
         self.context = mock.Mock(
             spec=CollectionContext,
@@ -4,9 +4,10 @@
 import unittest
 import mock
 
-from napixd.exceptions import ValidationError, NotFound
+from napixd.exceptions import ValidationError, NotFound, InternalRequestFailed
 from napixd.http.response import HTTPError, HTTP405
 from napixd.utils.lock import Lock
+from napixd.utils.metrics import Registry
 from napixd.managers.managed_classes import ManagedClass
 
 from napixd.services.urls import URL
@@ -21,6 +22,7 @@ from napixd.services.requests import (
 )
 from napixd.services.requests.resource import (
     HTTPServiceManagedClassesRequest,
+    FetchResources,
 )
 
 
@@ -57,7 +59,8 @@ class TestServiceResourceRequest(unittest.TestCase):
             spec=CollectionService,
             lock=None,
             collection=manager,
-            resource_url=url)
+            resource_url=url,
+            metrics_labels={'service': u'abc', 'collection': u'/abc'})
         self.context = mock.Mock(
             spec=CollectionContext,
             service=self.cs,
@@ -75,6 +78,22 @@ class TestServiceResourceRequest(unittest.TestCase):
         self.context.get_manager_instance.assert_called_once_with([])
         self.assertEqual(r, {'mpm': 'prefork', '_s': True})
 
+    def test_handle_metrics_labels(self):
+        self.context.request = request = mock.Mock(environ={})
+        self.srr().handle()
+        self.assertEqual(request.environ['napixd.metrics.labels'],
+                         {'service': u'abc', 'collection': u'/abc'})
+
+    def test_handle_in_flight(self):
+        registry = Registry()
+        in_flight = registry.gauge('napixd_requests_in_flight', service=u'abc', collection=u'/abc')
+        self.served_manager_instance.get_resource.side_effect = lambda: (
+            self.assertEqual(in_flight.value, 1) or self.rw)
+
+        with mock.patch('napixd.utils.metrics.registry', registry):
+            self.srr().handle()
+        self.assertEqual(in_flight.value, 0)
+
     def test_handle_get_404(self):
         self.served_manager_instance.get_resource.side_effect = NotFound()
         try:
@@ -177,7 +196,8 @@ class TestServiceActionRequest(unittest.TestCase):
             spec=ActionService,
             collection=manager,
             lock=mock.Mock(spec=Lock),
-            resource_url=url
+            resource_url=url,
+            metrics_labels={'service': u'abc', 'collection': u'/abc'}
         )
         self.action = self.manager.do_the_stuff
         self.validate = self.action.resource_fields.validate
@@ -201,6 +221,41 @@ class TestServiceActionRequest(unittest.TestCase):
         self.assertEqual(r, self.action.return_value)
 
 
+class TestFetchResources(unittest.TestCase):
+    def setUp(self):
+        self.lock = mock.Mock(spec=Lock)
+        self.cs = mock.Mock(spec=CollectionService, lock=self.lock)
+        self.context = mock.Mock(spec=CollectionContext, service=self.cs)
+
+        def get_manager_instance(path):
+            smi = mock.Mock(spec=ServedManagerInstance)
+            smi.validate_id.side_effect = validate_id
+            smi.get_resource.side_effect = lambda: ResourceWrapper(
+                smi, smi.validate_id.call_args[0][0], {'parent': path})
+            return smi
+        self.context.get_manager_instance.side_effect = get_manager_instance
+
+    def fr(self, paths):
+        return FetchResources(self.context, paths)
+
+    def test_handle(self):
+        resources = self.fr([['a', '1'], ['a', '2'], ['b', '3']]).handle()
+        self.assertEqual([(r.id, r.resource) for r in resources], [
+            ('1', {'parent': ['a']}),
+            ('2', {'parent': ['a']}),
+            ('3', {'parent': ['b']}),
+        ])
+        self.assertEqual(self.context.get_manager_instance.call_args_list, [
+            mock.call(['a']),
+            mock.call(['b']),
+        ])
+        self.lock.acquire.assert_called_once_with()
+        self.lock.release.assert_called_once_with()
+
+    def test_handle_not_found(self):
+        self.assertRaises(InternalRequestFailed, self.fr([['1'], ['b']]).handle)
+
+
 class TestServiceManagedClassesRequest(unittest.TestCase):
     def setUp(self):
         mc = mock.Mock(spec=ManagedClass)
@@ -212,7 +267,8 @@ class TestServiceManagedClassesRequest(unittest.TestCase):
             spec=CollectionService,
             lock=None,
             collection=manager,
-            resource_url=url)
+            resource_url=url,
+            metrics_labels={'service': u'abc', 'collection': u'/abc'})
         self.context = mock.Mock(
             spec=CollectionContext,
             method='GET',
@@ -152,3 +152,11 @@ class TestServedManagerInstance(unittest.TestCase):
         r = self.smi.get_resource()
         self.assertEqual(r, self.context.make_resource.return_value)
         self.instance.get_resource.assert_called_once_with('abc')
+
+    def test_set_resource(self):
+        r = self.smi.set_resource('abc', {'a': 1})
+        self.assertEqual(r, self.context.make_resource.return_value)
+        self.context.make_resource.assert_called_once_with({'a': 1})
+        self.assertEqual(self.context.id, 'abc')
+        self.assertEqual(self.context.resource, r)
+        self.assertEqual(self.instance.get_resource.call_count, 0)
@@ -16,6 +16,7 @@ from napixd.services.collection import (
     FirstCollectionService,
     CollectionService,
 )
+from napixd.services.lock import StripedServiceLock
 from napixd.services.served import (
     FirstServedManager,
     ServedManager,
@@ -128,6 +129,36 @@ class TestService(unittest.TestCase):
             ServedManager(mgr, mock.ANY, ('parent', 'child'), mock.ANY, lock),
             URL(['parent', None, 'child']))
 
+    def test_CS_striped_lock_saves_collection(self):
+        self.conf = Conf({
+            'Lock': {
+                'name': 'the-lock',
+            }
+        })
+        self.FCS.return_value.collection = mock.Mock(
+            saves_collection=True, __name__='DictLike')
+        with mock.patch('napixd.services.lock_factory') as LF:
+            LF.return_value = StripedServiceLock([])
+            with mock.patch('napixd.services.logger') as logger:
+                service = self.get_service()
+
+        self.assertTrue(isinstance(service.lock, StripedServiceLock))
+        logger.warning.assert_called_once_with(mock.ANY, 'DictLike')
+
+    def test_CS_striped_lock(self):
+        self.conf = Conf({
+            'Lock': {
+                'name': 'the-lock',
+            }
+        })
+        self.FCS.return_value.collection = mock.Mock(saves_collection=False)
+        with mock.patch('napixd.services.lock_factory') as LF:
+            LF.return_value = StripedServiceLock([])
+            with mock.patch('napixd.services.logger') as logger:
+                self.get_service()
+
+        self.assertFalse(logger.warning.called)
+
     def test_CS_bad_lock(self):
         self.conf = Conf({
             'Lock': {
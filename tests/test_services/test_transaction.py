@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import unittest
+import mock
+
+from napixd.services.transaction import Transaction
+
+
+class TestTransaction(unittest.TestCase):
+    def setUp(self):
+        self.transaction = Transaction()
+        self.undo = mock.Mock()
+        self.save = mock.Mock()
+
+    def test_commit(self):
+        with self.transaction as t:
+            t.register(self.undo)
+            t.defer('key', self.save)
+        self.save.assert_called_once_with()
+        self.assertEqual(self.undo.call_count, 0)
+
+    def test_defer_once(self):
+        with self.transaction as t:
+            t.defer('key', self.save)
+            t.defer('key', self.save)
+            t.defer('other', self.save)
+        self.assertEqual(self.save.call_count, 2)
+
+    def test_rollback(self):
+        try:
+            with self.transaction as t:
+                t.register(self.undo)
+                t.defer('key', self.save)
+                raise ValueError()
+        except ValueError:
+            pass
+        self.undo.assert_called_once_with()
+        self.assertEqual(self.save.call_count, 0)
+
+    def test_commit_error(self):
+        self.save.side_effect = IOError()
+        try:
+            with self.transaction as t:
+                t.register(self.undo)
+                t.defer('key', self.save)
+        except IOError:
+            pass
+        else:
+            self.fail('IOError not raised')
+        self.undo.assert_called_once_with()
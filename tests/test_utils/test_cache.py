@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import sys
+import time
+import threading
+import unittest
+import mock
+
+from napixd.http.response import HTTPError
+from napixd.utils.cache import LoadCache, LRUCache, SingleFlight, _Flight
+from napixd.utils.metrics import Registry
+
+
+class TestLoadCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LoadCache(ttl=10)
+        self.load = mock.Mock()
+
+    def get(self, version=None, now=1000):
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = now
+            return self.cache.get('key', self.load, version)
+
+    def test_get(self):
+        self.assertEqual(self.get(), self.load.return_value)
+        self.load.assert_called_once_with()
+
+    def test_get_cached(self):
+        self.get()
+        self.assertEqual(self.get(now=1005), self.load.return_value)
+        self.assertEqual(self.load.call_count, 1)
+
+    def test_get_expired(self):
+        self.get()
+        self.get(now=1011)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_get_version(self):
+        self.get(version=1)
+        self.get(version=1)
+        self.get(version=2)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_no_ttl(self):
+        self.cache = LoadCache()
+        self.get()
+        self.get(now=10 ** 9)
+        self.assertEqual(self.load.call_count, 1)
+
+    def test_load_error(self):
+        self.load.side_effect = ValueError()
+        self.assertRaises(ValueError, self.get)
+        self.assertFalse('key' in self.cache)
+
+    def test_load_error_retried(self):
+        self.load.side_effect = [ValueError(), 'value']
+        self.assertRaises(ValueError, self.get)
+        self.assertEqual(len(self.cache._flights), 0)
+        self.assertEqual(self.get(), 'value')
+
+    def test_concurrent_error(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        errors = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            raise ValueError('load failed')
+
+        def run():
+            try:
+                self.cache.get('key', slow)
+            except ValueError as error:
+                errors.append(error)
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=run) for i in range(2)]
+        for follower in followers:
+            follower.start()
+        time.sleep(.05)
+        release.set()
+        leader.join()
+        for follower in followers:
+            follower.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(len(self.cache._flights), 0)
+
+    def test_set(self):
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = 1000
+            self.cache.set('key', 'value', 1)
+        self.assertEqual(self.get(version=1), 'value')
+        self.assertEqual(self.load.call_count, 0)
+
+    def test_invalidate(self):
+        self.get()
+        self.cache.invalidate('key')
+        self.get()
+        self.assertEqual(self.load.call_count, 2)
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(size=2, stale=5)
+        self.load = mock.Mock()
+
+    def get(self, key='key', ttl=10, now=1000):
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = now
+            return self.cache.get(key, self.load, ttl)
+
+    def test_get(self):
+        self.assertEqual(self.get(), self.load.return_value)
+        self.assertEqual(self.get(now=1009), self.load.return_value)
+        self.assertEqual(self.load.call_count, 1)
+
+    def test_get_expired(self):
+        self.get()
+        self.get(now=1016)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_get_ttl_function(self):
+        ttl = mock.Mock(return_value=1)
+        self.get(ttl=ttl)
+        ttl.assert_called_once_with(self.load.return_value)
+        self.get(ttl=ttl, now=1007)
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_no_ttl(self):
+        self.get(ttl=None)
+        self.get(ttl=None, now=10 ** 9)
+        self.assertEqual(self.load.call_count, 1)
+
+    def test_zero_ttl(self):
+        self.get(ttl=0)
+        self.assertFalse('key' in self.cache)
+
+    def test_load_error(self):
+        self.load.side_effect = ValueError()
+        self.assertRaises(ValueError, self.get)
+        self.assertFalse('key' in self.cache)
+
+    def test_evict_least_recently_used(self):
+        self.get('a')
+        self.get('b')
+        self.get('a')
+        self.get('c')
+        self.assertTrue('a' in self.cache)
+        self.assertFalse('b' in self.cache)
+        self.assertTrue('c' in self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_stale(self):
+        self.load.return_value = 'old'
+        self.get()
+        self.load.return_value = 'new'
+        with mock.patch('threading.Thread') as Thread:
+            self.assertEqual(self.get(now=1012), 'old')
+        Thread.assert_called_once_with(target=self.cache._reload, args=('key', self.load, 10))
+        Thread.return_value.start.assert_called_once_with()
+
+        self.cache._reload('key', self.load, 10)
+        self.assertEqual(self.get(now=1013), 'new')
+
+    def test_stale_refreshing(self):
+        self.get()
+        with mock.patch('threading.Thread') as Thread:
+            self.get(now=1012)
+            self.get(now=1012)
+        self.assertEqual(Thread.call_count, 1)
+
+    def test_reload_error(self):
+        self.get()
+        self.load.side_effect = ValueError()
+        self.cache._reload('key', self.load, 10)
+        self.assertTrue('key' in self.cache)
+        self.assertFalse(self.cache._refreshing)
+
+    def test_invalidate(self):
+        self.get()
+        self.cache.invalidate('key')
+        self.get()
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_clear(self):
+        self.get('a')
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.get('b')
+        self.get('c')
+        self.assertEqual(len(self.cache), 2)
+
+    def test_metrics(self):
+        registry = Registry()
+        self.cache.name = 'auth'
+        with mock.patch('napixd.utils.metrics.registry', registry):
+            self.get()
+            self.get()
+        self.assertEqual(registry.counter('napixd_cache_requests_total',
+                                          cache='auth', result='miss').value, 1)
+        self.assertEqual(registry.counter('napixd_cache_requests_total',
+                                          cache='auth', result='hit').value, 1)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def running(self, result=None, error=None):
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = 1000
+            flight = self.flights._flights['key'] = _Flight()
+        flight.result = result
+        flight.error = error
+        flight.event.set()
+        return flight
+
+    def do(self, function):
+        with mock.patch('napixd.utils.cache.time') as time:
+            time.time.return_value = 1002
+            return self.flights.do('key', function)
+
+    def test_do(self):
+        self.assertEqual(self.flights.do('key', lambda: 1), (1, None))
+        self.assertEqual(len(self.flights), 0)
+
+    def test_do_error(self):
+        self.assertRaises(ValueError, self.flights.do, 'key', mock.Mock(side_effect=ValueError))
+        self.assertEqual(len(self.flights), 0)
+
+    def test_join(self):
+        self.running('result')
+        function = mock.Mock()
+        self.assertEqual(self.do(function), ('result', 2))
+        self.assertEqual(function.call_count, 0)
+
+    def test_join_error(self):
+        try:
+            raise ValueError()
+        except ValueError:
+            self.running(error=sys.exc_info())
+        self.assertRaises(ValueError, self.do, mock.Mock())
+
+    def test_join_http_error(self):
+        error = HTTPError(504, 'timeout', retry_after=1)
+        self.running(error=(HTTPError, error, None))
+        try:
+            self.do(mock.Mock())
+        except HTTPError as raised:
+            pass
+        self.assertFalse(raised is error)
+        self.assertEqual(raised.status, 504)
+        self.assertEqual(raised.body, 'timeout')
+        raised.headers['x-other'] = 'a'
+        self.assertEqual(dict(error.headers), {'retry-after': '1'})
+
+    def test_concurrent(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return 'result'
+
+        def run():
+            results.append(self.flights.do('key', slow)[0])
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=run)
+        follower.start()
+        time.sleep(.05)
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(results, ['result', 'result'])
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrent_error(self):
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def slow():
+            started.set()
+            release.wait()
+            raise HTTPError(500, 'Auth server did not respond')
+
+        def run():
+            try:
+                self.flights.do('key', slow)
+            except HTTPError as error:
+                error.headers['x-waiter'] = str(len(errors))
+                errors.append(error)
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=run) for i in range(2)]
+        for follower in followers:
+            follower.start()
+        time.sleep(.05)
+        release.set()
+        leader.join()
+        for follower in followers:
+            follower.join()
+
+        self.assertEqual(len(set(id(error) for error in errors)), 3)
+        self.assertEqual(sorted(error.headers['x-waiter'] for error in errors),
+                         ['0', '1', '2'])
+        self.assertTrue(all(error.status == 500 for error in errors))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import threading
+
+from napixd.utils.lock import LocalLock, LocalReadWriteLock, Timeout
+
+
+def run(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread
+
+
+class TestLocalLock(unittest.TestCase):
+    def setUp(self):
+        self.lock = LocalLock('local-l1')
+        self.lock._clean()
+
+    def test_acquire(self):
+        timeline = []
+        self.lock.acquire()
+
+        def other():
+            with LocalLock('local-l1'):
+                timeline.append(2)
+
+        thread = run(other)
+        time.sleep(.05)
+        timeline.append(1)
+        self.lock.release()
+        thread.join()
+
+        self.assertEqual(timeline, [1, 2])
+        self.assertFalse(self.lock)
+
+    def test_reentrant(self):
+        with self.lock:
+            with self.lock:
+                self.assertTrue(self.lock)
+            self.assertTrue(self.lock)
+        self.assertFalse(self.lock)
+
+    def test_same_name_not_reentrant(self):
+        with self.lock:
+            other = LocalLock('local-l1')
+            self.assertFalse(other.acquire(blocking=False))
+
+    def test_other_name(self):
+        with self.lock:
+            with LocalLock('local-l2') as other:
+                self.assertTrue(other)
+
+    def test_timeout(self):
+        self.lock.acquire()
+        errors = []
+
+        def other():
+            try:
+                LocalLock('local-l1').acquire(timeout=.05)
+            except Timeout as e:
+                errors.append(e)
+
+        run(other).join()
+        self.lock.release()
+        self.assertEqual(len(errors), 1)
+
+    def test_expire(self):
+        lock = LocalLock('local-l1', expire=.05)
+        lock.acquire()
+        acquired = []
+
+        def other():
+            acquired.append(bool(LocalLock('local-l1').acquire(timeout=1)))
+
+        run(other).join()
+        self.assertEqual(acquired, [True])
+        # The expired holder does not release the new holder
+        lock.release()
+        self.assertFalse(LocalLock('local-l1').acquire(blocking=False))
+
+    def test_release_not_owned(self):
+        self.assertRaises(RuntimeError, self.lock.release)
+
+
+class TestLocalReadWriteLock(unittest.TestCase):
+    def setUp(self):
+        self.rw = LocalReadWriteLock('local-rw')
+
+    def test_shared_reads(self):
+        readers = []
+
+        def other():
+            with LocalReadWriteLock('local-rw').read:
+                readers.append(True)
+
+        with self.rw.read:
+            run(other).join(1)
+        self.assertEqual(readers, [True])
+
+    def test_write_waits_readers(self):
+        timeline = []
+
+        def other():
+            with LocalReadWriteLock('local-rw').write:
+                timeline.append(2)
+
+        self.rw.read.acquire()
+        thread = run(other)
+        time.sleep(.05)
+        timeline.append(1)
+        self.rw.read.release()
+        thread.join()
+        self.assertEqual(timeline, [1, 2])
+
+    def test_read_waits_writer(self):
+        with self.rw.write:
+            other = LocalReadWriteLock('local-rw')
+            self.assertFalse(other.read.acquire(blocking=False))
+        self.assertTrue(other.read.acquire(blocking=False))
+        other.read.release()
+
+    def test_read_timeout(self):
+        errors = []
+
+        def other():
+            try:
+                LocalReadWriteLock('local-rw').read.acquire(timeout=.05)
+            except Timeout as e:
+                errors.append(e)
+
+        with self.rw.write:
+            run(other).join()
+        self.assertEqual(len(errors), 1)
+
+    def test_failed_writer_lets_readers(self):
+        self.rw.read.acquire()
+        writer = LocalReadWriteLock('local-rw')
+        self.assertFalse(writer.write.acquire(blocking=False))
+        other = LocalReadWriteLock('local-rw')
+        self.assertTrue(other.read.acquire(blocking=False))
+        other.read.release()
+        self.rw.read.release()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from napixd.utils.metrics import Registry, Histogram
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe(self):
+        h = Histogram(buckets=(1, .1, 10))
+        for value in (.05, .1, .5, 20):
+            h.observe(value)
+        self.assertEqual(list(h.samples()), [
+            ('_bucket', (('le', '0.1'), ), 2),
+            ('_bucket', (('le', '1.0'), ), 3),
+            ('_bucket', (('le', '10.0'), ), 3),
+            ('_bucket', (('le', '+Inf'), ), 4),
+            ('_sum', (), 20.65),
+            ('_count', (), 4),
+        ])
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_same_metric(self):
+        c = self.registry.counter('requests', service='a')
+        self.assertTrue(self.registry.counter('requests', service='a') is c)
+        self.assertFalse(self.registry.counter('requests', service='b') is c)
+
+    def test_other_kind(self):
+        self.registry.counter('requests')
+        self.assertRaises(TypeError, self.registry.gauge, 'requests')
+
+    def test_collect(self):
+        self.registry.counter('requests', service='a').inc(2)
+        self.registry.gauge('running').inc()
+        self.assertEqual(list(self.registry.collect()), [
+            ('requests', (('service', 'a'), ), 2),
+            ('running', (), 1),
+        ])
+
+    def test_render(self):
+        self.registry.counter('requests', 'The requests', service='a"b').inc()
+        self.registry.gauge('running').set(3)
+        self.assertEqual(self.registry.render(), '\n'.join([
+            '# HELP requests The requests',
+            '# TYPE requests counter',
+            'requests{service="a\\"b"} 1',
+            '# TYPE running gauge',
+            'running 3',
+            '',
+        ]))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import threading
+
+import mock
+
+from napixd.utils.lock import Lock, ReadWriteLock, Timeout
+
+from tests.utils.fake_redis import FakeRedis, lupa
+
+if lupa is None:
+    __test__ = False
+
+
+class TestLock(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeRedis()
+        self.lock = Lock('l1', self.conn)
+
+    def test_acquire_create(self):
+        self.lock.acquire()
+        self.assertTrue(self.lock)
+        self.assertEqual(self.conn.round_trips, 1)
+
+        self.lock.release()
+        self.assertFalse(self.lock)
+        self.assertEqual(self.conn.round_trips, 2)
+        self.assertEqual(self.conn.data['napixd:locks:queues:l1'], ['1'])
+        self.assertFalse('napixd:locks:control:l1' in self.conn.expires)
+
+    def test_acquire_existing(self):
+        with self.lock:
+            pass
+        self.conn.round_trips = 0
+
+        with self.lock:
+            self.assertTrue('napixd:locks:control:l1' in self.conn.expires)
+        self.assertEqual(self.conn.round_trips, 3)
+
+    def test_reentrant(self):
+        with self.lock:
+            with self.lock:
+                pass
+            self.assertTrue(self.lock)
+        self.assertEqual(self.conn.round_trips, 2)
+
+    def test_non_blocking(self):
+        self.lock.acquire()
+        other = Lock('l1', self.conn)
+        self.assertFalse(other.acquire(blocking=False))
+        self.lock.release()
+        self.assertTrue(other.acquire(blocking=False))
+        other.release()
+
+    def test_wait(self):
+        timeline = []
+        self.lock.acquire()
+
+        def other():
+            with Lock('l1', self.conn):
+                timeline.append(2)
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        time.sleep(.05)
+        timeline.append(1)
+        self.lock.release()
+        thread.join()
+        self.assertEqual(timeline, [1, 2])
+
+    def test_timeout(self):
+        self.lock.acquire()
+        self.assertRaises(Timeout, Lock('l1', self.conn).acquire, timeout=.1)
+
+    def test_expire(self):
+        dead = Lock('l1', self.conn, expire=.05)
+        dead.acquire()
+        time.sleep(.1)
+
+        self.assertTrue(self.lock.acquire(blocking=False))
+        # The release of the expired holder does not free the lock
+        dead.release()
+        self.assertFalse(Lock('l1', self.conn).acquire(blocking=False))
+        self.lock.release()
+
+    def test_late_release(self):
+        late = Lock('l1', self.conn, expire=.05)
+        late.acquire()
+        time.sleep(.1)
+        self.lock.acquire()
+        # The release of the expired holder neither persists the control key
+        # of the next holder nor grants the lock a second time
+        late._acquired_until = time.time() + 1
+        late.release()
+        self.assertTrue('napixd:locks:control:l1' in self.conn.expires)
+        self.assertFalse('napixd:locks:queues:l1' in self.conn.data)
+        self.lock.release()
+        self.assertEqual(self.conn.data['napixd:locks:queues:l1'], ['1'])
+
+    def test_deadline(self):
+        clock = [100]
+
+        def try_acquire(token):
+            # The command takes 3 seconds
+            clock[0] += 3
+            return True, False
+
+        self.lock._try_acquire = try_acquire
+        with mock.patch('time.time', side_effect=lambda: clock[0]):
+            self.lock.acquire()
+        self.assertEqual(self.lock._acquired_until, 160)
+        self.lock.release()
+
+
+class TestReadWriteLock(unittest.TestCase):
+    def setUp(self):
+        self.conn = FakeRedis()
+        self.rw = ReadWriteLock('rw1', self.conn)
+
+    def test_shared_reads(self):
+        other = ReadWriteLock('rw1', self.conn)
+        with self.rw.read:
+            self.assertTrue(other.read.acquire(blocking=False))
+            other.read.release()
+
+    def test_write_excludes_reads(self):
+        other = ReadWriteLock('rw1', self.conn)
+        with self.rw.write:
+            self.assertFalse(other.read.acquire(blocking=False))
+        self.assertTrue(other.read.acquire(blocking=False))
+        other.read.release()
+
+    def test_write_waits_readers(self):
+        timeline = []
+        self.rw.read.acquire()
+
+        def other():
+            with ReadWriteLock('rw1', self.conn).write:
+                timeline.append(2)
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        time.sleep(.05)
+        timeline.append(1)
+        self.rw.read.release()
+        thread.join()
+        self.assertEqual(timeline, [1, 2])
+
+    def test_expired_reader(self):
+        dead = ReadWriteLock('rw1', self.conn, expire=.05)
+        dead.read.acquire()
+        time.sleep(.1)
+
+        self.rw.read.acquire()
+        # The late release of the expired reader does not admit the writer
+        # while an other reader is active
+        dead.read.release()
+        writer = ReadWriteLock('rw1', self.conn)
+        self.assertFalse(writer.write.acquire(blocking=False))
+        self.rw.read.release()
+        self.assertTrue(writer.write.acquire(blocking=False))
+        writer.write.release()
+
+    def test_dead_reader(self):
+        dead = ReadWriteLock('rw1', self.conn, expire=.05)
+        dead.read.acquire()
+        time.sleep(.1)
+
+        writer = ReadWriteLock('rw1', self.conn)
+        self.assertTrue(writer.write.acquire(blocking=False))
+        writer.write.release()
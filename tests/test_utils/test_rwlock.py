@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import mock
+import unittest
+
+from napixd.utils.lock import (
+    Lock,
+    ReadWriteLock,
+    MultiLock,
+    Timeout,
+    InstrumentedLock,
+    ADD_READER_SCRIPT,
+    RELEASE_READER_SCRIPT,
+)
+from napixd.utils.metrics import Registry
+
+
+class TestReadWriteLock(unittest.TestCase):
+    def setUp(self):
+        self.conn = mock.Mock()
+        self.add_reader = mock.Mock()
+        self.release_reader = mock.Mock()
+        self.conn.register_script.side_effect = {
+            ADD_READER_SCRIPT: self.add_reader,
+            RELEASE_READER_SCRIPT: self.release_reader,
+        }.get
+        self.pipe = self.conn.pipeline.return_value
+        self.pipe.execute.return_value = [0, 0]
+        self.lock = mock.Mock(spec=Lock)
+        self.lock.acquire.return_value = True
+        self.lock_class = mock.Mock(return_value=self.lock)
+        self.rw = ReadWriteLock('l1', self.conn, lock_class=self.lock_class)
+
+    def test_init(self):
+        self.lock_class.assert_called_once_with('l1', self.conn, expire=60)
+
+    def test_read(self):
+        with mock.patch('time.time', return_value=1000):
+            with self.rw.read:
+                self.assertTrue(self.rw.read)
+                self.lock.acquire.assert_called_once_with(True, 5)
+                self.lock.release.assert_called_once_with()
+                self.add_reader.assert_called_once_with(
+                    keys=['napixd:locks:readers:l1'], args=[1060, mock.ANY, 60])
+
+        token = self.add_reader.call_args[1]['args'][1]
+        self.assertFalse(self.rw.read)
+        self.release_reader.assert_called_once_with(
+            keys=['napixd:locks:readers:l1', 'napixd:locks:drained:l1'],
+            args=[1000, token, 60])
+
+    def test_read_reentrant(self):
+        with self.rw.read:
+            with self.rw.read:
+                pass
+            self.assertEqual(self.release_reader.call_count, 0)
+        self.assertEqual(self.lock.acquire.call_count, 1)
+        self.assertEqual(self.release_reader.call_count, 1)
+
+    def test_write(self):
+        with self.rw.write:
+            self.assertTrue(self.rw.write)
+            self.assertEqual(self.lock.release.call_count, 0)
+        self.lock.release.assert_called_once_with()
+        self.assertFalse(self.rw.write)
+
+    def test_write_wait_readers(self):
+        self.pipe.execute.side_effect = [[0, 2], [1, 1], [0, 0]]
+        self.conn.brpop.return_value = ('napixd:locks:drained:l1', '1')
+        with self.rw.write:
+            pass
+        self.assertEqual(self.conn.brpop.call_count, 2)
+        self.conn.delete.assert_called_once_with('napixd:locks:drained:l1')
+
+    def test_write_timeout(self):
+        self.pipe.execute.return_value = [0, 1]
+        self.conn.brpop.return_value = None
+        self.lock.__nonzero__ = mock.Mock(return_value=True)
+        self.assertRaises(Timeout, self.rw.write.acquire)
+        self.lock.release.assert_called_once_with()
+        self.assertFalse(self.rw.write)
+
+    def test_write_non_blocking(self):
+        self.pipe.execute.return_value = [0, 1]
+        self.assertFalse(self.rw.write.acquire(blocking=False))
+        self.lock.release.assert_called_once_with()
+
+    def test_read_in_write(self):
+        with self.rw.write:
+            with self.rw.read:
+                pass
+        self.assertEqual(self.add_reader.call_count, 0)
+        self.assertEqual(self.release_reader.call_count, 0)
+
+    def test_no_upgrade(self):
+        with self.rw.read:
+            self.assertRaises(RuntimeError, self.rw.write.acquire)
+
+    def test_release_not_acquired(self):
+        self.assertRaises(RuntimeError, self.rw.read.release)
+        self.assertRaises(RuntimeError, self.rw.write.release)
+
+
+class TestMultiLock(unittest.TestCase):
+    def setUp(self):
+        self.calls = calls = []
+        self.locks = []
+        for i in range(3):
+            lock = mock.Mock(spec=Lock)
+            lock.acquire.side_effect = lambda b, t, i=i: calls.append(('acquire', i)) or True
+            lock.release.side_effect = lambda i=i: calls.append(('release', i))
+            self.locks.append(lock)
+        self.ml = MultiLock(self.locks)
+
+    def test_acquire_release(self):
+        with self.ml:
+            pass
+        self.assertEqual(self.calls, [
+            ('acquire', 0), ('acquire', 1), ('acquire', 2),
+            ('release', 2), ('release', 1), ('release', 0),
+        ])
+
+    def test_acquire_fail(self):
+        self.locks[2].acquire.side_effect = Timeout()
+        self.assertRaises(Timeout, self.ml.acquire)
+        self.assertEqual(self.calls, [
+            ('acquire', 0), ('acquire', 1),
+            ('release', 1), ('release', 0),
+        ])
+
+
+class TestInstrumentedLock(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.lock = mock.Mock(spec=Lock)
+        self.lock.name = 'l1'
+        self.il = InstrumentedLock(self.lock, self.registry)
+
+    def get(self, name):
+        return dict(((n, labels), value)
+                    for n, labels, value in self.registry.collect())[
+                        (name, (('lock', 'l1'), ))]
+
+    def test_acquire_release(self):
+        with self.il:
+            self.lock.acquire.assert_called_once_with()
+        self.lock.release.assert_called_once_with()
+        self.assertEqual(self.get('napixd_lock_wait_seconds_count'), 1)
+        self.assertEqual(self.get('napixd_lock_hold_seconds_count'), 1)
+        self.assertEqual(self.get('napixd_lock_waiting'), 0)
+        self.assertTrue(self.il.hold >= 0)
+
+    def test_timeout(self):
+        self.lock.acquire.side_effect = Timeout()
+        self.assertRaises(Timeout, self.il.acquire, timeout=1)
+        self.lock.acquire.assert_called_once_with(timeout=1)
+        self.assertEqual(self.get('napixd_lock_timeouts_total'), 1)
+        self.assertEqual(self.get('napixd_lock_waiting'), 0)
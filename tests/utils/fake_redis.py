@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+An in-memory implementation of the subset of :class:`redis.Redis` used by the
+locks and the rate limiters. The commands are counted in
+:attr:`FakeRedis.round_trips`.
+
+The Lua scripts are run by :mod:`lupa` when it is installed.
+"""
+
+import time
+import threading
+
+try:
+    import lupa
+except ImportError:
+    lupa = None
+
+
+class FakePipeline(object):
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, command):
+        def queue(*args, **kw):
+            self.commands.append((command, args, kw))
+            return self
+        return queue
+
+    def execute(self):
+        redis = self.redis
+        with redis.condition:
+            redis.round_trips += 1
+            results = [getattr(redis, '_' + command)(*args, **kw)
+                       for command, args, kw in self.commands]
+        self.commands = []
+        return results
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.condition = threading.Condition(threading.RLock())
+        self.data = {}
+        self.expires = {}
+        self.round_trips = 0
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        return FakeScript(self, script)
+
+    def __getattr__(self, command):
+        method = getattr(self, '_' + command)
+
+        def call(*args, **kw):
+            with self.condition:
+                self.round_trips += 1
+                return method(*args, **kw)
+        return call
+
+    def _expire_keys(self):
+        now = time.time()
+        for key, until in self.expires.items():
+            if until <= now:
+                self.data.pop(key, None)
+                del self.expires[key]
+
+    def _get_data(self, key):
+        self._expire_keys()
+        return self.data.get(key)
+
+    def _delete(self, key):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def _exists(self, key):
+        return self._get_data(key) is not None
+
+    def _get(self, key):
+        return self._get_data(key)
+
+    def _set(self, key, value, nx=False, px=None, ex=None):
+        if nx and self._get_data(key) is not None:
+            return None
+        self.data[key] = str(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            px = ex * 1000
+        if px is not None:
+            self.expires[key] = time.time() + px / 1000.
+        return True
+
+    def _incr(self, key, amount=1):
+        value = int(self._get_data(key) or 0) + amount
+        self.data[key] = str(value)
+        return value
+
+    def _decr(self, key, amount=1):
+        return self._incr(key, -amount)
+
+    def _expire(self, key, seconds):
+        if self._get_data(key) is None:
+            return False
+        self.expires[key] = time.time() + seconds
+        return True
+
+    def _pexpire(self, key, milliseconds):
+        return self._expire(key, milliseconds / 1000.)
+
+    def _persist(self, key):
+        return self.expires.pop(key, None) is not None
+
+    def _rpush(self, key, value):
+        values = self._get_data(key)
+        if values is None:
+            values = self.data[key] = []
+        values.append(str(value))
+        self.condition.notify_all()
+        return len(values)
+
+    def _rpop(self, key):
+        values = self._get_data(key)
+        if not values:
+            return None
+        value = values.pop()
+        if not values:
+            self._delete(key)
+        return value
+
+    def _brpop(self, key, timeout=0):
+        deadline = time.time() + timeout
+        while True:
+            value = self._rpop(key)
+            if value is not None:
+                return key, value
+            remaining = deadline - time.time()
+            if timeout and remaining <= 0:
+                return None
+            self.condition.wait(remaining if timeout else None)
+
+    def _getset(self, key, value):
+        old = self._get_data(key)
+        self._set(key, value)
+        return old
+
+    def _incrby(self, key, amount=1):
+        return self._incr(key, int(amount))
+
+    def _expireat(self, key, when):
+        if self._get_data(key) is None:
+            return False
+        self.expires[key] = float(when)
+        return True
+
+    def _pttl(self, key):
+        if self._get_data(key) is None:
+            return -2
+        if key not in self.expires:
+            return -1
+        return int((self.expires[key] - time.time()) * 1000)
+
+    # Sorted sets, stored as a dict of the members and their scores
+
+    def _zadd(self, key, score, member):
+        members = self._get_data(key)
+        if members is None:
+            members = self.data[key] = {}
+        added = str(member) not in members
+        members[str(member)] = float(score)
+        return int(added)
+
+    def _zrem(self, key, member):
+        members = self._get_data(key)
+        if not members or str(member) not in members:
+            return 0
+        del members[str(member)]
+        if not members:
+            self._delete(key)
+        return 1
+
+    def _zcard(self, key):
+        return len(self._get_data(key) or ())
+
+    def _zscore(self, key, member):
+        return (self._get_data(key) or {}).get(str(member))
+
+    def _zcount(self, key, low, high):
+        low, high = _score_range(low, high)
+        return sum(1 for score in (self._get_data(key) or {}).values()
+                   if low(score) and high(score))
+
+    def _zremrangebyscore(self, key, low, high):
+        low, high = _score_range(low, high)
+        members = self._get_data(key) or {}
+        removed = [member for member, score in members.items()
+                   if low(score) and high(score)]
+        for member in removed:
+            del members[member]
+        if not members:
+            self._delete(key)
+        return len(removed)
+
+    # Scripts
+
+    def _eval(self, script, numkeys, *keys_and_args):
+        if lupa is None:
+            raise NotImplementedError('The scripts require lupa')
+
+        lua = lupa.LuaRuntime(encoding=None)
+        keys = [_to_string(key) for key in keys_and_args[:numkeys]]
+        args = [_to_string(arg) for arg in keys_and_args[numkeys:]]
+
+        def call(command, *args):
+            return _to_lua(lua, self._call(command, args))
+
+        lua_globals = lua.globals()
+        lua_globals.KEYS = lua.table(*keys)
+        lua_globals.ARGV = lua.table(*args)
+        lua_globals.redis = lua.table()
+        lua_globals.redis.call = call
+        return _from_lua(lua.eval('function() ' + script + ' end')())
+
+    def _call(self, command, args):
+        command = command.lower()
+        args = [_to_string(arg) for arg in args]
+        if command == 'set':
+            options = [arg.upper() for arg in args[2:]]
+            kw = {'nx': 'NX' in options}
+            if 'PX' in options:
+                kw['px'] = int(args[2 + options.index('PX') + 1])
+            if 'EX' in options:
+                kw['ex'] = int(args[2 + options.index('EX') + 1])
+            return self._set(args[0], args[1], **kw) and 'OK'
+        if command in ('expire', 'pexpire', 'persist'):
+            return int(getattr(self, '_' + command)(*args[:1] + [float(a) for a in args[1:]]))
+        return getattr(self, '_' + command)(*args)
+
+
+class FakeScript(object):
+    """
+    A script registered by :meth:`FakeRedis.register_script`.
+    """
+    def __init__(self, redis, script):
+        self.redis = redis
+        self.script = script
+
+    def __call__(self, keys=(), args=(), client=None):
+        keys = list(keys)
+        return self.redis.eval(self.script, len(keys), *(keys + list(args)))
+
+
+def _score_range(low, high):
+    def bound(value, compare):
+        value = str(value)
+        if value.startswith('('):
+            limit = float(value[1:])
+            return lambda score: compare(score, limit)
+        limit = float(value)
+        return lambda score: compare(score, limit) or score == limit
+
+    return (bound(low, lambda score, limit: score > limit),
+            bound(high, lambda score, limit: score < limit))
+
+
+def _to_string(value):
+    if isinstance(value, float) and value == int(value):
+        return str(int(value))
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _to_lua(lua, value):
+    if value is None:
+        return False
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return lua.table(*[_to_lua(lua, item) for item in value])
+    if isinstance(value, float):
+        return _to_string(value)
+    return value
+
+
+def _from_lua(value):
+    if value is None or value is False:
+        return None
+    if value is True:
+        return 1
+    if isinstance(value, (int, long, float)):
+        return int(value)
+    if lupa.lua_type(value) == 'table':
+        items = []
+        index = 1
+        while value[index] is not None and value[index] is not False:
+            items.append(_from_lua(value[index]))
+            index += 1
+        return items
+    return value